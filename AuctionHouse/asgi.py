@@ -7,6 +7,7 @@ For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
+import asyncio
 import os
 from django.core.asgi import get_asgi_application
 
@@ -17,8 +18,32 @@ django_asgi_app = get_asgi_application()
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 import bids.routing
+from bids.consumers import drain_lot_loops
+from auction_list import chat, closer
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+
+async def lifespan(scope, receive, send):
+    """ASGI lifespan: run the lot closer; on exit stop it and the lot timers, flush chat"""
+    closer_task = None
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            if settings.LOT_CLOSER_IN_PROCESS:
+                closer_task = asyncio.create_task(closer.run())
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if closer_task is not None:
+                closer_task.cancel()
+            await drain_lot_loops()
+            await sync_to_async(chat.writer.flush, thread_sensitive=False)()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
 
 application = ProtocolTypeRouter({
+    "lifespan": lifespan,
     "http": django_asgi_app,
     "websocket": AuthMiddlewareStack(
         URLRouter(
@@ -0,0 +1,71 @@
+"""
+Read replica routing.
+
+When ``settings.DATABASES`` has a "replica" alias (``REPLICA_DATABASE_URL``),
+views wrapped in ``read_only`` read auction data from it. Everything else,
+and every write, uses "default":
+
+    @read_only
+    def auctions_list(request): ...
+
+Auth and session tables always come from "default" so a user who has just
+logged in is never missing on a lagging replica, and reads inside a
+transaction on "default" stay there to see that transaction's own writes.
+"""
+import contextvars
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.db import connections
+
+REPLICA = "replica"
+REPLICA_APPS = {"auction_list", "bids", "Home"}
+
+_read_only = contextvars.ContextVar("read_only", default=False)
+
+
+def replica_configured():
+    return REPLICA in connections.settings
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if (
+            _read_only.get()
+            and model._meta.app_label in REPLICA_APPS
+            and replica_configured()
+            and not connections["default"].in_atomic_block
+        ):
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Same data on both aliases
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA
+
+
+def read_only(view):
+    """Let ``view`` read from the replica (sync or async views)"""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(*args, **kwargs):
+            token = _read_only.set(True)
+            try:
+                return await view(*args, **kwargs)
+            finally:
+                _read_only.reset(token)
+    else:
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            token = _read_only.set(True)
+            try:
+                return view(*args, **kwargs)
+            finally:
+                _read_only.reset(token)
+    return wrapper
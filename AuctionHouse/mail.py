@@ -0,0 +1,247 @@
+"""
+Pooled SMTP dispatcher for outbound notifications.
+
+Opening a fresh SMTP + TLS session per email dominates notification latency
+when an auction closes many lots at once. The dispatcher keeps a small pool of
+authenticated connections open, sends messages in batches through
+``send_messages`` and throttles each SMTP provider with a token bucket.
+
+To test against a local debugging server instead of Gmail:
+
+    python -m aiosmtpd -n -l localhost:1025
+    EMAIL_HOST=localhost EMAIL_PORT=1025 EMAIL_USE_TLS=0 \
+        EMAIL_HOST_USER= EMAIL_HOST_PASSWORD= python manage.py runserver
+"""
+import atexit
+import logging
+import queue
+import smtplib
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.mail import EmailMultiAlternatives, get_connection
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Token bucket allowing ``rate`` messages per second, bursting up to ``burst``"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, n=1):
+        """Block until ``n`` tokens are available, then consume them"""
+        n = min(n, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                wait = (n - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class MailDispatcher:
+    """Thread-safe pool of open mail connections with batched, rate-limited sending"""
+
+    def __init__(self, pool_size=None, batch_size=None, rate_limits=None):
+        self.pool_size = pool_size or getattr(settings, "EMAIL_POOL_SIZE", 3)
+        self.batch_size = batch_size or getattr(settings, "EMAIL_BATCH_SIZE", 50)
+        self.idle_check = getattr(settings, "EMAIL_POOL_IDLE_CHECK", 30)
+        self.checkout_timeout = getattr(settings, "EMAIL_POOL_TIMEOUT", 30)
+        self.rate_limits = rate_limits if rate_limits is not None else getattr(settings, "EMAIL_RATE_LIMITS", {})
+        self._pool = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._limiters = {}
+
+    # ---------- RATE LIMITING ----------
+    def _limiter(self):
+        host = getattr(settings, "EMAIL_HOST", "")
+        rate = self.rate_limits.get(host)
+        if not rate:
+            return None
+        with self._lock:
+            if host not in self._limiters:
+                self._limiters[host] = RateLimiter(rate)
+            return self._limiters[host]
+
+    # ---------- CONNECTION POOL ----------
+    def _checkout(self):
+        """Take a connection from the pool, opening a new one while under pool_size"""
+        try:
+            conn, last_used = self._pool.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.pool_size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    self._check_credentials()
+                    conn = get_connection(fail_silently=False)
+                    conn.open()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+                return conn
+            try:
+                conn, last_used = self._pool.get(timeout=self.checkout_timeout)
+            except queue.Empty:
+                raise TimeoutError(f"No mail connection free after {self.checkout_timeout}s") from None
+
+        if time.monotonic() - last_used > self.idle_check and not self._is_alive(conn):
+            self._reopen(conn)
+        return conn
+
+    @staticmethod
+    def _check_credentials():
+        """Fail before connecting when SMTP over TLS/SSL has no login configured"""
+        if settings.EMAIL_BACKEND != "django.core.mail.backends.smtp.EmailBackend":
+            return
+        secure = getattr(settings, "EMAIL_USE_TLS", False) or getattr(settings, "EMAIL_USE_SSL", False)
+        if secure and not (settings.EMAIL_HOST_USER and settings.EMAIL_HOST_PASSWORD):
+            raise ImproperlyConfigured("Set EMAIL_HOST_USER and EMAIL_HOST_PASSWORD to send mail")
+
+    def _reopen(self, conn):
+        """Reconnect a dropped connection, giving up its pool slot if that fails"""
+        self._close(conn)
+        try:
+            conn.open()
+        except Exception:
+            self._discard(conn)
+            raise
+
+    def _checkin(self, conn):
+        self._pool.put((conn, time.monotonic()))
+
+    def _discard(self, conn):
+        self._close(conn)
+        with self._lock:
+            self._created -= 1
+
+    @staticmethod
+    def _is_alive(conn):
+        if not hasattr(conn, "connection"):
+            # Non-SMTP backends (console, locmem) have nothing to keep alive
+            return True
+        if conn.connection is None:
+            return False
+        try:
+            return conn.connection.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """Close every pooled connection"""
+        while True:
+            try:
+                conn, _ = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    # ---------- SENDING ----------
+    def send_messages(self, messages, fail_silently=False):
+        """Send EmailMessage objects in batches over pooled connections.
+
+        Returns the number of messages sent.
+        """
+        messages = list(messages)
+        limiter = self._limiter()
+        batch_size = self.batch_size
+        if limiter:
+            batch_size = max(1, min(batch_size, int(limiter.capacity)))
+
+        sent = 0
+        for start in range(0, len(messages), batch_size):
+            batch = messages[start:start + batch_size]
+            if limiter:
+                limiter.acquire(len(batch))
+            try:
+                sent += self._send_batch(batch)
+            except Exception as e:
+                logger.error("Failed to send %d email(s): %s", len(batch), e)
+                if not fail_silently:
+                    raise
+        return sent
+
+    def _send_batch(self, batch):
+        """Send ``batch`` over one pooled connection.
+
+        Messages go one at a time, so after a dropped connection only the
+        ones not yet accepted are retried (once, on a fresh session).
+        """
+        conn = self._checkout()
+        sent = 0
+        retried = False
+        position = 0
+        while position < len(batch):
+            try:
+                sent += conn.send_messages([batch[position]]) or 0
+            except (smtplib.SMTPServerDisconnected, OSError):
+                if retried:
+                    self._discard(conn)
+                    raise
+                retried = True
+                self._reopen(conn)
+                continue
+            except Exception:
+                self._discard(conn)
+                raise
+            position += 1
+        self._checkin(conn)
+        return sent
+
+    def send_mail(self, subject, message, recipient_list, from_email=None, html_message=None, fail_silently=False):
+        """Drop-in replacement for django.core.mail.send_mail using the pool"""
+        email = EmailMultiAlternatives(
+            subject=subject,
+            body=message,
+            from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+            to=recipient_list,
+        )
+        if html_message:
+            email.attach_alternative(html_message, "text/html")
+        return self.send_messages([email], fail_silently=fail_silently)
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    """Return the process-wide MailDispatcher"""
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = MailDispatcher()
+                atexit.register(_dispatcher.close)
+    return _dispatcher
+
+
+def send_mail(*args, **kwargs):
+    return get_dispatcher().send_mail(*args, **kwargs)
+
+
+def send_messages(messages, fail_silently=False):
+    return get_dispatcher().send_messages(messages, fail_silently=fail_silently)
@@ -0,0 +1,364 @@
+"""
+Per-view and per-consumer-handler instrumentation.
+
+For every HTTP request (``MetricsMiddleware``) and every websocket message a
+consumer handles (``InstrumentedConsumerMixin``) we record the number of SQL
+queries, time spent in the database, time spent serializing (template
+rendering and JSON encoding) and the size of what was sent back. Totals are
+kept in-process and exported in the Prometheus text format on ``/metrics/``.
+
+Views may declare a query budget in ``settings.QUERY_BUDGETS`` (URL name ->
+max queries). Going over it is counted and logged; with
+``QUERY_BUDGET_STRICT = True`` (see ``AuctionHouse.testing``) it raises
+``QueryBudgetExceeded`` so the test that made the request fails.
+"""
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django import http
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates, Template
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_current = contextvars.ContextVar("metrics_record", default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class Record:
+    """What one request or consumer message cost"""
+
+    __slots__ = ("queries", "db_time", "serialize_time", "size", "closed")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.size = 0
+        self.closed = False
+
+
+# ---------- REGISTRY ----------
+class Registry:
+    """Thread-safe running totals per (kind, name)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, kind, name, record, duration, over_budget=False):
+        with self._lock:
+            series = self._series.get((kind, name))
+            if series is None:
+                series = self._series[(kind, name)] = {
+                    "count": 0, "seconds": 0.0, "queries": 0, "db_seconds": 0.0,
+                    "serialize_seconds": 0.0, "bytes": 0, "over_budget": 0,
+                    "buckets": [0] * len(LATENCY_BUCKETS),
+                }
+            series["count"] += 1
+            series["seconds"] += duration
+            series["queries"] += record.queries
+            series["db_seconds"] += record.db_time
+            series["serialize_seconds"] += record.serialize_time
+            series["bytes"] += record.size
+            series["over_budget"] += int(over_budget)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if duration <= bound:
+                    series["buckets"][i] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {key: {**s, "buckets": list(s["buckets"])} for key, s in self._series.items()}
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        """Prometheus text exposition format"""
+        snapshot = sorted(self.snapshot().items())
+        lines = []
+
+        def family(metric, kind, help_text, field):
+            lines.append(f"# HELP auctionhouse_{metric} {help_text}")
+            lines.append(f"# TYPE auctionhouse_{metric} {kind}")
+            for (k, name), s in snapshot:
+                lines.append(f'auctionhouse_{metric}{{kind="{k}",name="{_escape(name)}"}} {s[field]}')
+
+        lines.append("# HELP auctionhouse_handler_seconds Time spent handling a request or consumer message.")
+        lines.append("# TYPE auctionhouse_handler_seconds histogram")
+        for (k, name), s in snapshot:
+            labels = f'kind="{k}",name="{_escape(name)}"'
+            for bound, count in zip(LATENCY_BUCKETS, s["buckets"]):
+                lines.append(f'auctionhouse_handler_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'auctionhouse_handler_seconds_bucket{{{labels},le="+Inf"}} {s["count"]}')
+            lines.append(f"auctionhouse_handler_seconds_sum{{{labels}}} {s['seconds']}")
+            lines.append(f"auctionhouse_handler_seconds_count{{{labels}}} {s['count']}")
+
+        family("db_queries_total", "counter", "SQL queries executed.", "queries")
+        family("db_seconds_total", "counter", "Time spent waiting on the database.", "db_seconds")
+        family("serialize_seconds_total", "counter", "Time spent rendering templates and encoding JSON.", "serialize_seconds")
+        family("response_bytes_total", "counter", "Bytes sent in responses and websocket frames.", "bytes")
+        family("query_budget_exceeded_total", "counter", "Requests that ran more queries than their budget.", "over_budget")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = Registry()
+
+
+class Counters:
+    """Thread-safe labelled counters for events that are not requests"""
+
+    HELP = {
+        "websocket_frames_dropped_total": "Websocket frames not sent: replaced by a newer one (coalesced) or dropped from a full queue (full).",
+        "websocket_slow_disconnects_total": "Websocket connections closed for falling too far behind.",
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, metric, amount=1, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, metric, **labels):
+        with self._lock:
+            return self._values.get((metric, tuple(sorted(labels.items()))), 0)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        with self._lock:
+            samples = sorted(self._values.items())
+        lines = []
+        for metric in sorted({metric for (metric, _), _ in samples}):
+            lines.append(f"# HELP auctionhouse_{metric} {self.HELP.get(metric, metric)}")
+            lines.append(f"# TYPE auctionhouse_{metric} counter")
+            for (name, labels), value in samples:
+                if name == metric:
+                    text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+                    lines.append(f"auctionhouse_{metric}{{{text}}} {value}")
+        return "".join(line + "\n" for line in lines)
+
+
+counters = Counters()
+
+
+# ---------- RECORDING ----------
+def _record_query(execute, sql, params, many, context):
+    record = _current.get()
+    if record is None or record.closed:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        record.queries += 1
+        record.db_time += time.perf_counter() - start
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _install_on_open_connections():
+    # Connections opened before this module was imported (e.g. by the test
+    # runner) never saw connection_created
+    for connection in connections.all(initialized_only=True):
+        install_query_recorder(None, connection)
+
+
+@contextmanager
+def track():
+    """Collect the cost of the enclosed block into a fresh Record.
+
+    The record travels in a context variable, so queries made from
+    ``sync_to_async`` threads are counted too. Tasks spawned inside the
+    block inherit it, hence ``closed``: they stop counting once it ends.
+    """
+    _install_on_open_connections()
+    record = Record()
+    token = _current.set(record)
+    try:
+        yield record
+    finally:
+        record.closed = True
+        _current.reset(token)
+
+
+@contextmanager
+def serializing():
+    record = _current.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if record is not None and not record.closed:
+            record.serialize_time += time.perf_counter() - start
+
+
+def dumps(payload):
+    """json.dumps, counted as serialization time"""
+    with serializing():
+        return json.dumps(payload, cls=DjangoJSONEncoder)
+
+
+class JsonResponse(http.JsonResponse):
+    def __init__(self, *args, **kwargs):
+        with serializing():
+            super().__init__(*args, **kwargs)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        with serializing():
+            return super().render(context, request)
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates whose top-level renders count as serialization time"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+# ---------- BUDGETS ----------
+def query_budget(name):
+    return getattr(settings, "QUERY_BUDGETS", {}).get(name)
+
+
+def over_budget(name, record):
+    budget = query_budget(name)
+    return budget is not None and record.queries > budget
+
+
+def report_over_budget(kind, name, record):
+    """Log a budget overrun, or fail in strict mode (tests)"""
+    message = f"{kind} {name} ran {record.queries} queries (budget {query_budget(name)})"
+    if getattr(settings, "QUERY_BUDGET_STRICT", False):
+        raise QueryBudgetExceeded(message)
+    print(f"[Metrics] {message}")
+
+
+def _view_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unresolved"
+    return match.view_name or match._func_path
+
+
+def _response_size(response):
+    if getattr(response, "streaming", False):
+        return 0
+    return len(response.content)
+
+
+class MetricsMiddleware:
+    """Record queries, DB/serialization time and size per view.
+
+    Goes right after WhiteNoise in MIDDLEWARE so everything but static
+    files is covered.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        with track() as record:
+            response = self.get_response(request)
+        return self.finish(request, response, record, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with track() as record:
+            response = await self.get_response(request)
+        return self.finish(request, response, record, time.perf_counter() - start)
+
+    def finish(self, request, response, record, duration):
+        name = _view_name(request)
+        record.size = _response_size(response)
+        over = over_budget(name, record)
+        registry.observe("view", name, record, duration, over)
+        if over:
+            report_over_budget("view", name, record)
+        response.metrics = record
+        if settings.DEBUG:
+            response["Server-Timing"] = (
+                f'db;dur={record.db_time * 1000:.1f};desc="{record.queries} queries", '
+                f"serialize;dur={record.serialize_time * 1000:.1f}, total;dur={duration * 1000:.1f}"
+            )
+        return response
+
+
+# ---------- CONSUMERS ----------
+class InstrumentedConsumerMixin:
+    """Record the same figures per websocket message type a consumer handles.
+
+    Handlers should send through ``send_payload`` (or encode with
+    ``encode_payload``) so JSON encoding and frame sizes are counted.
+    """
+
+    async def dispatch(self, message):
+        name = f"{type(self).__name__}.{message['type']}"
+        start = time.perf_counter()
+        with track() as record:
+            try:
+                await super().dispatch(message)
+            finally:
+                # Also on StopConsumer, which ends every disconnect
+                over = over_budget(name, record)
+                registry.observe("consumer", name, record, time.perf_counter() - start, over)
+        if over:
+            report_over_budget("consumer", name, record)
+
+    def encode_payload(self, payload):
+        text = dumps(payload)
+        record = _current.get()
+        if record is not None and not record.closed:
+            record.size += len(text)
+        return text
+
+    async def send_payload(self, payload):
+        await self.send(text_data=self.encode_payload(payload))
+
+
+# ---------- ENDPOINT ----------
+def metrics_view(request):
+    """Prometheus scrape endpoint, for local scrapers and staff only"""
+    allowed = getattr(settings, "METRICS_ALLOWED_IPS", ("127.0.0.1", "::1"))
+    if request.META.get("REMOTE_ADDR") not in allowed and not request.user.is_staff:
+        raise PermissionDenied
+    return http.HttpResponse(registry.render() + counters.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,89 @@
+"""
+Shared test helpers.
+
+``QueryBudgetMixin`` checks the query budgets declared in
+``settings.QUERY_BUDGETS``:
+
+    class HomeTests(QueryBudgetMixin, TestCase):
+        def test_home(self):
+            self.assertWithinQueryBudget(self.client.get(reverse("home")))
+
+While a ``QueryBudgetMixin`` test runs, any request or consumer message that
+goes over its budget raises ``QueryBudgetExceeded``, failing the test.
+
+``LotFixtureMixin`` sets up the user, category, auction and active lot most
+auction and bidding tests start from. ``MediaTestMixin`` gives each test an
+empty MEDIA_ROOT of its own.
+"""
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.test import override_settings
+
+from .metrics import query_budget
+
+
+class QueryBudgetMixin:
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        strict = override_settings(QUERY_BUDGET_STRICT=True)
+        strict.enable()
+        cls.addClassCleanup(strict.disable)
+
+    def assertWithinQueryBudget(self, response, name=None):
+        """Assert the view behind ``response`` has a budget and stayed within it"""
+        name = name or response.resolver_match.view_name
+        budget = query_budget(name)
+        self.assertIsNotNone(budget, f"No QUERY_BUDGETS entry for {name}")
+        self.assertLessEqual(
+            response.metrics.queries, budget,
+            f"{name} ran {response.metrics.queries} queries (budget {budget})",
+        )
+        return response.metrics
+
+
+class LotFixtureMixin:
+    """``user`` (``username``), ``category`` "Art", ``auction`` "Estate sale" and an active ``lot``"""
+
+    username = "bidder"
+
+    @classmethod
+    def setUpTestData(cls):
+        from auction_list.models import Auction, Catagory
+
+        super().setUpTestData()
+        cls.user = cls.make_user(cls.username)
+        cls.category = Catagory.objects.create(name="Art")
+        cls.auction = Auction.objects.create(title="Estate sale", description="", created_by=cls.user)
+        cls.lot = cls.make_lot()
+
+    @classmethod
+    def make_user(cls, username, balance=None):
+        """A user (its wallet comes from a signal), optionally with funds"""
+        from bids.models import Wallet
+
+        user = User.objects.create_user(username, f"{username}@example.com", "pass12345")
+        if balance is not None:
+            Wallet.objects.filter(user=user).update(balance=balance)
+        return User.objects.get(pk=user.pk)
+
+    @classmethod
+    def make_lot(cls, number=1, **fields):
+        from auction_list.models import Lot
+
+        fields = {"title": f"Lot {number}", "description": "", "status": "active", "lot_catagory": cls.category, **fields}
+        return Lot.objects.create(auction=cls.auction, lot_number=number, **fields)
+
+
+class MediaTestMixin:
+    """Point default_storage at a throwaway MEDIA_ROOT (with one small derivative size)"""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root, IMAGE_DERIVATIVE_SIZES={"thumb": 16})
+        override.enable()
+        self.addCleanup(override.disable)
@@ -0,0 +1,192 @@
+import io
+import os
+import runpy
+import smtplib
+from contextlib import redirect_stdout
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.mail import EmailMessage
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import connections
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+
+from auction_list.models import Lot
+from .db import ReplicaRouter, read_only
+from .mail import MailDispatcher
+from .metrics import QueryBudgetExceeded, registry
+from .testing import QueryBudgetMixin
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        registry.reset()
+
+    def test_requests_are_recorded_and_exported(self):
+        self.client.get(reverse("search_typeahead"), {"q": "vase"})
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('auctionhouse_handler_seconds_count{kind="view",name="search_typeahead"} 1', body)
+        self.assertIn('auctionhouse_db_queries_total{kind="view",name="search_typeahead"}', body)
+
+    def test_metrics_endpoint_is_local_only(self):
+        response = self.client.get(reverse("metrics"), REMOTE_ADDR="203.0.113.9")
+        self.assertEqual(response.status_code, 403)
+        staff = User.objects.create_user("ops", "ops@example.com", "pass12345", is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse("metrics"), REMOTE_ADDR="203.0.113.9")
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(QUERY_BUDGETS={"search_typeahead": 0})
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    def test_over_budget_fails_the_request(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse("search_typeahead"), {"q": "vase"})
+
+    def test_over_budget_is_counted_when_not_strict(self):
+        registry.reset()
+        with self.settings(QUERY_BUDGET_STRICT=False), redirect_stdout(io.StringIO()) as log:
+            self.client.get(reverse("search_typeahead"), {"q": "vase"})
+        self.assertEqual(registry.snapshot()[("view", "search_typeahead")]["over_budget"], 1)
+        self.assertIn("search_typeahead ran 1 queries (budget 0)", log.getvalue())
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    def read_db(self, model):
+        return self.router.db_for_read(model)
+
+    def test_reads_stay_on_default_without_a_replica(self):
+        self.assertIsNone(read_only(lambda: self.read_db(Lot))())
+
+    @mock.patch("AuctionHouse.db.replica_configured", return_value=True)
+    def test_read_only_views_read_auction_data_from_replica(self, _):
+        self.assertIsNone(self.read_db(Lot))
+        self.assertEqual(read_only(lambda: self.read_db(Lot))(), "replica")
+        # Sessions and users must never come from a lagging replica
+        self.assertIsNone(read_only(lambda: self.read_db(User))())
+        self.assertEqual(self.router.db_for_write(Lot), "default")
+
+    @mock.patch("AuctionHouse.db.replica_configured", return_value=True)
+    def test_reads_inside_a_transaction_stay_on_default(self, _):
+        with mock.patch.object(connections["default"], "in_atomic_block", True):
+            self.assertIsNone(read_only(lambda: self.read_db(Lot))())
+
+
+class DeploymentConfigTests(SimpleTestCase):
+    def gunicorn_config(self, **env):
+        environ = {k: v for k, v in os.environ.items() if k != "FORWARDED_ALLOW_IPS"}
+        with mock.patch.dict(os.environ, {**environ, **env}, clear=True):
+            return runpy.run_path(str(settings.BASE_DIR / "gunicorn.conf.py"))
+
+    def client_seen(self, forwarded_allow_ips, peer, forwarded_for):
+        """REMOTE_ADDR as the app sees it behind the worker's proxy-header handling"""
+        seen = {}
+
+        async def app(scope, receive, send):
+            seen["client"] = scope["client"][0]
+
+        scope = {"type": "http", "scheme": "http", "client": (peer, 50000),
+                 "headers": [(b"x-forwarded-for", forwarded_for.encode())]}
+        async_to_sync(ProxyHeadersMiddleware(app, trusted_hosts=forwarded_allow_ips))(scope, None, None)
+        return seen["client"]
+
+    def test_forwarded_for_is_trusted_only_from_the_proxy(self):
+        allowed = self.gunicorn_config()["forwarded_allow_ips"]
+        # A client can't pose as localhost to reach /metrics/
+        self.assertEqual(self.client_seen(allowed, "203.0.113.9", "127.0.0.1"), "203.0.113.9")
+        self.assertEqual(self.client_seen(allowed, "127.0.0.1", "198.51.100.7"), "198.51.100.7")
+        self.assertEqual(self.gunicorn_config(FORWARDED_ALLOW_IPS="10.0.0.2")["forwarded_allow_ips"], "10.0.0.2")
+
+
+class FlakySMTPBackend(BaseEmailBackend):
+    """Stands in for an SMTP session that the server can drop mid-batch"""
+    outbox = []
+    drop_after = None  # messages accepted before the server hangs up
+    refuse_open = False
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.connection = None
+
+    def open(self):
+        if self.refuse_open:
+            raise ConnectionRefusedError("server is down")
+        self.connection = mock.Mock(**{"noop.return_value": (250, b"OK")})
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.noop.side_effect = smtplib.SMTPServerDisconnected()
+        self.connection = None
+
+    def send_messages(self, messages):
+        for message in messages:
+            if self.connection is None or len(self.outbox) == FlakySMTPBackend.drop_after:
+                FlakySMTPBackend.drop_after = None
+                self.close()
+                raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+            self.outbox.append(message)
+        return len(messages)
+
+
+@override_settings(EMAIL_BACKEND="AuctionHouse.tests.FlakySMTPBackend", EMAIL_RATE_LIMITS={})
+class MailDispatcherTests(SimpleTestCase):
+    def setUp(self):
+        FlakySMTPBackend.outbox = []
+        FlakySMTPBackend.drop_after = None
+        FlakySMTPBackend.refuse_open = False
+
+    def messages(self, n):
+        return [EmailMessage(f"Lot {i}", "", to=[f"bidder{i}@example.com"]) for i in range(n)]
+
+    def test_dropped_connection_resends_only_unsent_messages(self):
+        dispatcher = MailDispatcher(pool_size=1, batch_size=5)
+        FlakySMTPBackend.drop_after = 2
+        self.assertEqual(dispatcher.send_messages(self.messages(5)), 5)
+        self.assertEqual([m.subject for m in FlakySMTPBackend.outbox], [f"Lot {i}" for i in range(5)])
+
+    def test_failed_reconnect_frees_its_pool_slot(self):
+        dispatcher = MailDispatcher(pool_size=1)
+        dispatcher.idle_check = 0
+        dispatcher.checkout_timeout = 1
+        dispatcher.send_messages(self.messages(1))
+        # The pooled session went stale and the server refuses to reconnect
+        conn, _ = dispatcher._pool.get_nowait()
+        conn.close()
+        dispatcher._checkin(conn)
+        FlakySMTPBackend.refuse_open = True
+        with self.assertRaises(ConnectionRefusedError), self.assertLogs("AuctionHouse.mail", "ERROR"):
+            dispatcher.send_messages(self.messages(1))
+        self.assertEqual(dispatcher._created, 0)
+        # Once the server is back a new connection is opened instead of waiting forever
+        FlakySMTPBackend.refuse_open = False
+        self.assertEqual(dispatcher.send_messages(self.messages(1)), 1)
+
+    def test_checkout_gives_up_when_every_connection_is_busy(self):
+        dispatcher = MailDispatcher(pool_size=1)
+        dispatcher.checkout_timeout = 0.05
+        dispatcher._checkout()
+        with self.assertRaises(TimeoutError), self.assertLogs("AuctionHouse.mail", "ERROR"):
+            dispatcher.send_messages(self.messages(1))
+
+    @override_settings(
+        EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+        EMAIL_USE_TLS=True, EMAIL_HOST_USER="", EMAIL_HOST_PASSWORD="",
+    )
+    def test_missing_credentials_fail_before_connecting(self):
+        dispatcher = MailDispatcher(pool_size=1)
+        with mock.patch("AuctionHouse.mail.get_connection") as connect, self.assertRaises(ImproperlyConfigured), \
+                self.assertLogs("AuctionHouse.mail", "ERROR"):
+            dispatcher.send_messages(self.messages(1))
+        connect.assert_not_called()
+        self.assertEqual(dispatcher._created, 0)
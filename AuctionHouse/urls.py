@@ -1,7 +1,7 @@
 
 from django.contrib import admin
 from django.urls import path, include
-from AuctionHouse import views
+from AuctionHouse import metrics, views
 from django.conf import settings
 from django.conf.urls.static import static
 
@@ -14,6 +14,7 @@ urlpatterns = [
     path("home/", include("Home.urls")),
     path("auctions/", include("auction_list.urls")),
     path("bids/", include("bids.urls")),
+    path("metrics/", metrics.metrics_view, name="metrics"),
     ]
 
 
@@ -3,11 +3,10 @@ from django.contrib.auth.models import User
 from django.contrib import messages
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.hashers import make_password
-from Home.models import Profile
-from PIL import Image
+from Home.images import attach_avatar
 from random import randint
 
-from django.core.mail import send_mail
+from AuctionHouse.mail import send_mail
 from django.utils import timezone
 from datetime import timedelta
 from django.contrib.auth import get_user_model
@@ -134,21 +133,13 @@ def register_view(request):
                 password=make_password(password),
             )
 
-            if profile_image:
-                profile, created = Profile.objects.get_or_create(user=user)
-                profile.profile_image = profile_image
-                profile.save()
-
-                img_path = profile.profile_image.path
-                img = Image.open(img_path)
-
-                max_size = (500, 500)
-                if img.height > max_size[1] or img.width > max_size[0]:
-                    img.thumbnail(max_size, Image.Resampling.LANCZOS)
-                    img.save(img_path, quality=90, optimize=True)
-
             login(request, user)
 
+            if profile_image:
+                # Resized and stripped in the background; after login(), whose
+                # user save re-saves the cached profile
+                attach_avatar(user.profile, profile_image)
+
             messages.success(
                 request,
                 f"Welcome to Auction House, {first_name}! Your account has been created successfully. 🎉",
@@ -188,9 +179,7 @@ def otp_form(request):
                 send_mail(
                     "Your OTP Code - Auction House",
                     f"Your OTP code is {otp}. This code will expire in 2 minutes.",
-                    "meetvaghasiya166@gmail.com",
                     [email],
-                    fail_silently=False,
                 )
                 messages.success(request, f"Verification code sent to {email}")
             except Exception as e:
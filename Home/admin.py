@@ -1,7 +1,7 @@
 from django.contrib import admin
 
 # Register your models here.
-from .models import Profile
+from .models import Profile, StoredImage
 
 
 @admin.register(Profile)
@@ -10,3 +10,10 @@ class ProfileAdmin(admin.ModelAdmin):
     search_fields = ["user__username", "user__email"]
     list_filter = ["created_at"]
     readonly_fields = ["created_at", "updated_at"]
+
+
+@admin.register(StoredImage)
+class StoredImageAdmin(admin.ModelAdmin):
+    list_display = ["path", "ref_count", "width", "height", "size", "created_at"]
+    search_fields = ["path", "sha256"]
+    readonly_fields = ["path", "sha256", "phash", "width", "height", "size", "ref_count", "created_at"]
@@ -0,0 +1,44 @@
+"""
+Fragment cache for the homepage blocks.
+
+Each block of ``home_view`` is cached separately with its own short TTL and is
+dropped by the signals in ``Home.signals`` when bids, lot status changes or
+user signups make it stale.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+# Seconds each homepage block may be served from cache
+DEFAULT_TIMEOUTS = {
+    "active_auctions": 30,
+    "ending_soon": 15,
+    "recently_sold": 60,
+    "featured_lots": 30,
+    "stats": 60,
+    "categories": 300,
+}
+
+# Blocks affected by each kind of event
+BID_BLOCKS = ("active_auctions", "ending_soon", "featured_lots")
+LOT_STATUS_BLOCKS = ("active_auctions", "ending_soon", "recently_sold", "featured_lots", "stats")
+SIGNUP_BLOCKS = ("stats",)
+CATEGORY_BLOCKS = ("categories",)
+
+
+def _key(name):
+    return f"home:{name}"
+
+
+def get_block(name, builder):
+    """Return the cached value of block ``name``, building it on a miss"""
+    value = cache.get(_key(name))
+    if value is None:
+        value = builder()
+        timeouts = getattr(settings, "HOME_CACHE_TIMEOUTS", DEFAULT_TIMEOUTS)
+        cache.set(_key(name), value, timeouts.get(name, DEFAULT_TIMEOUTS[name]))
+    return value
+
+
+def invalidate(*names):
+    """Drop the given homepage blocks"""
+    cache.delete_many([_key(name) for name in names])
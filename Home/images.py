@@ -0,0 +1,400 @@
+"""
+Derivative pipeline for item photos.
+
+Originals uploaded through ``add_item_view`` are kept untouched in
+``item_images/``. For each one a worker pool renders fixed-size ``thumb``,
+``medium`` and ``full`` copies in both WebP and JPEG under
+``item_images/derived/`` (see ``derivative_name``) and records their paths in
+``Item.image_derivatives`` keyed by the original path. Items are processed one
+at a time by a single job thread that fans their images out to the pool. Templates read them through ``Item.image_set`` /
+``Item.cover`` and fall back to the original until the derivatives exist.
+
+Backfill existing uploads with ``python manage.py build_image_derivatives``.
+
+Uploads go through ``store_upload``, which stores one blob per distinct file
+(``StoredImage``): a byte-identical upload reuses the existing file and bumps
+its reference count. Uploads are never swapped for a merely similar image,
+which may belong to someone else. ``acquire`` and ``release`` take and drop
+references; the blob is deleted when none remain. Each ``Item.images`` entry
+holds one reference, kept in step by ``Home.signals``. Existing media is
+deduplicated with ``python manage.py dedupe_media``, which likewise merges
+byte-identical files only unless asked to (``--merge-similar``).
+
+Avatars are stored as uploaded and then downscaled and stripped of metadata
+by ``process_avatar`` on the same worker pool, off the request.
+"""
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F
+from django.utils.text import get_valid_filename
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Longest edge in pixels for each derivative; images are never upscaled
+DEFAULT_SIZES = {
+    "thumb": 320,
+    "medium": 800,
+    "full": 1600,
+}
+
+FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", {"quality": 85, "optimize": True, "progressive": True}),
+}
+
+DERIVED_DIR = "item_images/derived"
+
+# Shared fallback avatar; never reference counted or deleted
+DEFAULT_PROFILE_IMAGE = "profile_images/default.png"
+
+_executor = None
+_jobs = None
+_executor_lock = threading.Lock()
+
+
+def derivative_sizes():
+    return getattr(settings, "IMAGE_DERIVATIVE_SIZES", DEFAULT_SIZES)
+
+
+def get_executor():
+    """Return the process-wide image worker pool"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, "IMAGE_WORKERS", 2),
+                    thread_name_prefix="image-derivatives",
+                )
+    return _executor
+
+
+def get_job_executor():
+    """Return the single thread that runs queued item jobs in order"""
+    global _jobs
+    if _jobs is None:
+        with _executor_lock:
+            if _jobs is None:
+                _jobs = ThreadPoolExecutor(max_workers=1, thread_name_prefix="image-jobs")
+    return _jobs
+
+
+def _run_job(task, *args):
+    try:
+        task(*args)
+    except Exception as e:
+        print(f"Image job {task.__name__}{args} failed: {e}")
+    finally:
+        connections.close_all()
+
+
+def derivative_name(path, size, fmt):
+    """Storage path of the ``size``/``fmt`` derivative of the original at ``path``.
+
+    Includes a hash of the whole path, so originals sharing a file name (in
+    another folder or with another extension) never share derivatives.
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    key = hashlib.sha256(path.encode()).hexdigest()[:12]
+    return f"{DERIVED_DIR}/{stem}_{key}_{size}.{fmt}"
+
+
+# ---------- RENDERING ----------
+def _open(path):
+    with default_storage.open(path, "rb") as f:
+        image = Image.open(f)
+        image.load()
+    # Phone photos carry their rotation in EXIF; bake it into the pixels
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "L"):
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        rgba = image.convert("RGBA")
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        image = background
+    return image.convert("RGB")
+
+
+def generate_derivatives(path):
+    """Render every size/format of the image at storage ``path``.
+
+    Returns ``{size: {format: storage_path}}``.
+    """
+    source = _open(path)
+    derivatives = {}
+
+    for size, edge in derivative_sizes().items():
+        image = source.copy()
+        image.thumbnail((edge, edge), Image.LANCZOS)
+        derivatives[size] = {}
+        for fmt, (pil_format, options) in FORMATS.items():
+            buffer = BytesIO()
+            image.save(buffer, pil_format, **options)
+            name = derivative_name(path, size, fmt)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            derivatives[size][fmt] = default_storage.save(name, ContentFile(buffer.getvalue()))
+    return derivatives
+
+
+# ---------- ITEMS ----------
+def process_item_images(item_id):
+    """Render missing derivatives for an item's images on the worker pool and
+    record them on the item."""
+    from auction_list.models import Item
+
+    try:
+        item = Item.objects.get(pk=item_id)
+    except Item.DoesNotExist:
+        return
+
+    derivatives = dict(item.image_derivatives or {})
+    pending = [path for path in item.images if path not in derivatives]
+    if not pending:
+        return
+
+    futures = {path: get_executor().submit(generate_derivatives, path) for path in pending}
+    for path, future in futures.items():
+        try:
+            derivatives[path] = future.result()
+        except Exception as e:
+            print(f"Failed to build derivatives for {path}: {e}")
+
+    # Drop entries for images that were removed in the meantime
+    item.refresh_from_db(fields=["images"])
+    item.image_derivatives = {path: d for path, d in derivatives.items() if path in item.images}
+    item.save(update_fields=["image_derivatives"])
+    print(f"Built image derivatives for Item #{item_id} ({len(pending)} image(s))")
+
+
+def enqueue_item_images(item_id):
+    """Build an item's derivatives in the background"""
+    get_job_executor().submit(_run_job, process_item_images, item_id)
+
+
+def process_items_images(item_ids):
+    """Batch form of process_item_images for bulk-created items: each distinct
+    image is rendered once, however many items share it, and the results are
+    written with one bulk_update."""
+    from auction_list import search
+    from auction_list.models import Item
+
+    items = list(Item.objects.filter(pk__in=item_ids).exclude(images=[]))
+    pending = sorted({
+        path for item in items for path in item.images if path not in (item.image_derivatives or {})
+    })
+    if not pending:
+        return
+
+    built = {}
+    for path, future in [(path, get_executor().submit(generate_derivatives, path)) for path in pending]:
+        try:
+            built[path] = future.result()
+        except Exception as e:
+            print(f"Failed to build derivatives for {path}: {e}")
+
+    for item in items:
+        derivatives = dict(item.image_derivatives or {})
+        derivatives.update({path: built[path] for path in item.images if path in built})
+        item.image_derivatives = derivatives
+    Item.objects.bulk_update(items, ["image_derivatives"], batch_size=500)
+    # bulk_update sends no post_save; refresh the search thumbnails directly
+    search.index_many(items)
+    print(f"Built image derivatives for {len(items)} item(s) ({len(built)} image(s))")
+
+
+def enqueue_items_images(item_ids):
+    """Build derivatives for many items in one background job"""
+    get_job_executor().submit(_run_job, process_items_images, list(item_ids))
+
+
+# ---------- DEDUPLICATION ----------
+CHUNK_SIZE = 64 * 1024
+
+
+def content_hash(fileobj):
+    """sha256 of a file object, read in chunks"""
+    digest = hashlib.sha256()
+    fileobj.seek(0)
+    for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+def perceptual_hash(image):
+    """64-bit difference hash: compares each pixel of a 9x8 greyscale thumbnail
+    with its right-hand neighbour, so re-encoded or resized copies of a photo
+    hash (nearly) the same."""
+    small = ImageOps.exif_transpose(image).convert("L").resize((9, 8), Image.LANCZOS)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f"{bits:016x}"
+
+
+def hamming(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def describe(fileobj):
+    """Return (sha256, phash, width, height) for an image file object; phash
+    is "" for files Pillow cannot read."""
+    sha = content_hash(fileobj)
+    try:
+        image = Image.open(fileobj)
+        width, height = image.size
+        # The hash only needs 9x8 pixels; let the JPEG decoder skip the rest
+        image.draft("L", (64, 64))
+        phash = perceptual_hash(image)
+    except (UnidentifiedImageError, OSError):
+        return sha, "", 0, 0
+    finally:
+        fileobj.seek(0)
+    return sha, phash, width, height
+
+
+def _acquire(stored):
+    from .models import StoredImage
+
+    StoredImage.objects.filter(pk=stored.pk).update(ref_count=F("ref_count") + 1)
+    return stored.path
+
+
+def acquire(path):
+    """Take one more reference to the stored image at ``path``"""
+    from .models import StoredImage
+
+    StoredImage.objects.filter(path=path).update(ref_count=F("ref_count") + 1)
+
+
+def store_upload(upload, name, description=None):
+    """Store an uploaded file at ``name`` unless the same bytes are already
+    stored; return the storage path now referencing it.
+
+    The reference taken belongs to the caller: release it if the path ends
+    up unused, or once an item holding the path has taken its own.
+    ``description`` is ``describe(upload)`` when the caller already has it.
+    """
+    from .models import StoredImage
+
+    sha, phash, width, height = description or describe(upload)
+
+    existing = StoredImage.objects.filter(sha256=sha).first()
+    if existing and default_storage.exists(existing.path):
+        return _acquire(existing)
+    if existing:
+        # The blob was removed from disk behind our back; store it afresh
+        existing.delete()
+
+    path = default_storage.save(name, upload)
+    try:
+        with transaction.atomic():
+            StoredImage.objects.create(
+                path=path, sha256=sha, phash=phash, width=width, height=height,
+                size=upload.size, ref_count=1,
+            )
+    except IntegrityError:
+        # A concurrent upload of the same bytes won the race
+        default_storage.delete(path)
+        return _acquire(StoredImage.objects.get(sha256=sha))
+    return path
+
+
+def release(path):
+    """Drop one reference to ``path``, deleting the blob and its derivatives
+    when it was the last."""
+    from .models import StoredImage
+
+    if not path or path == DEFAULT_PROFILE_IMAGE:
+        return
+    with transaction.atomic():
+        StoredImage.objects.filter(path=path, ref_count__gt=0).update(ref_count=F("ref_count") - 1)
+        orphan = StoredImage.objects.filter(path=path, ref_count=0).select_for_update().first()
+        if orphan is None:
+            return
+        orphan.delete()
+
+    names = [path] + [derivative_name(path, size, fmt) for size in derivative_sizes() for fmt in FORMATS]
+    for name in names:
+        if default_storage.exists(name):
+            default_storage.delete(name)
+
+
+# ---------- AVATARS ----------
+def render_avatar(fileobj, max_size=None):
+    """Downscale an avatar and re-encode it without metadata.
+
+    ``draft()`` lets the JPEG decoder work at 1/2, 1/4 or 1/8 scale, so a
+    phone photo is never decoded at full resolution. Returns (bytes, ext).
+    """
+    edge = max_size or getattr(settings, "AVATAR_MAX_SIZE", 500)
+    image = Image.open(fileobj)
+    image.draft("RGB", (edge, edge))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((edge, edge), Image.LANCZOS)
+
+    buffer = BytesIO()
+    has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+    if has_alpha:
+        image.convert("RGBA").save(buffer, "PNG", optimize=True)
+        return buffer.getvalue(), "png"
+    # Saved without exif=/icc_profile=, which drops GPS and camera metadata
+    image.convert("RGB").save(buffer, "JPEG", quality=88, optimize=True, progressive=True)
+    return buffer.getvalue(), "jpg"
+
+
+def process_avatar(profile_id, path):
+    """Replace a profile's raw uploaded avatar at ``path`` with the processed one"""
+    from .models import Profile
+
+    try:
+        with default_storage.open(path, "rb") as f:
+            data, ext = render_avatar(f)
+    except Exception as e:
+        print(f"Failed to process avatar {path} for Profile #{profile_id}: {e}")
+        return
+
+    stem = os.path.splitext(os.path.basename(path))[0]
+    processed = store_upload(ContentFile(data), f"profile_images/{stem}.{ext}")
+    if processed == path:
+        release(processed)
+        return
+
+    # Only swap if the user has not uploaded another avatar in the meantime
+    if Profile.objects.filter(pk=profile_id, profile_image=path).update(profile_image=processed):
+        release(path)
+        print(f"Processed avatar for Profile #{profile_id}")
+    else:
+        release(processed)
+
+
+def enqueue_avatar(profile_id, path):
+    """Process an uploaded avatar on the image worker pool"""
+    get_executor().submit(process_avatar, profile_id, path)
+
+
+def attach_avatar(profile, upload):
+    """Store ``upload`` as the profile's avatar and queue its processing.
+
+    Call this after any full ``profile.save()`` in the request, so a stale
+    instance cannot write the raw path back over the processed one.
+    """
+    previous = profile.profile_image.name
+    path = store_upload(upload, f"profile_images/{get_valid_filename(upload.name)}")
+    profile.profile_image.name = path
+    profile.save(update_fields=["profile_image", "updated_at"])
+
+    transaction.on_commit(lambda: enqueue_avatar(profile.pk, path))
+    if previous and previous != path:
+        transaction.on_commit(lambda: release(previous))
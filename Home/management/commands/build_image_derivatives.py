@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from auction_list.models import Item
+from Home.images import process_item_images
+
+
+class Command(BaseCommand):
+    help = "Build thumbnail/medium/full WebP and JPEG copies for item images that lack them"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rebuild", action="store_true", help="Regenerate derivatives that already exist")
+
+    def handle(self, *args, **options):
+        items = Item.objects.exclude(images=[])
+        if options["rebuild"]:
+            items.update(image_derivatives={})
+
+        total = 0
+        for item_id in items.values_list("id", flat=True).iterator():
+            process_item_images(item_id)
+            total += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Processed images for {total} item(s)"))
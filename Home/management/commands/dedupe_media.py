@@ -0,0 +1,209 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from auction_list.models import Item
+from Home.images import DEFAULT_PROFILE_IMAGE, DERIVED_DIR, describe, hamming
+from Home.models import Profile, StoredImage
+
+UPLOAD_FOLDERS = ("item_images", "profile_images")
+
+
+class Command(BaseCommand):
+    help = (
+        "Collapse byte-identical item/profile images in MEDIA_ROOT onto one file each, "
+        "repoint references and rebuild StoredImage reference counts. Perceptually "
+        "similar images are only reported unless --merge-similar is given"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Report what would change without touching anything")
+        parser.add_argument(
+            "--stray-root", action="append", default=[], metavar="DIR",
+            help="Extra directory (e.g. a stale media root) whose copies of images already in MEDIA_ROOT are deleted",
+        )
+        parser.add_argument(
+            "--merge-similar", action="store_true",
+            help="Also merge images within IMAGE_DEDUP_MAX_DISTANCE bits of each other that belong to the same user",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        blobs = self.scan(settings.MEDIA_ROOT)
+        self.stdout.write(f"Scanned {len(blobs)} file(s) in {settings.MEDIA_ROOT}")
+
+        references = self.references()
+        canonical, similar = self.group(blobs, references, self.owners(), options["merge_similar"])
+        duplicates = {path: target for path, target in canonical.items() if path != target}
+
+        freed = sum(blobs[path]["size"] for path in duplicates)
+        for path, target in sorted(duplicates.items()):
+            self.stdout.write(f"  {path} -> {target}")
+        if similar:
+            self.stdout.write(f"{len(similar)} similar image(s) left in place, review manually:")
+            for path, target in similar:
+                self.stdout.write(f"  {path} ~ {target}")
+
+        stray = []
+        known = {blob["sha256"] for blob in blobs.values()}
+        for root in options["stray_root"]:
+            for path, blob in self.scan(root, folders=None).items():
+                if blob["sha256"] in known:
+                    stray.append(os.path.join(root, path))
+                    freed += blob["size"]
+        for path in stray:
+            self.stdout.write(f"  {path} (stray copy)")
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING(
+                f"Dry run: {len(duplicates) + len(stray)} duplicate(s), {freed / 1024 / 1024:.1f} MB reclaimable"
+            ))
+            return
+
+        with transaction.atomic():
+            self.repoint(duplicates)
+            self.rebuild_store(blobs, canonical)
+
+        for path in duplicates:
+            os.remove(os.path.join(settings.MEDIA_ROOT, path))
+        for path in stray:
+            os.remove(path)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Removed {len(duplicates) + len(stray)} duplicate(s), freed {freed / 1024 / 1024:.1f} MB. "
+            "Run build_image_derivatives to refresh resized copies."
+        ))
+
+    # ---------- SCANNING ----------
+    def scan(self, root, folders=UPLOAD_FOLDERS):
+        """{relative path: description} for every file under ``root``'s upload folders"""
+        blobs = {}
+        for folder in folders or [""]:
+            base = os.path.join(root, folder)
+            for dirpath, dirnames, filenames in os.walk(base):
+                rel_dir = os.path.relpath(dirpath, root).replace(os.sep, "/")
+                if rel_dir == DERIVED_DIR or rel_dir.startswith(DERIVED_DIR + "/"):
+                    continue
+                for filename in filenames:
+                    full = os.path.join(dirpath, filename)
+                    with open(full, "rb") as f:
+                        sha, phash, width, height = describe(f)
+                    rel = os.path.relpath(full, root).replace(os.sep, "/")
+                    blobs[rel] = {
+                        "sha256": sha, "phash": phash, "width": width, "height": height,
+                        "size": os.path.getsize(full),
+                    }
+        return blobs
+
+    @staticmethod
+    def references():
+        """{path: number of Item.images entries and profile images using it}"""
+        counts = {}
+        for images in Item.objects.exclude(images=[]).values_list("images", flat=True).iterator():
+            for path in images:
+                counts[path] = counts.get(path, 0) + 1
+        for path in Profile.objects.exclude(profile_image="").values_list("profile_image", flat=True).iterator():
+            if path:
+                counts[path] = counts.get(path, 0) + 1
+        return counts
+
+    @staticmethod
+    def owners():
+        """{path: ids of the users whose items or profile use it}"""
+        owners = {}
+        for owner_id, images in Item.objects.exclude(images=[]).values_list("owner_id", "images").iterator():
+            for path in images:
+                owners.setdefault(path, set()).add(owner_id)
+        for user_id, path in Profile.objects.exclude(profile_image="").values_list("user_id", "profile_image").iterator():
+            if path:
+                owners.setdefault(path, set()).add(user_id)
+        return owners
+
+    # ---------- GROUPING ----------
+    @staticmethod
+    def group(blobs, references, owners, merge_similar=False):
+        """Map every path to the path of the file it should be replaced by.
+
+        Only byte-identical files collapse. Survivors within
+        ``IMAGE_DEDUP_MAX_DISTANCE`` bits of a larger image are returned as
+        (path, match) pairs for review, and are merged into it only with
+        ``merge_similar`` and when one user owns both. A 64-bit dHash
+        collides on flat photos (every solid colour hashes to 0), so merging
+        across owners would show one seller's picture on another's item.
+        The shared default avatar is never merged away.
+        """
+        def preference(path):
+            blob = blobs[path]
+            # Keep the default avatar, then the largest, then referenced, then shortest (un-suffixed) name
+            return (path == DEFAULT_PROFILE_IMAGE, blob["width"] * blob["height"], path in references, -len(path))
+
+        canonical = {}
+        by_sha = {}
+        for path, blob in blobs.items():
+            by_sha.setdefault(blob["sha256"], []).append(path)
+        survivors = []
+        for paths in by_sha.values():
+            keep = max(paths, key=preference)
+            survivors.append(keep)
+            for path in paths:
+                canonical[path] = keep
+
+        similar = []
+        limit = getattr(settings, "IMAGE_DEDUP_MAX_DISTANCE", 0)
+        if limit > 0:
+            survivors.sort(key=preference, reverse=True)
+            kept = []
+            merged = {}
+            for path in survivors:
+                blob = blobs[path]
+                match = None
+                if blob["phash"] and path != DEFAULT_PROFILE_IMAGE:
+                    match = next(
+                        (k for k in kept if blobs[k]["phash"] and hamming(blob["phash"], blobs[k]["phash"]) <= limit),
+                        None,
+                    )
+                if match is None:
+                    kept.append(path)
+                elif merge_similar and len(owners.get(path, ())) == 1 and owners.get(path) == owners.get(match):
+                    merged[path] = match
+                else:
+                    similar.append((path, match))
+            for path, target in canonical.items():
+                canonical[path] = merged.get(target, target)
+        return canonical, similar
+
+    # ---------- REWRITING ----------
+    @staticmethod
+    def repoint(duplicates):
+        if not duplicates:
+            return
+        for item in Item.objects.exclude(images=[]).only("id", "images", "image_derivatives").iterator():
+            if not any(path in duplicates for path in item.images):
+                continue
+            images = [duplicates.get(path, path) for path in item.images]
+            # Resized copies are keyed by original path; drop the stale ones
+            derivatives = {k: v for k, v in (item.image_derivatives or {}).items() if k in images}
+            Item.objects.filter(pk=item.pk).update(images=images, image_derivatives=derivatives)
+        for old, new in duplicates.items():
+            Profile.objects.filter(profile_image=old).update(profile_image=new)
+
+    def rebuild_store(self, blobs, canonical):
+        references = self.references()
+        kept = set(canonical.values())
+        StoredImage.objects.exclude(path__in=kept).delete()
+        for path in kept:
+            blob = blobs[path]
+            StoredImage.objects.filter(sha256=blob["sha256"]).exclude(path=path).delete()
+            StoredImage.objects.update_or_create(
+                path=path,
+                defaults={
+                    "sha256": blob["sha256"],
+                    "phash": blob["phash"],
+                    "width": blob["width"],
+                    "height": blob["height"],
+                    "size": blob["size"],
+                    "ref_count": references.get(path, 0),
+                },
+            )
@@ -41,3 +41,27 @@ class Profile(models.Model):
     class Meta:
         verbose_name = "Profile"
         verbose_name_plural = "Profiles"
+
+
+class StoredImage(models.Model):
+    """One stored image blob shared by every upload with the same content.
+
+    ``ref_count`` counts the Item.images entries and profile images pointing
+    at ``path``; the file is deleted when it drops to zero.
+    """
+    path = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64, unique=True)
+    phash = models.CharField(max_length=16, db_index=True, help_text="64-bit difference hash (hex)")
+    width = models.PositiveIntegerField(default=0)
+    height = models.PositiveIntegerField(default=0)
+    size = models.PositiveIntegerField(default=0, help_text="In bytes")
+    ref_count = models.PositiveIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.path} ({self.ref_count} refs)"
+
+    class Meta:
+        verbose_name = "Stored image"
+        verbose_name_plural = "Stored images"
@@ -1,7 +1,14 @@
-from django.db.models.signals import post_save
+from collections import Counter
+
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
 from django.contrib.auth.models import User
 from django.dispatch import receiver
 from .models import Profile
+from . import cache as home_cache
+from .images import acquire, enqueue_item_images, release
+from auction_list.models import Catagory, Item, Lot
+from bids.models import Bid
 
 @receiver(post_save, sender=User)
 def create_profile(sender, instance, created, **kwargs):
@@ -11,3 +18,74 @@ def create_profile(sender, instance, created, **kwargs):
 @receiver(post_save, sender=User)
 def save_profile(sender, instance, **kwargs):
     instance.profile.save()
+
+
+# ---------- HOMEPAGE CACHE INVALIDATION ----------
+@receiver(post_save, sender=User)
+def invalidate_home_on_signup(sender, instance, created, **kwargs):
+    if created:
+        home_cache.invalidate(*home_cache.SIGNUP_BLOCKS)
+
+@receiver(post_save, sender=Bid)
+@receiver(post_delete, sender=Bid)
+def invalidate_home_on_bid(sender, instance, **kwargs):
+    home_cache.invalidate(*home_cache.BID_BLOCKS)
+
+@receiver(post_save, sender=Lot)
+def invalidate_home_on_lot_status(sender, instance, created, update_fields=None, **kwargs):
+    if created or update_fields is None or 'status' in update_fields:
+        home_cache.invalidate(*home_cache.LOT_STATUS_BLOCKS)
+
+@receiver(post_delete, sender=Lot)
+def invalidate_home_on_lot_delete(sender, instance, **kwargs):
+    home_cache.invalidate(*home_cache.LOT_STATUS_BLOCKS)
+
+@receiver(post_save, sender=Catagory)
+@receiver(post_delete, sender=Catagory)
+def invalidate_home_on_category(sender, instance, **kwargs):
+    home_cache.invalidate(*home_cache.CATEGORY_BLOCKS)
+
+
+# ---------- IMAGE DERIVATIVES ----------
+@receiver(post_save, sender=Item)
+def build_item_image_derivatives(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'images' not in update_fields:
+        return
+    derivatives = instance.image_derivatives or {}
+    if any(path not in derivatives for path in instance.images or []):
+        transaction.on_commit(lambda: enqueue_item_images(instance.pk))
+
+
+# ---------- IMAGE REFERENCE COUNTS ----------
+# Each Item.images entry holds a reference of its own. Paths are compared
+# with the images the instance was loaded (or last saved) with.
+@receiver(post_init, sender=Item)
+def remember_item_images(sender, instance, **kwargs):
+    # Reading a deferred field here would cost a query per instance
+    if 'images' not in instance.get_deferred_fields():
+        instance._saved_images = list(instance.images or [])
+
+@receiver(post_save, sender=Item)
+def track_item_image_refs(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and 'images' not in update_fields:
+        return
+    if not hasattr(instance, '_saved_images'):
+        return
+    before = Counter() if created else Counter(instance._saved_images)
+    after = Counter(instance.images or [])
+    # Taken now so a release racing this save cannot delete the blob
+    for path in (after - before).elements():
+        acquire(path)
+    for path in (before - after).elements():
+        transaction.on_commit(lambda path=path: release(path))
+    instance._saved_images = list(instance.images or [])
+
+@receiver(post_delete, sender=Item)
+def release_item_images(sender, instance, **kwargs):
+    for path in instance.images or []:
+        transaction.on_commit(lambda path=path: release(path))
+
+@receiver(post_delete, sender=Profile)
+def release_profile_image(sender, instance, **kwargs):
+    if instance.profile_image:
+        transaction.on_commit(lambda: release(instance.profile_image.name))
@@ -1,3 +1,284 @@
-from django.test import TestCase
+import threading
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+
+from AuctionHouse.testing import LotFixtureMixin, MediaTestMixin, QueryBudgetMixin
+from auction_list.models import Auction, Catagory, Item, Lot
+from bids.models import Bid
+from PIL import Image
+
+from . import images
+from .models import StoredImage
+
+
+class HomeQueryBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user("seller", "s@example.com", "pass12345")
+        category = Catagory.objects.create(name="Art")
+        auction = Auction.objects.create(title="Estate sale", description="", created_by=owner)
+        for i in range(8):
+            lot = Lot.objects.create(
+                auction=auction, lot_number=i + 1, title=f"Lot {i}", description="",
+                lot_catagory=category, status="active",
+            )
+            lot.items.add(Item.objects.create(
+                title=f"Item {i}", owner=owner, item_catagory=category,
+                estimated_value=100, images=[f"item_images/{i}.jpg"],
+            ))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_home_cold_and_warm(self):
+        cold = self.assertWithinQueryBudget(self.client.get(reverse("home")))
+        warm = self.assertWithinQueryBudget(self.client.get(reverse("home")))
+        self.assertLess(warm.queries, cold.queries)
+
+
+class HomeCacheTests(LotFixtureMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.bidder = cls.make_user("alice", balance=10000)
+
+    def setUp(self):
+        cache.clear()
+
+    def home(self, block):
+        return self.client.get(reverse("home")).context[block]
+
+    def bid(self, lot, amount):
+        return Bid.objects.create(lot=Lot.objects.get(pk=lot.pk), user=User.objects.get(pk=self.bidder.pk), amount=amount)
+
+    def test_bids_reorder_featured_lots(self):
+        busy = self.make_lot(2)
+        self.assertEqual(self.home("featured_lots")[0].bid_count, 0)
+        self.bid(busy, 100)
+        second = self.bid(busy, 200)
+        featured = self.home("featured_lots")
+        self.assertEqual((featured[0].pk, featured[0].bid_count), (busy.pk, 2))
+        second.delete()
+        self.assertEqual(Lot.objects.get(pk=busy.pk).bid_count, 1)
+
+    def test_status_changes_and_signups_refresh_their_blocks(self):
+        self.assertEqual(self.home("recently_sold"), [])
+        users = self.home("stats")["users"]
+        self.lot.status = "sold"
+        self.lot.save()
+        self.assertEqual([lot.pk for lot in self.home("recently_sold")], [self.lot.pk])
+        self.make_user("carol")
+        self.assertEqual(self.home("stats")["users"], users + 1)
+        # Untouched blocks are served from cache
+        with mock.patch("Home.views.Catagory.objects") as categories:
+            self.home("categories")
+        categories.all.assert_not_called()
+
+
+def image_file(colour, size=(64, 48), fmt="PNG"):
+    buffer = BytesIO()
+    Image.new("RGB", size, colour).save(buffer, fmt)
+    return ContentFile(buffer.getvalue())
+
+
+class ImageDerivativeTests(MediaTestMixin, TestCase):
+    def derivative_files(self, path):
+        return [name for formats in images.generate_derivatives(path).values() for name in formats.values()]
+
+    def test_originals_with_the_same_file_name_keep_their_own_derivatives(self):
+        first = images.store_upload(image_file("red"), "item_images/photo.png")
+        second = images.store_upload(image_file("blue", fmt="JPEG"), "item_images/2024/photo.jpg")
+        first_files, second_files = self.derivative_files(first), self.derivative_files(second)
+        self.assertFalse(set(first_files) & set(second_files))
+
+        images.release(first)
+        self.assertFalse(any(default_storage.exists(name) for name in [first, *first_files]))
+        self.assertTrue(all(default_storage.exists(name) for name in [second, *second_files]))
+
+    def test_item_jobs_run_one_at_a_time(self):
+        seen = []
+
+        def record(item_id):
+            seen.append((item_id, threading.current_thread().name))
+
+        with mock.patch.object(images, "process_item_images", record):
+            for item_id in range(20):
+                images.enqueue_item_images(item_id)
+            images.get_job_executor().submit(lambda: None).result(timeout=5)
+        self.assertEqual([item_id for item_id, _ in seen], list(range(20)))
+        self.assertEqual(len({name for _, name in seen}), 1)
+
+
+class ImageReferenceTests(MediaTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user("seller", "s@example.com", "pass12345")
+        cls.category = Catagory.objects.create(name="Art")
+
+    def setUp(self):
+        super().setUp()
+        # Derivatives aren't under test
+        patcher = mock.patch("Home.signals.enqueue_item_images")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def refs(self, path):
+        stored = StoredImage.objects.filter(path=path).first()
+        return stored.ref_count if stored else None
+
+    def upload(self, colour, name="photo.png", size=(64, 48)):
+        buffer = image_file(colour, size)
+        return SimpleUploadedFile(name, buffer.read(), content_type="image/png")
+
+    def add_item(self, *uploads):
+        return self.client.post(reverse("add_item"), {
+            "title": "Vase", "catagory": self.category.pk, "estimated_value": "100", "image": list(uploads),
+        })
+
+    def test_only_identical_files_are_shared(self):
+        path = images.store_upload(self.upload("red"), "item_images/a.png")
+        self.assertEqual(images.store_upload(self.upload("red"), "item_images/b.png"), path)
+        self.assertEqual(self.refs(path), 2)
+        # A resized copy of the same picture looks alike but is stored separately
+        resized = images.store_upload(self.upload("red", size=(128, 96)), "item_images/c.png")
+        self.assertNotEqual(resized, path)
+
+    def test_added_item_holds_one_reference_per_image(self):
+        self.client.force_login(self.owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_item(self.upload("red"), self.upload("blue"))
+        item = Item.objects.get()
+        self.assertEqual([self.refs(path) for path in item.images], [1, 1])
+
+    def test_failed_create_releases_the_uploads(self):
+        # Anonymous users can't own items; the create fails after the upload
+        with self.assertRaises(ValueError):
+            self.add_item(self.upload("red"))
+        self.assertFalse(StoredImage.objects.exists())
+        self.assertEqual(default_storage.listdir("item_images")[1], [])
+
+    def test_changing_item_images_moves_references(self):
+        kept = images.store_upload(self.upload("red"), "item_images/kept.png")
+        dropped = images.store_upload(self.upload("blue"), "item_images/dropped.png")
+        added = images.store_upload(self.upload("green"), "item_images/added.png")
+        item = Item.objects.create(
+            title="Vase", owner=self.owner, item_catagory=self.category, estimated_value=100, images=[kept, dropped],
+        )
+        images.release(kept)
+        images.release(dropped)
+
+        item = Item.objects.get(pk=item.pk)
+        item.images = [kept, added]
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+        images.release(added)
+        self.assertEqual((self.refs(kept), self.refs(dropped), self.refs(added)), (1, None, 1))
+        self.assertFalse(default_storage.exists(dropped))
+
+        # Saves that leave the images alone don't touch the counts
+        item.title = "Blue vase"
+        item.save()
+        self.assertEqual((self.refs(kept), self.refs(added)), (1, 1))
+
+
+@override_settings(IMAGE_DEDUP_MAX_DISTANCE=2)
+class DedupeMediaTests(MediaTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Catagory.objects.create(name="Art")
+        cls.alice = User.objects.create_user("alice", "a@example.com", "pass12345")
+        cls.bob = User.objects.create_user("bob", "b@example.com", "pass12345")
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch("Home.signals.enqueue_item_images")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def item(self, owner, *colours):
+        # Solid colours all share the perceptual hash 0
+        paths = [default_storage.save(f"item_images/{colour}.png", image_file(colour)) for colour in colours]
+        return Item.objects.create(title="Vase", owner=owner, item_catagory=self.category, estimated_value=1, images=paths)
+
+    def dedupe(self, *args):
+        out = StringIO()
+        call_command("dedupe_media", *args, stdout=out)
+        return out.getvalue()
+
+    def test_similar_images_are_only_reported_by_default(self):
+        red, blue = self.item(self.alice, "red"), self.item(self.bob, "blue")
+        copy = self.item(self.bob, "red")
+        output = self.dedupe()
+        self.assertIn("similar image(s) left in place", output)
+        red.refresh_from_db(), blue.refresh_from_db(), copy.refresh_from_db()
+        # Only the byte-identical copy is merged
+        self.assertEqual(copy.images, red.images)
+        self.assertTrue(default_storage.exists(blue.images[0]))
+        self.assertNotEqual(blue.images, red.images)
+
+    def test_merge_similar_stays_within_one_owner(self):
+        mine, also_mine = self.item(self.alice, "red"), self.item(self.alice, "blue")
+        theirs = self.item(self.bob, "green")
+        self.dedupe("--merge-similar")
+        mine.refresh_from_db(), also_mine.refresh_from_db(), theirs.refresh_from_db()
+        self.assertEqual(also_mine.images, mine.images)
+        self.assertNotEqual(theirs.images, mine.images)
+        self.assertTrue(default_storage.exists(theirs.images[0]))
+
+
+class AvatarTests(MediaTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.profile = User.objects.create_user("alice", "a@example.com", "pass12345").profile
+
+    def photo(self, size=(2000, 1000)):
+        exif = Image.Exif()
+        exif[0x010F] = "PhoneMaker"
+        buffer = BytesIO()
+        Image.new("RGB", size, "green").save(buffer, "JPEG", exif=exif)
+        return SimpleUploadedFile("me.jpg", buffer.getvalue(), content_type="image/jpeg")
+
+    def test_render_downsizes_and_strips_metadata(self):
+        data, ext = images.render_avatar(self.photo(), max_size=200)
+        rendered = Image.open(BytesIO(data))
+        self.assertEqual((ext, rendered.size), ("jpg", (200, 100)))
+        self.assertEqual(dict(rendered.getexif()), {})
+
+        buffer = BytesIO()
+        Image.new("RGBA", (300, 300), (0, 0, 0, 0)).save(buffer, "PNG")
+        self.assertEqual(images.render_avatar(BytesIO(buffer.getvalue()))[1], "png")
+
+    @mock.patch("Home.images.enqueue_avatar", side_effect=images.process_avatar)
+    def test_processed_avatar_replaces_the_raw_upload(self, enqueue):
+        with self.captureOnCommitCallbacks(execute=True):
+            images.attach_avatar(self.profile, self.photo())
+        raw = enqueue.call_args.args[1]
+
+        self.profile.refresh_from_db()
+        processed = self.profile.profile_image.name
+        self.assertNotEqual(processed, raw)
+        self.assertEqual(Image.open(default_storage.open(processed)).size, (500, 250))
+        self.assertFalse(default_storage.exists(raw))
+        self.assertFalse(StoredImage.objects.filter(path=raw).exists())
+
+    def test_a_newer_upload_wins_over_a_late_processing_job(self):
+        with mock.patch("Home.images.enqueue_avatar"), self.captureOnCommitCallbacks(execute=True):
+            images.attach_avatar(self.profile, self.photo())
+        raw = self.profile.profile_image.name
+        self.profile.profile_image.name = "profile_images/newer.png"
+        self.profile.save()
+
+        images.process_avatar(self.profile.pk, raw)
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.profile_image.name, "profile_images/newer.png")
+        # Only the raw upload's own reference is left
+        self.assertEqual(list(StoredImage.objects.values_list("path", flat=True)), [raw])
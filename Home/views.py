@@ -1,8 +1,8 @@
 from django.contrib import messages
 from django.shortcuts import render, redirect, get_object_or_404
-from django.core.files.storage import default_storage
 from django.contrib.auth import logout
 from .models import Profile
+from .images import attach_avatar, release, store_upload
 from django.contrib.auth.models import User
 from auction_list.models import Item, Catagory
 from django.core.paginator import Paginator
@@ -21,6 +21,7 @@ def logoutview(request):
 
 from bids.models import Bid, Transaction
 from auction_list.models import Lot
+from AuctionHouse.db import read_only
 
 def profile_view(request):
     profile, created = Profile.objects.get_or_create(user=request.user)
@@ -74,9 +75,6 @@ def edit_profile_view(request):
         user.save()
         
         # Update Profile model fields
-        if request.FILES.get("profile_image"):
-            profile.profile_image = request.FILES.get("profile_image")
-        
         theme_color = request.POST.get("theme_color")
         if theme_color:
             profile.theme_color = theme_color
@@ -87,6 +85,8 @@ def edit_profile_view(request):
         profile.website = request.POST.get("website", "")
             
         profile.save()
+        if request.FILES.get("profile_image"):
+            attach_avatar(profile, request.FILES["profile_image"])
             
         messages.success(request, "Profile updated successfully!")
         return redirect("profile")
@@ -114,21 +114,27 @@ def add_item_view(request):
         for image in images:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"{timestamp}_{image.name}"
-            image_path = default_storage.save(f"item_images/{filename}", image)
+            image_path = store_upload(image, f"item_images/{filename}")
             images_paths.append(image_path)
         
-        item = Item.objects.create(
-            owner=request.user,
-            title=title,
-            item_catagory=selected_catagory,
-            description=description,
-            estimated_value=estimated_value,
-            condition=condition,
-            dimensions=dimensions,
-            weight=weight if weight else None,
-            images=images_paths,
-            status='Available'  
-        )
+        try:
+            item = Item.objects.create(
+                owner=request.user,
+                title=title,
+                item_catagory=selected_catagory,
+                description=description,
+                estimated_value=estimated_value,
+                condition=condition,
+                dimensions=dimensions,
+                weight=weight if weight else None,
+                images=images_paths,
+                status='Available'  
+            )
+        finally:
+            # The item took its own references (Home.signals); a failed
+            # create leaves the uploads unreferenced and deletes them
+            for image_path in images_paths:
+                release(image_path)
         
         messages.success(request, f'Item "{item.title}" has been added to your warehouse successfully!')
         
@@ -164,49 +170,70 @@ def edit_item_view(request, item_id):
     )
 
 
-def home_view(request):
-    from django.db.models import Count
-    from django.utils import timezone
-    
-        
-    active_auctions = Lot.objects.filter(status='active').order_by('-created_at')[:6]
-    
-    now = timezone.now()
-    ending_soon = Lot.objects.filter(
-        status='active', 
-        is_timed=True, 
-        end_time__gt=now
-    ).order_by('end_time')[:3]
-    
-    recently_sold = Lot.objects.filter(status='sold').select_related('winning_bidder').order_by('-last_bid_time')[:5]
-    
-    featured_lots = Lot.objects.filter(status='active').annotate(
-        num_bids=Count('bids')
-    ).order_by('-num_bids')[:3]
+def _with_cover_images(lots):
+    """Evaluate a lot queryset, attaching the first item's image_set entry as lot.cover_image"""
+    lots = list(lots.prefetch_related('items'))
+    for lot in lots:
+        first_item = next(iter(lot.items.all()), None)
+        lot.cover_image = first_item.cover if first_item else None
+    return lots
 
-    from django.db.models import Sum    
 
-    
-    total_users_count = User.objects.count()
+def _home_stats():
+    from django.db.models import Count, Q, Sum
 
-    volume_data = Lot.objects.filter(status='sold').aggregate(total_volume=Sum('current_bid'))
-    total_volume = volume_data['total_volume'] or 0
-    
-    total_active_lots = Lot.objects.filter(status='active').count()
-    
+    lot_totals = Lot.objects.aggregate(
+        volume=Sum('current_bid', filter=Q(status='sold')),
+        active=Count('id', filter=Q(status='active')),
+    )
+    return {
+        'users': User.objects.count(),
+        'volume': lot_totals['volume'] or 0,
+        'active': lot_totals['active'],
+    }
+
+
+@read_only
+def home_view(request):
+    from django.utils import timezone
+    from Home.cache import get_block
+
+    # Each block is cached separately and invalidated by Home.signals
+    active_auctions = get_block('active_auctions', lambda: list(
+        Lot.objects.filter(status='active').order_by('-created_at')[:6]
+    ))
+    
+    ending_soon = get_block('ending_soon', lambda: _with_cover_images(
+        Lot.objects.filter(
+            status='active', 
+            is_timed=True, 
+            end_time__gt=timezone.now()
+        ).order_by('end_time')[:3]
+    ))
+    
+    recently_sold = get_block('recently_sold', lambda: list(
+        Lot.objects.filter(status='sold').select_related('winning_bidder').order_by('-last_bid_time')[:5]
+    ))
+    
+    # Ranked by the bid_count maintained on each bid, not a Count('bids') join
+    featured_lots = get_block('featured_lots', lambda: _with_cover_images(
+        Lot.objects.filter(status='active').order_by('-bid_count')[:3]
+    ))
+
+    stats = get_block('stats', _home_stats)
  
-    categories = Catagory.objects.all()
+    categories = get_block('categories', lambda: list(Catagory.objects.all()))
+    
+    # ending_soon is cached for a few seconds, so drop lots that ended meanwhile
+    now = timezone.now()
+    ending_soon = [lot for lot in ending_soon if lot.end_time > now]
     
     context = {
         'active_auctions': active_auctions,
         'ending_soon': ending_soon,
         'recently_sold': recently_sold,
         'featured_lots': featured_lots,
-        'stats': {
-            'users': total_users_count,
-            'volume': total_volume,
-            'active': total_active_lots
-        },
+        'stats': stats,
         'categories': categories
     }
     
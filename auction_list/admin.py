@@ -1,10 +1,18 @@
 from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin import helpers
+from django.contrib.admin.widgets import AutocompleteSelectMultiple
+from django.http import JsonResponse
 from .models import Auction, Item, Lot, Catagory, AuctionRegister, LotRegister,Invoice
 from django import forms
+from django.core.exceptions import PermissionDenied
 from django.utils.html import format_html
-from django.db.models import Sum
+from django.db.models import Count, Prefetch, Q, Sum
 from django.utils.safestring import mark_safe
+from django.contrib.auth.models import User
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from . import importer, lotting
 
 # Register your models here.
 
@@ -48,6 +56,8 @@ class AuctionAdmin(admin.ModelAdmin):
                     "allow_proxy_bidding",
                     "buyer_premium_percentage",
                     "min_bid_increment",
+                    "idle_timeout",
+                    "idle_countdown",
                 )
             },
         ),
@@ -83,6 +93,27 @@ class AuctionAdmin(admin.ModelAdmin):
     status_badge.short_description = "Status"
     status_badge.admin_order_field = "status"
 
+    # ---- ANNOTATED TOTALS ----
+    list_select_related = ("created_by",)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            lot_total=Count("lots"),
+            lot_value=Sum("lots__starting_bid"),
+        )
+
+    def total_lots(self, obj):
+        return obj.lot_total if hasattr(obj, "lot_total") else obj.total_lots
+
+    total_lots.short_description = "Total lots"
+    total_lots.admin_order_field = "lot_total"
+
+    def total_value(self, obj):
+        return (obj.lot_value or 0) if hasattr(obj, "lot_value") else obj.total_value
+
+    total_value.short_description = "Total value"
+    total_value.admin_order_field = "lot_value"
+
 
 admin.site.register(Auction, AuctionAdmin)
 
@@ -93,19 +124,54 @@ class CatagoryAdmin(admin.ModelAdmin):
     search_fields = ["name", "description"]
     list_per_page = 50
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            item_total=Count("item"),
+            available_total=Count("item", filter=Q(item__status="Available")),
+        )
+
     def item_count(self, obj):
-        count = obj.total_items
+        count = obj.item_total
         return format_html('<span style="font-weight: bold;">{}</span>', count)
 
     item_count.short_description = "Total Items"
+    item_count.admin_order_field = "item_total"
 
     def available_count(self, obj):
-        count = obj.available_items
+        count = obj.available_total
         return format_html(
             '<span style="color: green; font-weight: bold;">{}</span>', count
         )
 
     available_count.short_description = "Available"
+    available_count.admin_order_field = "available_total"
+
+
+class ItemImportForm(forms.Form):
+    data_file = forms.FileField(label="CSV / JSONL file")
+    images = forms.FileField(label="Images (zip)", required=False)
+    owner = forms.ModelChoiceField(queryset=User.objects.order_by("username"), help_text="Consignor who owns the items")
+    dry_run = forms.BooleanField(initial=True, required=False, help_text="Only validate; nothing is saved")
+
+
+class BuildLotsForm(forms.Form):
+    auction = forms.ModelChoiceField(
+        queryset=Auction.objects.exclude(status__in=["cancelled", "live", "completed"])
+    )
+    split = forms.ChoiceField(choices=lotting.SPLIT_CHOICES, initial="category")
+    max_items = forms.IntegerField(
+        min_value=1, required=False, help_text="Start a new lot after this many items"
+    )
+    target_value = forms.DecimalField(
+        min_value=0, max_digits=10, decimal_places=2, required=False,
+        help_text="Estimated value per lot when splitting by value",
+    )
+
+    def clean(self):
+        cleaned = super().clean()
+        if cleaned.get("split") == "value" and not cleaned.get("target_value"):
+            self.add_error("target_value", "Required when splitting by value.")
+        return cleaned
 
 
 @admin.register(Item)
@@ -128,6 +194,7 @@ class ItemAdmin(admin.ModelAdmin):
         "preview_image",
     ]
     list_per_page = 50
+    list_select_related = ("item_catagory", "owner")
 
     fieldsets = (
         (
@@ -174,8 +241,8 @@ class ItemAdmin(admin.ModelAdmin):
         if not obj or not obj.images:
             return "No Image"
         html = ""
-        for img in obj.images:
-            html += f'<img src="{settings.MEDIA_URL}{img}" width="120" style="margin:6px;border:1px solid #ccc;" />'
+        for img in obj.image_set:
+            html += f'<img src="{settings.MEDIA_URL}{img["thumb"]["jpeg"]}" width="120" style="margin:6px;border:1px solid #ccc;" />'
         return mark_safe(html)
 
     preview_image.short_description = "Images Preview"
@@ -188,9 +255,9 @@ class ItemAdmin(admin.ModelAdmin):
     # ---- STATUS BADGE ----
     def status_badge(self, obj):
         colors = {
-            "available": "#535355",
-            "lotted": "#f59e0b",
-            "sold": "#3b82f6",
+            "Available": "#535355",
+            "Lotted": "#f59e0b",
+            "Sold": "#3b82f6",
         }
         return format_html(
             '<span style="background-color:{};color:white;padding:4px 12px;'
@@ -202,12 +269,20 @@ class ItemAdmin(admin.ModelAdmin):
     status_badge.short_description = "Status"
 
     # ---- CURRENT LOT ----
+    def get_queryset(self, request):
+        # Same lots as Item.current_lot, fetched for the whole page at once
+        open_lots = Lot.objects.filter(status__in=["draft", "active"])
+        return super().get_queryset(request).prefetch_related(
+            Prefetch("lots", queryset=open_lots, to_attr="open_lots")
+        )
+
     def current_lot_display(self, obj):
-        lot = obj.current_lot
+        open_lots = getattr(obj, "open_lots", None)
+        lot = obj.current_lot if open_lots is None else next(iter(open_lots), None)
         if lot:
             return format_html(
-                '<a href="/admin/yourapp/lot/{}/change/" style="color:#ec4899;font-weight:bold;">Lot #{} - {}</a>',
-                lot.id,
+                '<a href="{}" style="color:#ec4899;font-weight:bold;">Lot #{} - {}</a>',
+                reverse("admin:auction_list_lot_change", args=[lot.id]),
                 lot.lot_number,
                 lot.title,
             )
@@ -215,19 +290,165 @@ class ItemAdmin(admin.ModelAdmin):
 
     current_lot_display.short_description = "Current Lot"
 
+    # ---- BULK IMPORT ----
+    def get_urls(self):
+        urls = [
+            path(
+                "import/",
+                self.admin_site.admin_view(self.import_items_view),
+                name="auction_list_item_import",
+            ),
+            path(
+                "autocomplete/",
+                self.admin_site.admin_view(self.autocomplete_view),
+                name="auction_list_item_autocomplete",
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def import_items_view(self, request):
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        report = None
+        form = ItemImportForm(request.POST or None, request.FILES or None)
+        if request.method == "POST" and form.is_valid():
+            data_file = form.cleaned_data["data_file"]
+            report = importer.import_items(
+                data_file.file,
+                form.cleaned_data["owner"],
+                fmt=importer.detect_format(data_file.name),
+                images_zip=form.cleaned_data["images"],
+                dry_run=form.cleaned_data["dry_run"],
+            )
+            self.message_user(request, report.summary())
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Import items",
+            "form": form,
+            "report": report,
+            "required_fields": importer.REQUIRED_FIELDS,
+            "optional_fields": importer.OPTIONAL_FIELDS,
+        }
+        return TemplateResponse(request, "admin/auction_list/item/import_items.html", context)
+
+    # ---- ITEM PICKER ----
+    AUTOCOMPLETE_PAGE_SIZE = 20
+
+    def autocomplete_view(self, request):
+        """Paginated item search for the lot form's item picker (select2 format)"""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        qs = Item.objects.only("id", "title", "estimated_value", "status")
+
+        status = request.GET.get("status", "Available")
+        if status:
+            # The widget sends "available"; stored values are the choice keys
+            qs = qs.filter(status=status.capitalize())
+        for param, field in (("category", "item_catagory_id"), ("owner", "owner_id")):
+            value = request.GET.get(param)
+            if value:
+                if not value.isdigit():
+                    return JsonResponse({"results": [], "pagination": {"more": False}})
+                qs = qs.filter(**{field: value})
+
+        term = request.GET.get("term", "").strip()
+        if term:
+            match = Q(title__icontains=term)
+            if term.isdigit():
+                match |= Q(pk=term)
+            qs = qs.filter(match)
+
+        try:
+            page = max(int(request.GET.get("page", 1)), 1)
+        except ValueError:
+            page = 1
+        size = self.AUTOCOMPLETE_PAGE_SIZE
+        # One extra row tells select2 whether to ask for more; no COUNT(*)
+        rows = list(qs.order_by("title", "pk")[(page - 1) * size:page * size + 1])
+        return JsonResponse({
+            "results": [
+                {"id": item.pk, "text": f"{item.title} - ₹{item.estimated_value} ({item.status})"}
+                for item in rows[:size]
+            ],
+            "pagination": {"more": len(rows) > size},
+        })
+
     # ---- ACTIONS ----
-    actions = ["mark_as_available", "mark_as_sold"]
+    actions = ["mark_as_available", "mark_as_sold", "build_lots"]
 
     def mark_as_available(self, request, queryset):
         qs = queryset.exclude(lots__isnull=False)
-        count = qs.update(status="available")
+        count = qs.update(status="Available")
         self.message_user(request, f"{count} item(s) marked as available.")
 
     def mark_as_sold(self, request, queryset):
         qs = queryset.exclude(lots__isnull=False)
-        count = qs.update(status="sold")
+        count = qs.update(status="Sold")
         self.message_user(request, f"{count} item(s) marked as sold.")
 
+    @admin.action(description="Build lots from selected items")
+    def build_lots(self, request, queryset):
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        form = BuildLotsForm(request.POST if "apply" in request.POST else None)
+        if form.is_bound and form.is_valid():
+            auction = form.cleaned_data["auction"]
+            lots = lotting.build_lots(
+                auction,
+                queryset,
+                mode=form.cleaned_data["split"],
+                max_items=form.cleaned_data["max_items"],
+                target_value=form.cleaned_data["target_value"],
+            )
+            self.message_user(
+                request,
+                format_html(
+                    '{} lot(s) created in <a href="{}?auction__id__exact={}">{}</a>.',
+                    len(lots),
+                    reverse("admin:auction_list_lot_changelist"),
+                    auction.pk,
+                    auction.title,
+                ),
+            )
+            return None
+
+        selected = queryset.count()
+        lottable = lotting.lottable_items(queryset).count()
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Build lots",
+            "form": form,
+            "queryset": queryset,
+            "selected": selected,
+            "lottable": lottable,
+            "skipped": selected - lottable,
+            "action_checkbox_name": helpers.ACTION_CHECKBOX_NAME,
+        }
+        return TemplateResponse(request, "admin/auction_list/item/build_lots.html", context)
+
+
+class ItemAutocompleteWidget(AutocompleteSelectMultiple):
+    """Select2 item picker that renders only the selected items and pages
+    the rest in from ``ItemAdmin.autocomplete_view``, filtered by the lot's
+    category (see admin/js/lot_item_filter.js)."""
+
+    def get_url(self):
+        return reverse("admin:auction_list_item_autocomplete", current_app=self.admin_site.name)
+
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        attrs = super().build_attrs(base_attrs, extra_attrs=extra_attrs)
+        # Own class so admin/js/autocomplete.js leaves it to our initialiser
+        attrs["class"] = attrs["class"].replace("admin-autocomplete", "item-autocomplete")
+        attrs["data-status"] = "available"
+        attrs["data-category-field"] = "id_lot_catagory"
+        return attrs
+
+    @property
+    def media(self):
+        return super().media + forms.Media(js=("admin/js/lot_item_filter.js",))
+
 
 class LotAdminForm(forms.ModelForm):
     class Meta:
@@ -237,18 +458,27 @@ class LotAdminForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        if self.instance.pk and self.instance.lot_catagory:
-            self.fields["items"].queryset = Item.objects.filter(
-                item_catagory=self.instance.lot_catagory, status="Available"
-            )
-        else:
-            self.fields["items"].queryset = Item.objects.none()
+        # Only submitted and already-selected ids are ever looked up, so the
+        # queryset can stay broad; category is checked in clean()
+        available = Q(status="Available")
+        if self.instance.pk:
+            available |= Q(lots=self.instance)
+        self.fields["items"].queryset = Item.objects.filter(available).distinct()
 
         if "auction" in self.fields:
             self.fields["auction"].queryset = Auction.objects.exclude(
                 status__in=["cancelled", "live", "completed"]
             )
 
+    def clean(self):
+        cleaned = super().clean()
+        category, items = cleaned.get("lot_catagory"), cleaned.get("items")
+        if category and items:
+            stray = [item.title for item in items if item.item_catagory_id != category.pk]
+            if stray:
+                self.add_error("items", f"Not in category {category}: {', '.join(stray)}")
+        return cleaned
+
 
 @admin.register(Lot)
 class LotAdmin(admin.ModelAdmin):
@@ -262,6 +492,7 @@ class LotAdmin(admin.ModelAdmin):
         "created_at",
     )
     list_filter = ("lot_catagory", "auction", "status", "created_at")
+    list_select_related = ("lot_catagory", "auction")
     readonly_fields = (
         "starting_bid",
         "created_at",
@@ -269,7 +500,6 @@ class LotAdmin(admin.ModelAdmin):
         "winning_bidder",
         "current_bid",
     )
-    filter_horizontal = ("items",)
     fieldsets = (
         (
             "Core Information",
@@ -306,9 +536,8 @@ class LotAdmin(admin.ModelAdmin):
     # ---------- SAVE MODEL ----------
     def save_model(self, request, obj, form, change):
         if change:
-            old = Lot.objects.prefetch_related("items").get(pk=obj.pk)
-            obj._old_status = old.status
-            obj._old_items = set(old.items.all())
+            obj._old_status = Lot.objects.values_list("status", flat=True).get(pk=obj.pk)
+            obj._old_items = set(Lot.items.through.objects.filter(lot_id=obj.pk).values_list("item_id", flat=True))
         else:
             obj._old_status = None
             obj._old_items = set()
@@ -322,7 +551,7 @@ class LotAdmin(admin.ModelAdmin):
 
         super().save_related(request, form, formsets, change)
 
-        new_items = set(lot.items.all())
+        new_items = set(Lot.items.through.objects.filter(lot_id=lot.pk).values_list("item_id", flat=True))
 
         if old_items != new_items or old_status != lot.status:
             self.update_item_status(lot, old_items, new_items, old_status)
@@ -330,52 +559,32 @@ class LotAdmin(admin.ModelAdmin):
 
     # ---------- ITEM STATUS UPDATE ----------
     def update_item_status(self, lot, old_items, new_items, old_status):
-        added = new_items - old_items
-        removed = old_items - new_items
-
-        for item in added:
-            item.status = "sold" if lot.status == "sold" else "lotted"
-            item.save(update_fields=["status"])
-
-        for item in removed:
-            if not item.lots.exclude(pk=lot.pk).exists():
-                item.status = "available"
-                item.save(update_fields=["status"])
-
-        if old_status != "sold" and lot.status == "sold":
-            for item in new_items:
-                if item.status != "sold":
-                    item.status = "sold"
-                    item.save(update_fields=["status"])
-
-        if old_status == "sold" and lot.status != "sold":
-            for item in new_items:
-                if item.status == "sold":
-                    item.status = "lotted"
-                    item.save(update_fields=["status"])
+        lotting.sync_item_statuses(
+            lot,
+            added_ids=new_items - old_items,
+            removed_ids=old_items - new_items,
+            old_status=old_status,
+        )
 
     # ---------- STARTING BID ----------
     def calculate_starting_bid(self, lot, old_items, new_items):
-        if old_items != new_items and lot.items.exists():
-            total = lot.items.aggregate(total=Sum("estimated_value"))["total"] or 0
-            lot.starting_bid = total
-            lot.save(update_fields=["starting_bid"])
+        if old_items != new_items:
+            lotting.recalculate_starting_bids([lot])
+
+    # ---------- ACTIONS ----------
+    actions = ["recalculate_starting_bids"]
 
-    # ---------- M2M FILTER ----------
+    @admin.action(description="Recalculate starting bids from items")
+    def recalculate_starting_bids(self, request, queryset):
+        changed = lotting.recalculate_starting_bids(queryset)
+        self.message_user(request, f"{len(changed)} lot(s) updated.")
+
+    # ---------- ITEM PICKER ----------
     def formfield_for_manytomany(self, db_field, request, **kwargs):
         if db_field.name == "items":
-            qs = Item.objects.filter(status="available")
-            if request.resolver_match and request.resolver_match.kwargs.get(
-                "object_id"
-            ):
-                lot_id = request.resolver_match.kwargs["object_id"]
-                qs = qs | Item.objects.filter(lots__id=lot_id)
-            kwargs["queryset"] = qs.distinct()
+            kwargs["widget"] = ItemAutocompleteWidget(db_field, self.admin_site)
         return super().formfield_for_manytomany(db_field, request, **kwargs)
 
-    class Media:
-        js = ("admin/js/lot_item_filter.js",)
-
 
 class InvoiceAdmin(admin.ModelAdmin):
     list_display = (
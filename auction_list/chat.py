@@ -0,0 +1,260 @@
+"""
+Lot chat pipeline.
+
+Chat bursts on a hot lot used to insert one row per message (after a
+``Lot.objects.get``), competing with bid writes for the database write lock,
+and every poll re-read the last messages. Now:
+
+* ``post`` checks the sender's rate limit, appends the message to the lot's
+  in-memory history and hands the row to ``ChatWriter``;
+* ``ChatWriter`` inserts queued rows with one ``bulk_create`` every
+  ``CHAT_FLUSH_INTERVAL`` seconds (or once ``CHAT_BATCH_SIZE`` are waiting).
+  A batch the database is too busy to take ("database is locked") goes back
+  on the queue and is retried with exponential backoff;
+* ``recent`` serves history from a per-lot ring buffer of the last
+  ``CHAT_HISTORY_SIZE`` messages, re-read from the database at most every
+  ``CHAT_HISTORY_REFRESH`` seconds to pick up other workers' messages. Only
+  the ``CHAT_HISTORY_LOTS`` most recently used lots are kept.
+
+``CHAT_FLUSH_INTERVAL = 0`` writes every message straight away (tests).
+Old chat of closed lots is archived and deleted by ``manage.py prune_lot_chat``.
+"""
+import atexit
+import threading
+import time
+from collections import OrderedDict, deque
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, OperationalError, connections, transaction
+from django.utils import timezone
+
+from .models import Lot, LotChatMessage
+
+
+class ChatRateLimited(Exception):
+    pass
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _entry(username, message, timestamp):
+    return {"user": username, "message": message, "timestamp": timestamp}
+
+
+# ---------- RATE LIMITING ----------
+def check_rate(user_id):
+    """Count a message against the user's allowance; raise ChatRateLimited when over.
+
+    Fixed window in the shared cache, so the limit holds across workers.
+    """
+    limit, window = _setting("CHAT_RATE_LIMIT", (5, 10))
+    key = f"chat:rate:{user_id}:{int(time.time() // window)}"
+    if cache.add(key, 1, window):
+        return
+    try:
+        count = cache.incr(key)
+    except ValueError:
+        # Expired between add and incr
+        cache.set(key, 1, window)
+        return
+    if count > limit:
+        raise ChatRateLimited(f"You can send {limit} messages every {window} seconds")
+
+
+# ---------- WRITER ----------
+class ChatWriter:
+    """Queue chat rows and insert them in batches from a background thread"""
+
+    def __init__(self, interval=None, batch_size=None):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._delay = 0  # backoff while the database is busy
+
+    def _interval(self):
+        return self.interval if self.interval is not None else _setting("CHAT_FLUSH_INTERVAL", 0.3)
+
+    def _batch_size(self):
+        return self.batch_size or _setting("CHAT_BATCH_SIZE", 100)
+
+    def _max_delay(self):
+        return _setting("CHAT_RETRY_MAX_DELAY", 5)
+
+    def submit(self, row):
+        if not self._interval():
+            self._insert_now(row)
+            return
+        with self._lock:
+            self._pending.append(row)
+            full = len(self._pending) >= self._batch_size()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="chat-writer", daemon=True)
+                self._thread.start()
+        if full:
+            self._wake.set()
+
+    def pending(self, lot_id=None):
+        with self._lock:
+            return [row for row in self._pending if lot_id is None or row.lot_id == lot_id]
+
+    def flush(self):
+        """Insert everything queued so far; returns the number of rows written.
+
+        Rows the database was too busy for go back to the front of the queue
+        and the next attempt waits twice as long (up to CHAT_RETRY_MAX_DELAY).
+        """
+        with self._lock:
+            rows, self._pending = self._pending, []
+        if not rows:
+            return 0
+        retry = self._insert(rows)
+        if retry:
+            with self._lock:
+                self._pending[:0] = retry
+            self._delay = min(max(self._delay * 2, self._interval() or 0.05), self._max_delay())
+            print(f"[Chat] Database busy; retrying {len(retry)} message(s) in {self._delay:.2f}s")
+        else:
+            self._delay = 0
+        return len(rows) - len(retry)
+
+    def _insert(self, rows):
+        """Insert ``rows``; returns the ones to retry because the database was busy"""
+        try:
+            with transaction.atomic():
+                LotChatMessage.objects.bulk_create(rows)
+            return []
+        except OperationalError:
+            # Locked or unreachable: nothing was written, the batch can wait
+            return rows
+        except DatabaseError:
+            pass
+        # One bad row (e.g. its lot was deleted) must not drop the batch
+        retry = []
+        for row in rows:
+            try:
+                row.pk = None
+                row.save(force_insert=True)
+            except OperationalError:
+                retry.append(row)
+            except DatabaseError as e:
+                print(f"[Chat] Dropped message for Lot #{row.lot_id}: {e}")
+        return retry
+
+    def _insert_now(self, row):
+        """Unbatched mode: retry a busy database with backoff, then fail the request"""
+        delay = 0.05
+        while self._insert([row]):
+            if delay > self._max_delay():
+                raise OperationalError(f"Chat message for Lot #{row.lot_id} not saved: database busy")
+            time.sleep(delay)
+            delay *= 2
+
+    def _run(self):
+        while True:
+            if self._delay:
+                # Backing off a busy database; a full queue does not cut this short
+                time.sleep(self._delay)
+            else:
+                self._wake.wait(self._interval())
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[Chat] Flush failed: {e}")
+            finally:
+                connections.close_all()
+
+
+writer = ChatWriter()
+atexit.register(writer.flush)
+
+
+# ---------- HISTORY ----------
+class ChatHistory:
+    """Per-lot ring buffers of recent messages, for the most recently used lots"""
+
+    def __init__(self, size=None, refresh=None, max_lots=None):
+        self.size = size
+        self.refresh = refresh
+        self.max_lots = max_lots
+        self._lots = OrderedDict()  # lot_id -> (loaded_at, deque), least recently used first
+        self._lock = threading.Lock()
+
+    def _size(self):
+        return self.size or _setting("CHAT_HISTORY_SIZE", 50)
+
+    def _refresh(self):
+        return self.refresh if self.refresh is not None else _setting("CHAT_HISTORY_REFRESH", 2)
+
+    def _load(self, lot_id):
+        """Recent messages from the database plus this worker's unflushed ones"""
+        if not Lot.objects.filter(pk=lot_id).exists():
+            raise Lot.DoesNotExist(f"Lot #{lot_id} does not exist")
+        rows = (
+            LotChatMessage.objects.filter(lot_id=lot_id)
+            .order_by("-timestamp", "-pk")
+            .values_list("user__username", "message", "timestamp")[: self._size()]
+        )
+        messages = [_entry(*row) for row in reversed(rows)]
+        messages += [_entry(row.user.username, row.message, row.timestamp) for row in writer.pending(lot_id)]
+        messages.sort(key=lambda entry: entry["timestamp"])
+        return deque(messages, maxlen=self._size())
+
+    def _max_lots(self):
+        return self.max_lots or _setting("CHAT_HISTORY_LOTS", 500)
+
+    def _buffer(self, lot_id):
+        with self._lock:
+            cached = self._lots.get(lot_id)
+            if cached is not None:
+                self._lots.move_to_end(lot_id)
+        if cached is not None and time.monotonic() - cached[0] < self._refresh():
+            return cached[1]
+        buffer = self._load(lot_id)
+        with self._lock:
+            self._lots[lot_id] = (time.monotonic(), buffer)
+            self._lots.move_to_end(lot_id)
+            while len(self._lots) > self._max_lots():
+                self._lots.popitem(last=False)
+        return buffer
+
+    def recent(self, lot_id, limit=20):
+        """The last ``limit`` messages of the lot, newest first"""
+        buffer = self._buffer(lot_id)
+        with self._lock:
+            return list(buffer)[-limit:][::-1]
+
+    def append(self, lot_id, entry):
+        buffer = self._buffer(lot_id)
+        with self._lock:
+            buffer.append(entry)
+
+    def forget(self, lot_id):
+        with self._lock:
+            self._lots.pop(lot_id, None)
+
+
+history = ChatHistory()
+
+
+def recent(lot_id, limit=20):
+    return history.recent(lot_id, limit)
+
+
+def post(lot_id, user, message):
+    """Accept a chat message; returns its history entry.
+
+    Raises ChatRateLimited, or Lot.DoesNotExist for an unknown lot.
+    """
+    check_rate(user.pk)
+    row = LotChatMessage(lot_id=lot_id, user=user, message=message, timestamp=timezone.now())
+    entry = _entry(user.username, message, row.timestamp)
+    history.append(lot_id, entry)
+    writer.submit(row)
+    return entry
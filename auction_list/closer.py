@@ -0,0 +1,172 @@
+"""
+The lot closer.
+
+Lots are closed here and nowhere else. ``close_due_lots`` finds active lots
+whose end time has passed or whose idle countdown has run out and settles
+them with ``Lot.close_lot``. The due check travels into its claim UPDATE, so
+a lot is settled once even with several closers running, and a bid that
+lands right at the deadline keeps the lot open. Views and consumers only
+report lot state.
+
+It also runs each live lot's going once, going twice countdown. A bid
+stores when the countdown starts and when the lot closes
+(``Lot.arm_idle_timer``). When the countdown starts, ``start_countdowns``
+claims it and pushes one ``idle_countdown`` event with the absolute close
+time, so every viewer counts down to the same instant.
+
+``run`` is a deadline loop: after each sweep it sleeps until the next
+countdown start, idle close or end time, and at most
+``LOT_CLOSER_INTERVAL`` seconds so newly scheduled lots are noticed. While
+no bids arrive it does almost nothing. It runs in each ASGI worker's event
+loop (see ``AuctionHouse.asgi``) unless ``LOT_CLOSER_IN_PROCESS`` is off, in
+which case run ``manage.py run_lot_closer`` as its own process instead.
+"""
+import asyncio
+import threading
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import connections
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from bids import broadcast as lot_broadcast
+
+from .models import Lot
+
+
+# Never spin faster than this, even if a deadline is stuck in the past
+MIN_SLEEP = 0.2
+
+
+def _interval():
+    return getattr(settings, "LOT_CLOSER_INTERVAL", 5.0)
+
+
+def due_condition(now=None):
+    """Lots that should close at ``now``, as a filter (mirrors Lot.closing_state)"""
+    now = now or timezone.now()
+    own_end_time = Q(is_timed=True, end_time__isnull=False)
+    return (
+        (own_end_time & Q(end_time__lte=now))
+        | (~own_end_time & Q(auction__end_date__lte=now))
+        | Q(idle_close_at__lte=now)
+    )
+
+
+def close_due_lots(now=None):
+    """Close every lot that is due; returns the lots this call closed"""
+    condition = due_condition(now)
+    closed = []
+    for lot in Lot.objects.filter(condition, status="active").select_related("auction"):
+        try:
+            if lot.close_lot(condition=condition):
+                closed.append(lot)
+                print(f"[Closer] Lot {lot.pk} closed. Status: {lot.status}, Winner: {lot.winning_bidder}")
+        except Exception as e:
+            print(f"[Closer] Error closing lot {lot.pk}: {e}")
+    for lot in closed:
+        if lot.winning_bidder:
+            threading.Thread(target=notify_winner, args=(lot,), daemon=True).start()
+    return closed
+
+
+def notify_winner(lot):
+    """Generate the winner's invoice PDF and send the "you won" email"""
+    from bids.email_utils import send_winner_email
+    from bids.invoice_generator import generate_invoice
+
+    try:
+        invoice_path = generate_invoice(lot, lot.winning_bidder)
+        if invoice_path:
+            send_winner_email(lot, lot.winning_bidder, invoice_path)
+            print(f"[Email] Winner notification sent to {lot.winning_bidder.email}")
+        else:
+            print(f"[Email] Failed to generate invoice for lot {lot.pk}")
+    except Exception as e:
+        print(f"[Email] Error sending winner notification: {e}")
+    finally:
+        connections.close_all()
+
+
+def ended_event(lot):
+    return {
+        "type": "auction_ended",
+        "data": {
+            "winner": lot.winning_bidder.username if lot.winning_bidder else "No Winner",
+            "winning_bid": float(lot.current_bid),
+            "status": lot.status,
+        },
+    }
+
+
+def start_countdowns(now=None):
+    """Claim lots whose idle countdown has begun; returns the ones claimed here"""
+    now = now or timezone.now()
+    started = []
+    lots = Lot.objects.filter(
+        status="active", idle_timer_started=False,
+        idle_timer_start_time__lte=now, idle_close_at__gt=now,
+    ).select_related("auction")
+    for lot in lots:
+        # A bid since the query re-arms the timer with a later start
+        claimed = Lot.objects.filter(
+            pk=lot.pk, status="active", idle_timer_started=False,
+            idle_timer_start_time=lot.idle_timer_start_time,
+        ).update(idle_timer_started=True)
+        if claimed:
+            started.append(lot)
+    return started
+
+
+def next_deadline():
+    """Earliest moment an active lot needs the closer, or None"""
+    own_end_time = Q(is_timed=True, end_time__isnull=False)
+    deadlines = Lot.objects.filter(status="active").aggregate(
+        countdown=Min("idle_timer_start_time", filter=Q(idle_timer_started=False)),
+        idle=Min("idle_close_at"),
+        end=Min("end_time", filter=own_end_time),
+        auction_end=Min("auction__end_date", filter=~own_end_time),
+    )
+    pending = [d for d in deadlines.values() if d is not None]
+    return min(pending) if pending else None
+
+
+def sweep(now=None):
+    """One pass of the closer: ((lot id, websocket event) pairs, next deadline)"""
+    now = now or timezone.now()
+    events = [(lot.pk, ended_event(lot)) for lot in close_due_lots(now)]
+    for lot in start_countdowns(now):
+        data = lot.idle_countdown_data(now)
+        if data is not None:
+            events.append((lot.pk, {"type": "idle_countdown", "data": data}))
+    return events, next_deadline()
+
+
+async def broadcast(events):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    for lot_id, event in events:
+        await lot_broadcast.publish(lot_id, event, channel_layer)
+
+
+def seconds_until(deadline, max_sleep):
+    if deadline is None:
+        return max_sleep
+    return min(max(MIN_SLEEP, (deadline - timezone.now()).total_seconds()), max_sleep)
+
+
+async def run(max_sleep=None):
+    """Close due lots and start countdowns as their deadlines come (until cancelled)"""
+    max_sleep = max_sleep or _interval()
+    print(f"[Closer] Running (sleeping up to {max_sleep}s between deadlines)")
+    while True:
+        deadline = None
+        try:
+            events, deadline = await database_sync_to_async(sweep)()
+            await broadcast(events)
+        except Exception as e:
+            print(f"[Closer] CRITICAL ERROR: {e}")
+        await asyncio.sleep(seconds_until(deadline, max_sleep))
@@ -0,0 +1,259 @@
+"""
+Bulk item import for consignors.
+
+Rows are streamed from a CSV (header row) or JSON Lines file, validated,
+matched to a ``Catagory`` by name and written with ``bulk_create`` in chunks.
+Images are listed per row as file names (``;``-separated in CSV, a list in
+JSONL) inside an accompanying zip. They are read and hashed on the image
+worker pool, then stored through the deduplicating ``Home.images.store_upload``
+on the importing thread, which does all of the import's database work.
+
+Columns: title, category, estimated_value, description, condition,
+dimensions, weight, images. Only the first three are required.
+
+Used by ``python manage.py import_items`` and the "Import items" admin page.
+"""
+import csv
+import io
+import json
+import os
+import zipfile
+from collections import Counter
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F
+from django.utils.text import get_valid_filename
+
+from Home.images import describe, enqueue_items_images, get_executor, release, store_upload
+from Home.models import StoredImage
+from . import search
+from .models import Catagory, Item
+
+REQUIRED_FIELDS = ("title", "category", "estimated_value")
+OPTIONAL_FIELDS = ("description", "condition", "dimensions", "weight", "images")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp")
+READ_AHEAD = 16  # images unzipped and hashed ahead of the importing thread
+
+
+class ImportReport:
+    """Outcome of an import: counts plus one error per rejected row and field"""
+
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.rows = 0
+        self.created = 0
+        self.valid = 0
+        self.images = 0
+        self.errors = []
+
+    def add_error(self, line, field, message):
+        self.errors.append({"line": line, "field": field, "message": message})
+
+    @property
+    def rejected(self):
+        return len({error["line"] for error in self.errors})
+
+    def summary(self):
+        if self.dry_run:
+            return f"Dry run: {self.valid} of {self.rows} row(s) valid, {self.rejected} rejected"
+        return f"Imported {self.created} of {self.rows} row(s) with {self.images} image(s), {self.rejected} rejected"
+
+    def errors_csv(self):
+        out = io.StringIO()
+        writer = csv.DictWriter(out, fieldnames=["line", "field", "message"])
+        writer.writeheader()
+        writer.writerows(self.errors)
+        return out.getvalue()
+
+
+# ---------- READING ----------
+def iter_rows(fileobj, fmt):
+    """Yield (line number, row dict) from a binary CSV or JSONL file object"""
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    try:
+        if fmt == "csv":
+            reader = csv.DictReader(text)
+            for row in reader:
+                yield reader.line_num, {(k or "").strip().lower(): v for k, v in row.items()}
+        elif fmt == "jsonl":
+            for line, raw in enumerate(text, start=1):
+                if not raw.strip():
+                    continue
+                try:
+                    row = json.loads(raw)
+                except ValueError as e:
+                    yield line, e
+                    continue
+                yield line, row if isinstance(row, dict) else ValueError("expected a JSON object")
+        else:
+            raise ValueError(f"Unsupported import format: {fmt}")
+    finally:
+        text.detach()
+
+
+def detect_format(filename):
+    ext = os.path.splitext(filename or "")[1].lower()
+    return "jsonl" if ext in (".jsonl", ".ndjson") else "csv"
+
+
+# ---------- VALIDATION ----------
+def _blank(value):
+    return value is None or not str(value).strip()
+
+
+def _decimal(value):
+    if _blank(value):
+        return None
+    value = str(value).strip().replace(",", "")
+    number = Decimal(value)
+    if number < 0 or not number.is_finite():
+        raise InvalidOperation
+    return number
+
+
+def _image_names(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(";")
+    return [name.strip() for name in value if str(name).strip()]
+
+
+def build_item(line, row, owner, categories, archive_names, report):
+    """Validate one row; return (unsaved Item, image names) or None"""
+    before = len(report.errors)
+
+    for field in REQUIRED_FIELDS:
+        if _blank(row.get(field)):
+            report.add_error(line, field, "This field is required.")
+
+    title = str(row.get("title") or "").strip()
+    if len(title) > Item._meta.get_field("title").max_length:
+        report.add_error(line, "title", "Title is too long.")
+
+    category = None
+    category_name = str(row.get("category") or "").strip()
+    if category_name:
+        category = categories.get(category_name.lower())
+        if category is None:
+            report.add_error(line, "category", f'Unknown category "{category_name}".')
+
+    values = {}
+    for field in ("estimated_value", "weight"):
+        try:
+            values[field] = _decimal(row.get(field))
+        except (InvalidOperation, ValueError):
+            report.add_error(line, field, f'"{row.get(field)}" is not a valid non-negative number.')
+
+    images = _image_names(row.get("images"))
+    for name in images:
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            report.add_error(line, "images", f'"{name}" is not a supported image type.')
+        elif archive_names is None:
+            report.add_error(line, "images", "Row lists images but no image zip was supplied.")
+        elif name not in archive_names:
+            report.add_error(line, "images", f'"{name}" is not in the image zip.')
+
+    if len(report.errors) > before:
+        return None
+
+    item = Item(
+        owner=owner,
+        title=title,
+        item_catagory=category,
+        estimated_value=values["estimated_value"],
+        weight=values.get("weight"),
+        description=str(row.get("description") or ""),
+        condition=str(row.get("condition") or "")[:100],
+        dimensions=str(row.get("dimensions") or "")[:200],
+        status="Available",
+    )
+    return item, images
+
+
+# ---------- WRITING ----------
+def _read_image(archive, name):
+    """Unzip and hash one image (no database access; runs on the worker pool)"""
+    upload = ContentFile(archive.read(name), name=os.path.basename(name))
+    return upload, describe(upload)
+
+
+def _write_batch(batch, archive, report):
+    prefix = datetime.now().strftime("%Y%m%d_%H%M%S")
+    uses = Counter(name for _, images in batch for name in images)
+    names = sorted(uses)
+    stored = {}
+    taken = Counter()
+    try:
+        # A few images ahead at a time, so a batch's images are never all in memory
+        for start in range(0, len(names), READ_AHEAD):
+            chunk = names[start:start + READ_AHEAD]
+            for name, (upload, description) in zip(chunk, get_executor().map(lambda n: _read_image(archive, n), chunk)):
+                filename = f"item_images/{prefix}_{get_valid_filename(os.path.basename(name))}"
+                stored[name] = store_upload(upload, filename, description)
+                taken[stored[name]] += 1
+                # store_upload took one reference; each row using the image holds one
+                if uses[name] > 1:
+                    StoredImage.objects.filter(path=stored[name]).update(ref_count=F("ref_count") + uses[name] - 1)
+                    taken[stored[name]] += uses[name] - 1
+
+        items = []
+        for item, images in batch:
+            item.images = [stored[name] for name in images]
+            items.append(item)
+        Item.allocate_slugs(items)
+
+        with transaction.atomic():
+            Item.objects.bulk_create(items)
+            # bulk_create sends no post_save, so index and queue derivatives here
+            search.index_many(items)
+            image_items = [item.pk for item in items if item.images]
+            if image_items:
+                transaction.on_commit(lambda: enqueue_items_images(image_items))
+    except Exception:
+        # Nothing holds the references taken for this batch any more
+        for path in taken.elements():
+            release(path)
+        raise
+    report.images += len(names)
+    report.created += len(items)
+
+
+def import_items(fileobj, owner, fmt="csv", images_zip=None, dry_run=False, batch_size=500):
+    """Import items owned by ``owner`` from a binary CSV/JSONL file object.
+
+    ``images_zip`` is an optional path or file object of a zip holding the
+    images named by the rows. Invalid rows are skipped and reported; with
+    ``dry_run`` nothing is written. Returns an ImportReport.
+    """
+    report = ImportReport(dry_run=dry_run)
+    categories = {c.name.strip().lower(): c for c in Catagory.objects.all()}
+    archive = zipfile.ZipFile(images_zip) if images_zip else None
+    archive_names = set(archive.namelist()) if archive else None
+
+    try:
+        batch = []
+        for line, row in iter_rows(fileobj, fmt):
+            report.rows += 1
+            if isinstance(row, Exception):
+                report.add_error(line, "", f"Could not parse row: {row}")
+                continue
+            built = build_item(line, row, owner, categories, archive_names, report)
+            if built is None:
+                continue
+            report.valid += 1
+            if dry_run:
+                continue
+            batch.append(built)
+            if len(batch) >= batch_size:
+                _write_batch(batch, archive, report)
+                batch = []
+        if batch:
+            _write_batch(batch, archive, report)
+    finally:
+        if archive:
+            archive.close()
+    return report
@@ -0,0 +1,173 @@
+"""
+Set-based lot building.
+
+Moving items in and out of lots changes their status, and a lot's starting
+bid is the sum of its items' estimated values. Both are done here with one
+UPDATE per status transition and one grouped aggregate over the lot/item
+through table, so the cost does not grow with the number of items touched.
+
+Used by ``LotAdmin`` when a lot is saved and by the "Build lots" action on
+the item changelist.
+"""
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Max, Sum
+
+from Home import cache as home_cache
+from . import search
+from .models import Item, Lot
+from .stats import invalidate_status_counts
+
+OPEN_LOT_STATUSES = ("draft", "active")
+SPLIT_CHOICES = [
+    ("category", "One lot per category"),
+    ("value", "Per category, up to a target value per lot"),
+]
+
+
+# ---------- ITEM STATUS ----------
+def item_status_for(lot_status):
+    return "Sold" if lot_status == "sold" else "Lotted"
+
+
+def sync_item_statuses(lot, added_ids=(), removed_ids=(), old_status=None):
+    """Bring item statuses in line with a lot whose items or status changed"""
+    if added_ids:
+        Item.objects.filter(pk__in=added_ids).update(status=item_status_for(lot.status))
+
+    if removed_ids:
+        # Items still sitting in another lot keep their status
+        Item.objects.filter(pk__in=removed_ids).exclude(lots__isnull=False).update(status="Available")
+
+    if old_status != "sold" and lot.status == "sold":
+        Item.objects.filter(lots=lot).exclude(status="Sold").update(status="Sold")
+    elif old_status == "sold" and lot.status != "sold":
+        Item.objects.filter(lots=lot, status="Sold").update(status="Lotted")
+
+
+# ---------- STARTING BIDS ----------
+def starting_bid_totals(lot_ids):
+    """Sum of estimated item values per lot, in one grouped query"""
+    rows = (
+        Lot.items.through.objects.filter(lot_id__in=lot_ids)
+        .values("lot_id")
+        .annotate(total=Sum("item__estimated_value"))
+    )
+    return {row["lot_id"]: row["total"] or Decimal("0") for row in rows}
+
+
+def recalculate_starting_bids(lots):
+    """Set each lot's starting bid from its items; lots without items keep theirs"""
+    lots = list(lots)
+    totals = starting_bid_totals([lot.pk for lot in lots])
+    changed = []
+    for lot in lots:
+        if lot.pk in totals and lot.starting_bid != totals[lot.pk]:
+            lot.starting_bid = totals[lot.pk]
+            changed.append(lot)
+    if changed:
+        Lot.objects.bulk_update(changed, ["starting_bid"])
+    return changed
+
+
+# ---------- BULK BUILDING ----------
+def lottable_items(queryset):
+    """Items from ``queryset`` that are free to be put into a new lot"""
+    return (
+        queryset.filter(status="Available", item_catagory__isnull=False)
+        .exclude(lots__status__in=OPEN_LOT_STATUSES)
+        .select_related("item_catagory")
+        .order_by("item_catagory__name", "-estimated_value", "pk")
+    )
+
+
+def split_items(items, mode="category", max_items=None, target_value=None):
+    """Group items (ordered by category) into per-lot lists.
+
+    Every lot holds a single category. ``max_items`` caps the size of a lot;
+    in "value" mode a new lot is also started once adding the next item
+    would take the lot past ``target_value``.
+    """
+    by_category = OrderedDict()
+    for item in items:
+        by_category.setdefault(item.item_catagory, []).append(item)
+
+    groups = []
+    for category, members in by_category.items():
+        current, total = [], Decimal("0")
+        for item in members:
+            value = item.estimated_value or Decimal("0")
+            full = max_items and len(current) >= max_items
+            over = mode == "value" and target_value and current and total + value > target_value
+            if full or over:
+                groups.append((category, current))
+                current, total = [], Decimal("0")
+            current.append(item)
+            total += value
+        if current:
+            groups.append((category, current))
+    return groups
+
+
+def _lot_title(category, members, part, parts):
+    title = category.name if parts == 1 else f"{category.name} ({part} of {parts})"
+    if len(members) == 1:
+        title = members[0].title
+    return title[:Lot._meta.get_field("title").max_length]
+
+
+@transaction.atomic
+def build_lots(auction, items, mode="category", max_items=None, target_value=None):
+    """Create draft lots in ``auction`` from the lottable ``items`` queryset.
+
+    Lots are numbered after the auction's highest lot number. Returns the
+    list of created lots.
+    """
+    groups = split_items(lottable_items(items), mode, max_items, target_value)
+    if not groups:
+        return []
+
+    # A concurrent build reusing a number fails on unique (auction, lot_number)
+    next_number = (Lot.objects.filter(auction=auction).aggregate(top=Max("lot_number"))["top"] or 0) + 1
+
+    parts = {}
+    for category, _ in groups:
+        parts[category.pk] = parts.get(category.pk, 0) + 1
+
+    lots, seen = [], {}
+    for offset, (category, members) in enumerate(groups):
+        seen[category.pk] = seen.get(category.pk, 0) + 1
+        lots.append(Lot(
+            auction=auction,
+            lot_number=next_number + offset,
+            title=_lot_title(category, members, seen[category.pk], parts[category.pk]),
+            description="\n".join(item.title for item in members),
+            lot_catagory=category,
+            starting_bid=sum((item.estimated_value or Decimal("0") for item in members), Decimal("0")),
+            min_bid_increment=auction.min_bid_increment,
+        ))
+    Lot.objects.bulk_create(lots)
+
+    Through = Lot.items.through
+    Through.objects.bulk_create([
+        Through(lot_id=lot.pk, item_id=item.pk)
+        for lot, (_, members) in zip(lots, groups)
+        for item in members
+    ])
+    Item.objects.filter(
+        pk__in=[item.pk for _, members in groups for item in members]
+    ).update(status="Lotted")
+
+    # bulk_create sends no post_save or m2m_changed
+    invalidate_status_counts(Lot)
+    home_cache.invalidate(*home_cache.LOT_STATUS_BLOCKS)
+    search.index_many(
+        Lot.objects.filter(pk__in=[lot.pk for lot in lots])
+        .select_related("auction", "lot_catagory")
+        .prefetch_related("items")
+    )
+    search.index_instance(auction)
+    search.set_item_visibility(item.pk for _, members in groups for item in members)
+    return lots
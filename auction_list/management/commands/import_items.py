@@ -0,0 +1,42 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from auction_list.importer import detect_format, import_items
+
+
+class Command(BaseCommand):
+    help = "Bulk import consignor items from a CSV or JSON Lines file, with images from a zip"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV (with header row) or .jsonl file")
+        parser.add_argument("--owner", required=True, help="Username of the consignor who owns the items")
+        parser.add_argument("--images", metavar="ZIP", help="Zip archive holding the images named in the rows")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="Defaults to the file extension")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--dry-run", action="store_true", help="Validate every row without writing anything")
+        parser.add_argument("--report", metavar="CSV", help="Write the per-row error report to this file")
+
+    def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(username=options["owner"])
+        except User.DoesNotExist:
+            raise CommandError(f'No user named "{options["owner"]}"')
+
+        fmt = options["format"] or detect_format(options["path"])
+        with open(options["path"], "rb") as f:
+            report = import_items(
+                f, owner, fmt=fmt, images_zip=options["images"],
+                dry_run=options["dry_run"], batch_size=options["batch_size"],
+            )
+
+        for error in report.errors[:50]:
+            self.stdout.write(f"  line {error['line']}: {error['field'] or 'row'}: {error['message']}")
+        if len(report.errors) > 50:
+            self.stdout.write(f"  ... {len(report.errors) - 50} more")
+        if options["report"]:
+            with open(options["report"], "w", newline="") as f:
+                f.write(report.errors_csv())
+            self.stdout.write(f"Error report written to {options['report']}")
+
+        style = self.style.WARNING if report.errors else self.style.SUCCESS
+        self.stdout.write(style(report.summary()))
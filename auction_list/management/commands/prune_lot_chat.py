@@ -0,0 +1,66 @@
+import gzip
+import json
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from auction_list import chat
+from auction_list.models import Lot, LotChatMessage
+
+CLOSED_STATUSES = ("sold", "unsold")
+
+
+class Command(BaseCommand):
+    help = (
+        "Archive the chat of lots closed more than CHAT_RETENTION_DAYS ago "
+        "(one gzipped JSON-lines file per lot) and delete it from the database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=None, help="Retention in days (default CHAT_RETENTION_DAYS)")
+        parser.add_argument("--archive-dir", default=None, help="Where archives go (default CHAT_ARCHIVE_DIR)")
+        parser.add_argument("--no-archive", action="store_true", help="Delete without writing archives")
+        parser.add_argument("--dry-run", action="store_true", help="Report what would be pruned without touching anything")
+
+    def handle(self, *args, **options):
+        days = options["days"] if options["days"] is not None else getattr(settings, "CHAT_RETENTION_DAYS", 30)
+        archive_dir = str(options["archive_dir"] or getattr(settings, "CHAT_ARCHIVE_DIR", "chat_archive"))
+        cutoff = timezone.now() - timedelta(days=days)
+
+        lot_ids = list(
+            Lot.objects.filter(status__in=CLOSED_STATUSES, updated_at__lt=cutoff, chat_messages__isnull=False)
+            .values_list("pk", flat=True)
+            .distinct()
+        )
+        self.stdout.write(f"{len(lot_ids)} closed lot(s) with chat older than {days} day(s)")
+        if options["dry_run"] or not lot_ids:
+            return
+
+        # Nothing for these lots may still be sitting in the writer's queue
+        chat.writer.flush()
+        if not options["no_archive"]:
+            os.makedirs(archive_dir, exist_ok=True)
+
+        total = 0
+        for lot_id in lot_ids:
+            messages = LotChatMessage.objects.filter(lot_id=lot_id)
+            with transaction.atomic():
+                if not options["no_archive"]:
+                    self.archive(lot_id, messages, archive_dir)
+                deleted, _ = messages.delete()
+            chat.history.forget(lot_id)
+            total += deleted
+
+        self.stdout.write(self.style.SUCCESS(f"Pruned {total} message(s) from {len(lot_ids)} lot(s)"))
+
+    def archive(self, lot_id, messages, archive_dir):
+        path = os.path.join(archive_dir, f"lot_{lot_id}.jsonl.gz")
+        rows = messages.order_by("timestamp", "pk").values_list("user__username", "message", "timestamp")
+        # Appending keeps earlier archives of the same lot
+        with gzip.open(path, "at", encoding="utf-8") as archive:
+            for username, message, timestamp in rows.iterator(chunk_size=1000):
+                archive.write(json.dumps({"user": username, "message": message, "timestamp": timestamp.isoformat()}) + "\n")
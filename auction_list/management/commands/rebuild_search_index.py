@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from auction_list import search
+from auction_list.models import Auction, Item, Lot, SearchEntry
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index for auctions, lots and items"
+
+    def handle(self, *args, **options):
+        SearchEntry.objects.all().delete()
+
+        total = 0
+        total += search.index_many(Auction.objects.all())
+        total += search.index_many(Lot.objects.select_related("auction", "lot_catagory"))
+        total += search.index_many(Item.objects.select_related("item_catagory"))
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} search entries"))
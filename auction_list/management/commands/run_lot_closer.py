@@ -0,0 +1,27 @@
+import asyncio
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+
+from auction_list import closer
+
+
+class Command(BaseCommand):
+    help = "Close lots as they come due (for LOT_CLOSER_IN_PROCESS=0 deployments)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--max-sleep", type=float, help="Longest wait between sweeps (default LOT_CLOSER_INTERVAL)")
+        parser.add_argument("--once", action="store_true", help="Close the lots that are due now and exit")
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            events, _ = closer.sweep()
+            async_to_sync(closer.broadcast)(events)
+            closed = sum(event["type"] == "auction_ended" for _, event in events)
+            self.stdout.write(self.style.SUCCESS(f"Closed {closed} lot(s)"))
+            return
+
+        try:
+            asyncio.run(closer.run(options["max_sleep"]))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auction_list', '0012_invoice'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auction',
+            name='email_sent',
+            field=models.BooleanField(default=False, editable=False, help_text='Have registered bidders been emailed that the auction started?'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:20
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_bid_count(apps, schema_editor):
+    Lot = apps.get_model('auction_list', 'Lot')
+    Bid = apps.get_model('bids', 'Bid')
+    counts = (
+        Bid.objects.filter(lot=OuterRef('pk'))
+        .order_by()
+        .values('lot')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    Lot.objects.update(bid_count=Coalesce(Subquery(counts), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auction_list', '0013_auction_email_sent'),
+        ('bids', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lot',
+            name='bid_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of bids placed (maintained by Bid.save)'),
+        ),
+        migrations.AddIndex(
+            model_name='lot',
+            index=models.Index(fields=['status', '-bid_count'], name='auction_lis_status_a499f6_idx'),
+        ),
+        migrations.RunPython(backfill_bid_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,130 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:16
+
+from django.db import migrations, models
+from django.urls import reverse
+
+FTS_TABLE = 'auction_list_searchentry_fts'
+
+SQLITE_FORWARD = [
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        title, body, category,
+        content='auction_list_searchentry', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER auction_list_searchentry_ai AFTER INSERT ON auction_list_searchentry BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, body, category)
+        VALUES (new.id, new.title, new.body, new.category);
+    END""",
+    f"""CREATE TRIGGER auction_list_searchentry_ad AFTER DELETE ON auction_list_searchentry BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body, category)
+        VALUES ('delete', old.id, old.title, old.body, old.category);
+    END""",
+    f"""CREATE TRIGGER auction_list_searchentry_au AFTER UPDATE ON auction_list_searchentry BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body, category)
+        VALUES ('delete', old.id, old.title, old.body, old.category);
+        INSERT INTO {FTS_TABLE}(rowid, title, body, category)
+        VALUES (new.id, new.title, new.body, new.category);
+    END""",
+]
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS auction_list_searchentry_au",
+    "DROP TRIGGER IF EXISTS auction_list_searchentry_ad",
+    "DROP TRIGGER IF EXISTS auction_list_searchentry_ai",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+POSTGRES_FORWARD = [
+    """CREATE INDEX auction_list_searchentry_tsv ON auction_list_searchentry USING GIN ((
+        setweight(to_tsvector('simple', title), 'A') ||
+        setweight(to_tsvector('simple', category), 'B') ||
+        setweight(to_tsvector('simple', body), 'C')
+    ))""",
+]
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS auction_list_searchentry_tsv",
+]
+
+PUBLIC_AUCTION_STATUSES = ('approved', 'live', 'scheduled', 'completed')
+
+
+def _run(schema_editor, statements):
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def create_text_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        _run(schema_editor, SQLITE_FORWARD)
+    elif vendor == 'postgresql':
+        _run(schema_editor, POSTGRES_FORWARD)
+
+
+def drop_text_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        _run(schema_editor, SQLITE_BACKWARD)
+    elif vendor == 'postgresql':
+        _run(schema_editor, POSTGRES_BACKWARD)
+
+
+def backfill_entries(apps, schema_editor):
+    Auction = apps.get_model('auction_list', 'Auction')
+    Lot = apps.get_model('auction_list', 'Lot')
+    Item = apps.get_model('auction_list', 'Item')
+    SearchEntry = apps.get_model('auction_list', 'SearchEntry')
+
+    entries = []
+    for auction in Auction.objects.prefetch_related('lots__lot_catagory'):
+        categories = {lot.lot_catagory.name for lot in auction.lots.all() if lot.lot_catagory_id}
+        entries.append(SearchEntry(
+            kind='auction', object_id=auction.pk, title=auction.title, body=auction.description,
+            category=' '.join(sorted(categories)), url=reverse('auction_detail', args=[auction.pk]),
+            is_public=auction.status in PUBLIC_AUCTION_STATUSES,
+        ))
+    for lot in Lot.objects.select_related('auction', 'lot_catagory'):
+        entries.append(SearchEntry(
+            kind='lot', object_id=lot.pk, title=lot.title, body=lot.description,
+            category=lot.lot_catagory.name if lot.lot_catagory_id else '',
+            url=reverse('lot_detail', args=[lot.pk]),
+            is_public=lot.auction.status in PUBLIC_AUCTION_STATUSES,
+        ))
+    for item in Item.objects.select_related('item_catagory'):
+        entries.append(SearchEntry(
+            kind='item', object_id=item.pk, title=item.title, body=item.description,
+            category=item.item_catagory.name if item.item_catagory_id else '',
+            url=reverse('item_detail', args=[item.pk, item.slug]) if item.slug else '',
+            image=item.images[0] if item.images else '',
+        ))
+    SearchEntry.objects.bulk_create(entries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auction_list', '0014_lot_bid_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('auction', 'Auction'), ('lot', 'Lot'), ('item', 'Item')], max_length=10)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('title', models.CharField(max_length=255)),
+                ('body', models.TextField(blank=True)),
+                ('category', models.CharField(blank=True, max_length=255)),
+                ('url', models.CharField(max_length=255)),
+                ('image', models.CharField(blank=True, max_length=255)),
+                ('is_public', models.BooleanField(default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Search entries',
+                'unique_together': {('kind', 'object_id')},
+            },
+        ),
+        migrations.RunPython(create_text_index, drop_text_index),
+        migrations.RunPython(backfill_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auction_list', '0016_item_image_derivatives'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['item_catagory', 'status', 'title'], name='auction_lis_item_ca_13b716_idx'),
+        ),
+    ]
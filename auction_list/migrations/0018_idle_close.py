@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:08
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def arm_active_lots(apps, schema_editor):
+    """Give lots already being bid on the deadlines the old hardcoded 15s + 5s implied"""
+    Lot = apps.get_model('auction_list', 'Lot')
+    lots = list(Lot.objects.filter(status='active', last_bid_time__isnull=False))
+    for lot in lots:
+        lot.idle_timer_started = False
+        lot.idle_timer_start_time = lot.last_bid_time + timedelta(seconds=15)
+        lot.idle_close_at = lot.idle_timer_start_time + timedelta(seconds=5)
+    Lot.objects.bulk_update(lots, ['idle_timer_started', 'idle_timer_start_time', 'idle_close_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auction_list', '0017_item_picker_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auction',
+            name='idle_countdown',
+            field=models.PositiveIntegerField(default=5, help_text='Length of the going once, going twice countdown in seconds'),
+        ),
+        migrations.AddField(
+            model_name='auction',
+            name='idle_timeout',
+            field=models.PositiveIntegerField(default=15, help_text="Seconds without a bid before a lot's closing countdown starts (0 turns idle closing off)"),
+        ),
+        migrations.AddField(
+            model_name='lot',
+            name='idle_close_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='When the lot closes unless someone bids', null=True),
+        ),
+        migrations.AlterField(
+            model_name='lot',
+            name='idle_timer_start_time',
+            field=models.DateTimeField(blank=True, help_text='When the closing countdown starts', null=True),
+        ),
+        migrations.AlterField(
+            model_name='lot',
+            name='idle_timer_started',
+            field=models.BooleanField(default=False, help_text='Has the closing countdown been announced?'),
+        ),
+        migrations.AddIndex(
+            model_name='lot',
+            index=models.Index(fields=['status', 'idle_close_at'], name='auction_lis_status_148437_idx'),
+        ),
+        migrations.RunPython(arm_active_lots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:14
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auction_list', '0018_idle_close'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='lotchatmessage',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='lotchatmessage',
+            index=models.Index(fields=['lot', 'timestamp'], name='auction_lis_lot_id_625a9e_idx'),
+        ),
+    ]
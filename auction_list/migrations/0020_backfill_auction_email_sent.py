@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:40
+
+from django.db import migrations
+
+
+def mark_started_auctions_emailed(apps, schema_editor):
+    """Auctions that had already started before email_sent existed have sent
+    their "Auction Started" email; without this their next save re-sends it"""
+    Auction = apps.get_model('auction_list', 'Auction')
+    Auction.objects.exclude(status__in=['draft', 'pending', 'approved', 'scheduled']).update(email_sent=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auction_list', '0019_chat_pipeline'),
+    ]
+
+    operations = [
+        migrations.RunPython(mark_started_auctions_emailed, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:05
+
+from django.db import migrations
+
+
+def hide_unlotted_items(apps, schema_editor):
+    """Item entries were indexed as public whatever their lotting"""
+    SearchEntry = apps.get_model('auction_list', 'SearchEntry')
+    Through = apps.get_model('auction_list', 'Lot').items.through
+    public = Through.objects.filter(
+        lot__auction__status__in=['approved', 'live', 'scheduled', 'completed']
+    ).values('item_id')
+    SearchEntry.objects.filter(kind='item').exclude(object_id__in=public).update(is_public=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auction_list', '0020_backfill_auction_email_sent'),
+    ]
+
+    operations = [
+        migrations.RunPython(hide_unlotted_items, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:30
+
+from django.db import migrations
+
+
+def normalise_item_status(apps, schema_editor):
+    """Admin actions used to write "available"/"sold" instead of the choice values"""
+    Item = apps.get_model('auction_list', 'Item')
+    for status in ('Available', 'Lotted', 'Sold'):
+        Item.objects.filter(status__iexact=status).exclude(status=status).update(status=status)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auction_list', '0021_hide_unlotted_items_from_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalise_item_status, migrations.RunPython.noop),
+    ]
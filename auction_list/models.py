@@ -2,18 +2,24 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.exceptions import ValidationError
+from django.utils.functional import cached_property
 from django.utils.text import slugify
 from decimal import Decimal
-from django.db import transaction
-from django.core.mail import EmailMultiAlternatives
+from datetime import timedelta
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Q
+from django.core.mail import EmailMessage, EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.conf import settings
+from AuctionHouse.mail import send_messages
 from io import BytesIO
 from xhtml2pdf import pisa
 import uuid
 import threading
 
+SLUG_BASE_LENGTH = 42
+
 class Catagory(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
@@ -36,7 +42,7 @@ class Catagory(models.Model):
     @property
     def available_items(self):
         """Get available items in this category"""
-        return self.item_set.filter(status='available').count()
+        return self.item_set.filter(status='Available').count()
 
 class Item(models.Model):
     title = models.CharField(max_length=200)
@@ -44,6 +50,8 @@ class Item(models.Model):
     item_catagory = models.ForeignKey('Catagory', on_delete=models.CASCADE, null=True, blank=True)
     estimated_value = models.DecimalField(max_digits=10, decimal_places=2)
     images = models.JSONField(default=list, blank=True, help_text="List of image file paths")
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False,
+                                         help_text="Resized WebP/JPEG copies keyed by original path")
     slug = models.SlugField(blank=True,unique=True)
 
     # Detailed description
@@ -68,25 +76,98 @@ class Item(models.Model):
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['status', 'item_catagory']),
+            # Lot admin item picker: filter by category and status, ordered by title
+            models.Index(fields=['item_catagory', 'status', 'title']),
         ]
     
     def __str__(self):
         return f"{self.title} - ₹{self.estimated_value} ({self.get_status_display()})"
     
     def save(self, *args, **kwargs):
-        if not self.slug:
+        if self.slug:
+            return super().save(*args, **kwargs)
+
+        # Two concurrent saves can pick the same slug; the loser retries
+        for attempt in range(3):
             self.slug = self.generate_unique_slug()
-        super().save(*args, **kwargs)
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                if attempt == 2 or not Item.objects.filter(slug=self.slug).exists():
+                    raise
+
+    @staticmethod
+    def base_slug(title):
+        # Leave room for a "-<n>" suffix within the column length
+        return slugify(title)[:SLUG_BASE_LENGTH].strip("-") or "item"
+
+    @staticmethod
+    def _next_suffix(base_slug):
+        """Next free numeric suffix for ``base_slug`` (0 = the bare slug is
+        free), from one prefix query over "<base>" and "<base>-..."."""
+        # Plain LIKE prefix match; a regex lookup runs a Python callback per row on SQLite
+        taken = Item.objects.filter(
+            Q(slug=base_slug) | Q(slug__startswith=f"{base_slug}-")
+        ).values_list("slug", flat=True)
+        highest = -1
+        for slug in taken:
+            rest = slug[len(base_slug) + 1:]
+            if slug == base_slug:
+                highest = max(highest, 0)
+            # Skips longer titles sharing the prefix, e.g. "watch-strap"
+            elif rest.isascii() and rest.isdigit():
+                highest = max(highest, int(rest))
+        return highest + 1
 
     def generate_unique_slug(self):
-        base_slug = slugify(self.title)
-        slug = base_slug
-        num = 1
-        while Item.objects.filter(slug=slug).exists():
-            slug = f"{base_slug}-{num}"
-            num += 1
-        return slug
-    
+        base_slug = self.base_slug(self.title)
+        num = self._next_suffix(base_slug)
+        return f"{base_slug}-{num}" if num else base_slug
+
+    @classmethod
+    def allocate_slugs(cls, items):
+        """Assign unique slugs to unsaved items in memory, with one query per
+        distinct title, so they can go through bulk_create."""
+        counters = {}
+        allocated = set()
+        for item in items:
+            if item.slug:
+                continue
+            base_slug = cls.base_slug(item.title)
+            if base_slug not in counters:
+                counters[base_slug] = cls._next_suffix(base_slug)
+            num = counters[base_slug]
+            # "Watch 2" and the second "Watch" would both want "watch-2"
+            while (slug := f"{base_slug}-{num}" if num else base_slug) in allocated:
+                num += 1
+            item.slug = slug
+            allocated.add(slug)
+            counters[base_slug] = num + 1
+        return items
+
+    @property
+    def image_set(self):
+        """Per image: {"original", "thumb", "medium", "full"}, where each size maps
+        to {"webp", "jpeg"} paths. Sizes fall back to the original (jpeg only)
+        until the derivatives have been built."""
+        from Home.images import derivative_sizes
+
+        derivatives = self.image_derivatives or {}
+        images = []
+        for path in self.images or []:
+            built = derivatives.get(path, {})
+            entry = {"original": path}
+            for size in derivative_sizes():
+                entry[size] = built.get(size) or {"webp": None, "jpeg": path}
+            images.append(entry)
+        return images
+
+    @property
+    def cover(self):
+        """First entry of image_set, or None"""
+        images = self.image_set
+        return images[0] if images else None
 
     @property
     def current_lot(self):
@@ -133,10 +214,20 @@ class Auction(models.Model):
     buyer_premium_percentage = models.DecimalField(max_digits=5, decimal_places=2, default=0.00)
     min_bid_increment = models.DecimalField(max_digits=10, decimal_places=2, default=100.00)
     
+    # Going once, going twice: closing live lots after a quiet spell
+    idle_timeout = models.PositiveIntegerField(default=15,
+                                               help_text="Seconds without a bid before a lot's closing countdown starts (0 turns idle closing off)")
+    idle_countdown = models.PositiveIntegerField(default=5,
+                                                 help_text="Length of the going once, going twice countdown in seconds")
+    
     # Additional Info
     location = models.CharField(max_length=255, blank=True)
     terms_and_conditions = models.TextField(blank=True)
     
+    # Notifications
+    email_sent = models.BooleanField(default=False, editable=False,
+                                     help_text="Have registered bidders been emailed that the auction started?")
+    
     class Meta:
         ordering = ['-created_at']
         indexes = [
@@ -166,28 +257,42 @@ class Auction(models.Model):
         if self.status == 'approved' and not self.approved_at:
             self.approved_at = timezone.now()
         
+        # email_sent only goes False -> True, through the notification claim's
+        # conditional UPDATE (signals.py). An instance loaded before the claim
+        # still holds False and would write it back, so the next save to live
+        # would email everyone again; such saves leave the column alone.
+        # Instances that hold True (or are new) save normally.
+        if not self._state.adding and not self.email_sent:
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                update_fields = [f.name for f in self._meta.concrete_fields if not f.primary_key]
+            kwargs['update_fields'] = [name for name in update_fields if name != 'email_sent']
+        
         super().save(*args, **kwargs)
     
+    def scheduled_status(self, now=None):
+        """Status the auction's dates call for (no side effects)"""
+        now = now or timezone.now()
+        if self.auction_type == 'scheduled' and self.start_date and self.end_date:
+            if now < self.start_date:
+                return 'scheduled'
+            elif now <= self.end_date:
+                return 'live'
+            return 'completed'
+        # Without dates (or manual auctions) the status only changes by hand
+        return self.status
+
     def update_auction_status(self):
         """Update auction status based on current time"""
-        now = timezone.now()
         old_status = self.status
-        
-        if self.auction_type == 'scheduled' and self.start_date and self.end_date:
-            if now < self.start_date:
-                self.status = 'scheduled'
-            elif self.start_date <= now <= self.end_date:
-                self.status = 'live'
-            elif now > self.end_date:
-                self.status = 'completed'
-        elif self.status == 'approved' and not self.start_date:
-            # If no start date, it's ready to go live manually
-            self.status = 'approved'
+        self.status = self.scheduled_status()
         
         # Sync Lot Status
         if old_status != 'live' and self.status == 'live':
             # Auction just went live, activate all draft lots
-            self.lots.filter(status='draft').update(status='active')
+            if self.lots.filter(status='draft').update(status='active'):
+                from .stats import invalidate_status_counts
+                invalidate_status_counts(Lot)
             
         # If auction just completed, mark unsold lots and items
         if old_status != 'completed' and self.status == 'completed':
@@ -228,7 +333,7 @@ class Auction(models.Model):
                 
                 # Mark all items in this lot as available
                 for item in lot.items.all():
-                    if item.status != 'sold':
+                    if item.status != 'Sold':
                         item.status = 'Available'
                         item.save(update_fields=['status'])
     
@@ -302,6 +407,9 @@ class Lot(models.Model):
         ('unsold', 'Unsold'),
     ]
     
+    # Written together whenever a bid restarts the idle timer
+    IDLE_FIELDS = ['last_bid_time', 'idle_timer_started', 'idle_timer_start_time', 'idle_close_at']
+    
     # Core Information
     auction = models.ForeignKey('Auction', on_delete=models.CASCADE, related_name='lots')
     lot_number = models.IntegerField()  # Sequential number within auction
@@ -317,6 +425,8 @@ class Lot(models.Model):
     reserve_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, 
                                        help_text="Minimum price for sale (optional)")
     current_bid = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    bid_count = models.PositiveIntegerField(default=0, editable=False,
+                                            help_text="Number of bids placed (maintained by Bid.save)")
     
     # Status & Winner
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='draft')
@@ -327,8 +437,10 @@ class Lot(models.Model):
     is_timed = models.BooleanField(default=False, help_text="Is this a timed auction lot?")
     end_time = models.DateTimeField(null=True, blank=True, help_text="When the timed auction ends")
     last_bid_time = models.DateTimeField(null=True, blank=True, help_text="Time of last bid")
-    idle_timer_started = models.BooleanField(default=False, help_text="Has the idle timer started?")
-    idle_timer_start_time = models.DateTimeField(null=True, blank=True, help_text="When idle timer started")
+    idle_timer_started = models.BooleanField(default=False, help_text="Has the closing countdown been announced?")
+    idle_timer_start_time = models.DateTimeField(null=True, blank=True, help_text="When the closing countdown starts")
+    idle_close_at = models.DateTimeField(null=True, blank=True, editable=False,
+                                         help_text="When the lot closes unless someone bids")
     min_bid_increment = models.DecimalField(max_digits=10, decimal_places=2, default=100.00, 
                                            help_text="Minimum bid increment")
 
@@ -345,6 +457,8 @@ class Lot(models.Model):
         indexes = [
             models.Index(fields=['auction', 'status']),
             models.Index(fields=['lot_number']),
+            models.Index(fields=['status', '-bid_count']),
+            models.Index(fields=['status', 'idle_close_at']),
         ]
     
     def __str__(self):
@@ -356,21 +470,21 @@ class Lot(models.Model):
 
     @classmethod
     def all_status_count(cls):
-        data={}
-        for key,label in cls.STATUS_CHOICES:
-            data[key]=cls.objects.filter(status = key).count()
-        return data
+        """Lot count per status (one cached GROUP BY query)"""
+        from .stats import cached_status_counts
+        return cached_status_counts(cls.objects.all())
     
-    @property
+    @cached_property
     def recent_bids(self):
-        """Get recent bids for initial template render"""
-        return self.bids.filter(lot=self).select_related('user').order_by('-timestamp')[:20]
+        """Recent bid frames (newest first) for the initial template render"""
+        from bids import history
+        return history.for_display(self.pk)
 
     def get_minimum_bid(self):
         """Get the minimum bid amount for this lot"""
         if self.current_bid > 0:
             increment = Decimal(str(self.min_bid_increment))
-            bid_count = self.bids.count()
+            bid_count = self.bid_count
             
             # Tier-based increment system
             if bid_count >= 20:
@@ -390,7 +504,7 @@ class Lot(models.Model):
         
         # Use same tiered logic if bids exist
         if self.current_bid > 0:
-            bid_count = self.bids.count()
+            bid_count = self.bid_count
             if bid_count >= 20:
                 increment = increment * Decimal("1.3")
             elif bid_count >= 10:
@@ -428,22 +542,100 @@ class Lot(models.Model):
                 return remaining
         return None
     
-    def close_lot(self):
-        """Close the lot, determine winner, and distribute funds"""
+    def arm_idle_timer(self, now=None):
+        """Restart the going once, going twice timer (a bid was just placed)"""
+        now = now or timezone.now()
+        auction = self.auction
+        self.last_bid_time = now
+        self.idle_timer_started = False
+        if auction.idle_timeout:
+            self.idle_timer_start_time = now + timedelta(seconds=auction.idle_timeout)
+            self.idle_close_at = self.idle_timer_start_time + timedelta(seconds=auction.idle_countdown)
+        else:
+            self.idle_timer_start_time = self.idle_close_at = None
 
+    def closing_state(self, now=None):
+        """Return (due, countdown) for an active lot.
 
+        ``due`` is True once the lot should be closed: its end time has
+        passed, or its idle countdown has run out. ``countdown`` is the
+        seconds left of the idle countdown, if running.
+        """
         if self.status != 'active':
-            return False
+            return False, None
+        now = now or timezone.now()
+        if self.is_timed and self.end_time:
+            if now >= self.end_time:
+                return True, None
+        elif self.auction.end_date and now >= self.auction.end_date:
+            return True, None
+        if self.idle_close_at:
+            if now >= self.idle_close_at:
+                return True, None
+            if self.idle_timer_start_time and now >= self.idle_timer_start_time:
+                return False, (self.idle_close_at - now).total_seconds()
+        return False, None
+
+    def idle_countdown_data(self, now=None):
+        """The running idle countdown as pushed to clients, or None"""
+        now = now or timezone.now()
+        countdown = self.closing_state(now)[1]
+        if countdown is None:
+            return None
+        duration = (self.idle_close_at - self.idle_timer_start_time).total_seconds()
+        return {
+            'phase': 'going_once' if countdown > duration / 2 else 'going_twice',
+            'countdown': countdown,
+            'duration': duration,
+            'closes_at': self.idle_close_at.isoformat(),
+            'server_time': now.isoformat(),
+        }
+
+    def summary(self, now=None):
+        """Compact lot state streamed to auction pages (needs auction and winning_bidder)"""
+        now = now or timezone.now()
+        remaining = []
+        if self.status == 'active':
+            time_remaining = self.get_time_remaining()
+            if time_remaining:
+                remaining.append(time_remaining.total_seconds())
+            if self.idle_close_at:
+                remaining.append(max((self.idle_close_at - now).total_seconds(), 0))
+        return {
+            'id': self.pk,
+            'status': self.status,
+            'current_bid': float(self.current_bid),
+            'leader': self.winning_bidder.username if self.winning_bidder_id else None,
+            'bid_count': self.bid_count,
+            'time_remaining': min(remaining) if remaining else None,
+        }
 
+    def close_lot(self, condition=None):
+        """Close the lot, determine winner, and distribute funds.
+
+        The lot is claimed with a conditional UPDATE (still active, and
+        ``condition`` if given), so it is settled once however many callers
+        race for it. Returns False if someone else got there first.
+        """
+        from bids import broadcast as lot_broadcast
         from bids.models import Bid, Wallet, AdminWallet  # Import locally to avoid circular import
 
         with transaction.atomic():
+            # The claim: 'unsold' until a winner is found below. It also
+            # stops place_bid, which only accepts bids on active lots
+            claim = Lot.objects.filter(pk=self.pk, status='active')
+            if condition is not None:
+                claim = claim.filter(condition)
+            if not claim.update(status='unsold', updated_at=timezone.now()):
+                return False
+            
             # Find high bidder from Bids
-            highest_bid = Bid.objects.filter(lot=self).order_by('-amount').first()
+            highest_bid = Bid.objects.filter(lot=self).select_related('user').order_by('-amount').first()
             
             if highest_bid:
                 self.status = 'sold'
                 self.winning_bidder = highest_bid.user
+                self.current_bid = highest_bid.amount
                 highest_bid.is_winning = True 
                 highest_bid.save()
                 
@@ -493,9 +685,11 @@ class Lot(models.Model):
                             status='paid' 
                         )
                         
-                        # Spawn background thread for PDF & Email
-                        threading.Thread(target=send_invoice_email_task, args=(invoice.id,)).start()
-                        print(f"Started async invoice email task for Invoice #{invoice.id}")
+                        # Spawn background thread for PDF & Email once the sale is committed
+                        transaction.on_commit(
+                            lambda: threading.Thread(target=send_invoice_email_task, args=(invoice.id,)).start()
+                        )
+                        print(f"Queued async invoice email task for Invoice #{invoice.id}")
 
                 except Exception as e:
                     print(f"Error creating invoice object: {e}")
@@ -507,7 +701,9 @@ class Lot(models.Model):
             else:
                 self.status = 'unsold'
                 
-            self.save()
+            self.save(update_fields=['status', 'winning_bidder', 'current_bid', 'updated_at'])
+            lot_id = self.pk
+            transaction.on_commit(lambda: lot_broadcast.lot_changed(lot_id))
             return True
 
 
@@ -532,10 +728,14 @@ class LotChatMessage(models.Model):
     lot = models.ForeignKey('Lot', on_delete=models.CASCADE, related_name='chat_messages')
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     message = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when posted, not when the chat writer's batch is inserted
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            models.Index(fields=['lot', 'timestamp']),
+        ]
         
     def __str__(self):
         return f"{self.user.username}: {self.message[:20]}"
@@ -560,6 +760,32 @@ class Invoice(models.Model):
         return f"Invoice #{self.invoice_number} - {self.user.username}"
 
 
+class SearchEntry(models.Model):
+    """Denormalised searchable text for an Auction, Lot or Item (see search.py)"""
+    KIND_CHOICES = [
+        ('auction', 'Auction'),
+        ('lot', 'Lot'),
+        ('item', 'Item'),
+    ]
+    
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    title = models.CharField(max_length=255)
+    body = models.TextField(blank=True)
+    category = models.CharField(max_length=255, blank=True)
+    url = models.CharField(max_length=255)
+    image = models.CharField(max_length=255, blank=True)
+    is_public = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['kind', 'object_id']
+        verbose_name_plural = "Search entries"
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.object_id}: {self.title}"
+
+
 def send_invoice_email_task(invoice_id):
     """Background task to generate PDF and send invoice email"""
     try:
@@ -618,8 +844,91 @@ def send_invoice_email_task(invoice_id):
         else:
             print(f"Skipping PDF attachment due to error")
             
-        email.send(fail_silently=True)
+        send_messages([email], fail_silently=True)
         print(f"[Async] Invoice email sent to {invoice.user.email}")
         
     except Exception as e:
         print(f"[Async Error] Failed to send invoice email: {e}")
+
+
+def send_auction_started_emails(auction_id):
+    """Background task to tell every registered bidder that an auction is live"""
+    try:
+        auction = Auction.objects.get(id=auction_id)
+        batch_size = getattr(settings, 'EMAIL_BATCH_SIZE', 50)
+        
+        subject = f"Auction Started: {auction.title}"
+        message = (
+            f"The auction '{auction.title}' has started!\n\n"
+            "Login now and start bidding on the lots."
+        )
+        
+        recipients = (
+            AuctionRegister.objects.filter(auction_id=auction_id)
+            .exclude(user__email='')
+            .values_list('user__email', flat=True)
+            .distinct()
+        )
+        
+        # One message per bidder (no shared To: list), sent in batches
+        sent = 0
+        batch = []
+        for email in recipients.iterator(chunk_size=batch_size):
+            batch.append(EmailMessage(subject, message, settings.DEFAULT_FROM_EMAIL, [email]))
+            if len(batch) >= batch_size:
+                sent += send_messages(batch, fail_silently=True)
+                batch = []
+        if batch:
+            sent += send_messages(batch, fail_silently=True)
+        
+        print(f"[Async] Auction started email sent to {sent} bidder(s) for Auction #{auction_id}")
+        
+    except Exception as e:
+        print(f"[Async Error] Failed to send auction started emails: {e}")
+
+
+def enqueue_auction_started_emails(auction_id):
+    """Spawn the bulk "auction started" notification job"""
+    threading.Thread(target=send_auction_started_emails, args=(auction_id,), daemon=True).start()
+
+
+# ---------- BACKGROUND STATUS TRANSITIONS ----------
+# Polling views must not block on moving an auction along; they hand the
+# work to a thread here. A transition already in flight in this process is
+# not started twice. (Lots are closed by the lot closer, see closer.py.)
+_transitions = set()
+_transitions_lock = threading.Lock()
+
+
+def _run_transition(key, task, *args):
+    try:
+        task(*args)
+    except Exception as e:
+        print(f"[Async Error] {key[0]} #{key[1]} failed: {e}")
+    finally:
+        with _transitions_lock:
+            _transitions.discard(key)
+        connections.close_all()
+
+
+def _enqueue_transition(key, task, *args):
+    with _transitions_lock:
+        if key in _transitions:
+            return False
+        _transitions.add(key)
+    threading.Thread(target=_run_transition, args=(key, task, *args), daemon=True).start()
+    return True
+
+
+def refresh_auction_status_task(auction_id):
+    auction = Auction.objects.get(id=auction_id)
+    old_status = auction.status
+    auction.update_auction_status()
+    if auction.status != old_status:
+        auction.save()
+        print(f"[Async] Auction #{auction_id} is now {auction.status}")
+
+
+def enqueue_auction_status_refresh(auction_id):
+    """Apply the auction's date-driven status change in the background"""
+    return _enqueue_transition(('auction_status', auction_id), refresh_auction_status_task, auction_id)
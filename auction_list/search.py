@@ -0,0 +1,238 @@
+"""
+Full-text search over auctions, lots and items.
+
+Searchable text is denormalised into ``SearchEntry`` rows that the signals in
+``auction_list.signals`` keep current on save/delete. Auctions are public once
+approved; lots and items only while they are lotted in a public auction. On SQLite the rows are
+matched through an FTS5 external-content table, on Postgres through a
+GIN-indexed tsvector expression (both created by migration 0015). Any other
+backend falls back to ``icontains``.
+
+Rebuild everything with ``python manage.py rebuild_search_index``.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.urls import reverse
+
+PUBLIC_AUCTION_STATUSES = ("approved", "live", "scheduled", "completed")
+
+FTS_TABLE = "auction_list_searchentry_fts"
+PG_VECTOR = (
+    "setweight(to_tsvector('simple', title), 'A') || "
+    "setweight(to_tsvector('simple', category), 'B') || "
+    "setweight(to_tsvector('simple', body), 'C')"
+)
+
+MAX_TOKENS = 8
+# SearchEntry.category's max_length; an auction lists every lot's category
+MAX_CATEGORY_LENGTH = 255
+
+
+def _tokens(query):
+    return re.findall(r"\w+", (query or "").lower())[:MAX_TOKENS]
+
+
+# ---------- INDEXING ----------
+def _public_item_ids(item_ids):
+    """Those of ``item_ids`` lotted in at least one public auction"""
+    from .models import Lot
+
+    return set(
+        Lot.items.through.objects.filter(
+            item_id__in=item_ids, lot__auction__status__in=PUBLIC_AUCTION_STATUSES
+        ).values_list("item_id", flat=True)
+    )
+
+
+def _document(instance, public_items=None):
+    """Return (kind, fields) describing a model instance's search entry.
+
+    ``public_items`` saves a query per Item when the caller already knows
+    which items are public.
+    """
+    from .models import Auction, Catagory, Item, Lot
+
+    if isinstance(instance, Auction):
+        categories = Catagory.objects.filter(lot__auction=instance).values_list("name", flat=True).distinct()
+        return "auction", {
+            "title": instance.title,
+            "body": instance.description,
+            "category": " ".join(categories)[:MAX_CATEGORY_LENGTH].strip(),
+            "url": reverse("auction_detail", args=[instance.pk]),
+            "image": "",
+            "is_public": instance.status in PUBLIC_AUCTION_STATUSES,
+        }
+
+    if isinstance(instance, Lot):
+        # Sliced rather than first() so a prefetched "items" is reused
+        first_item = next(iter(instance.items.all()[:1]), None) if instance.pk else None
+        return "lot", {
+            "title": instance.title,
+            "body": instance.description,
+            "category": instance.lot_catagory.name if instance.lot_catagory_id else "",
+            "url": reverse("lot_detail", args=[instance.pk]),
+            "image": first_item.cover["thumb"]["jpeg"] if first_item and first_item.images else "",
+            "is_public": instance.auction.status in PUBLIC_AUCTION_STATUSES,
+        }
+
+    if isinstance(instance, Item):
+        if public_items is None:
+            public_items = _public_item_ids([instance.pk]) if instance.pk else set()
+        return "item", {
+            "title": instance.title,
+            "body": instance.description,
+            "category": instance.item_catagory.name if instance.item_catagory_id else "",
+            "url": reverse("item_detail", args=[instance.pk, instance.slug]) if instance.slug else "",
+            "image": instance.cover["thumb"]["jpeg"] if instance.images else "",
+            "is_public": instance.pk in public_items,
+        }
+
+    raise TypeError(f"{type(instance).__name__} is not searchable")
+
+
+def index_instance(instance):
+    """Create or refresh the search entry for an Auction, Lot or Item"""
+    from .models import SearchEntry
+
+    kind, fields = _document(instance)
+    SearchEntry.objects.update_or_create(kind=kind, object_id=instance.pk, defaults=fields)
+
+
+def index_many(instances, batch_size=500):
+    """Re-index many instances of one model with bulk writes"""
+    from .models import Item, SearchEntry
+
+    instances = list(instances)
+    public_items = None
+    if instances and isinstance(instances[0], Item):
+        public_items = _public_item_ids([instance.pk for instance in instances])
+    entries = []
+    for instance in instances:
+        kind, fields = _document(instance, public_items)
+        entries.append(SearchEntry(kind=kind, object_id=instance.pk, **fields))
+    for start in range(0, len(entries), batch_size):
+        batch = entries[start:start + batch_size]
+        SearchEntry.objects.filter(kind=batch[0].kind, object_id__in=[e.object_id for e in batch]).delete()
+        SearchEntry.objects.bulk_create(batch)
+    return len(entries)
+
+
+def remove_instance(instance):
+    from .models import SearchEntry
+
+    kind = instance._meta.model_name
+    SearchEntry.objects.filter(kind=kind, object_id=instance.pk).delete()
+
+
+def set_auction_visibility(auction):
+    """Propagate an auction's public/private status to its lots' and items' entries"""
+    from .models import Lot, SearchEntry
+
+    SearchEntry.objects.filter(
+        kind="lot", object_id__in=auction.lots.values("id")
+    ).update(is_public=auction.status in PUBLIC_AUCTION_STATUSES)
+    set_item_visibility(Lot.items.through.objects.filter(lot__auction=auction).values_list("item_id", flat=True))
+
+
+def set_item_visibility(item_ids):
+    """Recompute whether the items' entries are public (after lotting changes)"""
+    from .models import SearchEntry
+
+    item_ids = set(item_ids)
+    if not item_ids:
+        return
+    public = _public_item_ids(item_ids)
+    entries = SearchEntry.objects.filter(kind="item")
+    entries.filter(object_id__in=public).update(is_public=True)
+    entries.filter(object_id__in=item_ids - public).update(is_public=False)
+
+
+# ---------- QUERYING ----------
+def search(query, kinds=None, limit=10, public_only=True):
+    """Return SearchEntry rows matching every word of ``query`` as a prefix,
+    best match first."""
+    tokens = _tokens(query)
+    if not tokens:
+        return []
+
+    if connection.vendor == "sqlite":
+        return _search_sqlite(tokens, kinds, limit, public_only)
+    if connection.vendor == "postgresql":
+        return _search_postgres(tokens, kinds, limit, public_only)
+    return _search_fallback(tokens, kinds, limit, public_only)
+
+
+def _filters(kinds, public_only, params):
+    clauses = []
+    if kinds:
+        clauses.append("e.kind IN (%s)" % ", ".join(["%s"] * len(kinds)))
+        params.extend(kinds)
+    if public_only:
+        clauses.append("e.is_public")
+    return "".join(f" AND {clause}" for clause in clauses)
+
+
+def _search_sqlite(tokens, kinds, limit, public_only):
+    from .models import SearchEntry
+
+    params = [" ".join(f'"{token}"*' for token in tokens)]
+    where = _filters(kinds, public_only, params)
+    params.append(limit if limit else -1)
+    # bm25 column weights: title, body, category
+    sql = (
+        f"SELECT e.* FROM {FTS_TABLE} "
+        f"JOIN auction_list_searchentry e ON e.id = {FTS_TABLE}.rowid "
+        f"WHERE {FTS_TABLE} MATCH %s{where} "
+        f"ORDER BY bm25({FTS_TABLE}, 10.0, 1.0, 4.0) LIMIT %s"
+    )
+    return list(SearchEntry.objects.raw(sql, params))
+
+
+def _search_postgres(tokens, kinds, limit, public_only):
+    from .models import SearchEntry
+
+    tsquery = " & ".join(f"{token}:*" for token in tokens)
+    params = [tsquery]
+    where = _filters(kinds, public_only, params)
+    params.extend([tsquery, limit])
+    sql = (
+        f"SELECT e.* FROM auction_list_searchentry e "
+        f"WHERE ({PG_VECTOR}) @@ to_tsquery('simple', %s){where} "
+        f"ORDER BY ts_rank({PG_VECTOR}, to_tsquery('simple', %s)) DESC LIMIT %s"
+    )
+    return list(SearchEntry.objects.raw(sql, params))
+
+
+def _search_fallback(tokens, kinds, limit, public_only):
+    from .models import SearchEntry
+
+    entries = SearchEntry.objects.all()
+    for token in tokens:
+        entries = entries.filter(
+            Q(title__icontains=token) | Q(body__icontains=token) | Q(category__icontains=token)
+        )
+    if kinds:
+        entries = entries.filter(kind__in=kinds)
+    if public_only:
+        entries = entries.filter(is_public=True)
+    entries = entries.order_by("title")
+    return list(entries[:limit] if limit else entries)
+
+
+def matching_auction_ids(query):
+    """Auction ids matching ``query`` directly or through one of their lots,
+    in rank order."""
+    from .models import Lot
+
+    entries = search(query, kinds=["auction", "lot"], limit=None, public_only=False)
+    lot_ids = [e.object_id for e in entries if e.kind == "lot"]
+    lot_auctions = dict(Lot.objects.filter(id__in=lot_ids).values_list("id", "auction_id"))
+
+    ranked = []
+    for entry in entries:
+        auction_id = entry.object_id if entry.kind == "auction" else lot_auctions.get(entry.object_id)
+        if auction_id and auction_id not in ranked:
+            ranked.append(auction_id)
+    return ranked
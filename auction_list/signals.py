@@ -1,6 +1,13 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
 from django.dispatch import receiver
-from .models import Auction, Lot
+from .models import Auction, Lot, Item, enqueue_auction_started_emails
+from .stats import invalidate_status_counts
+from . import search
+
+
+def _status_may_have_changed(created, update_fields):
+    return created or update_fields is None or 'status' in update_fields
 
 
 @receiver(post_save, sender=Auction)
@@ -10,9 +17,85 @@ def auction_status_broadcast(sender, instance, created, **kwargs):
     pass
 
 
+@receiver(post_save, sender=Auction)
+def queue_auction_started_emails(sender, instance, **kwargs):
+    """Queue one bulk "Auction Started" email job when an auction goes live"""
+    if instance.status != 'live' or instance.email_sent:
+        return
+    
+    # Conditional UPDATE acts as the claim, so concurrent saves enqueue once
+    claimed = Auction.objects.filter(pk=instance.pk, email_sent=False).update(email_sent=True)
+    instance.email_sent = True
+    if claimed:
+        transaction.on_commit(lambda: enqueue_auction_started_emails(instance.pk))
+
+
 @receiver(post_save, sender=Lot)
 def lot_status_broadcast(sender, instance, created, **kwargs):
     """Broadcast lot status on save"""
     # WebSocket broadcasting removed - only timezone fix kept
     pass
 
+
+@receiver(post_save, sender=Auction)
+@receiver(post_save, sender=Lot)
+def invalidate_listing_counters(sender, instance, created, update_fields=None, **kwargs):
+    """Drop cached listing counters on status transitions"""
+    if _status_may_have_changed(created, update_fields):
+        invalidate_status_counts(sender)
+
+
+# ---------- SEARCH INDEX ----------
+@receiver(post_save, sender=Auction)
+def index_auction(sender, instance, created, update_fields=None, **kwargs):
+    search.index_instance(instance)
+    if not created and _status_may_have_changed(created, update_fields):
+        search.set_auction_visibility(instance)
+
+
+@receiver(post_save, sender=Lot)
+@receiver(post_save, sender=Item)
+def index_lot_or_item(sender, instance, update_fields=None, **kwargs):
+    # Bids only touch pricing fields, which are not indexed
+    if update_fields and not {'title', 'description', 'lot_catagory', 'item_catagory', 'images', 'image_derivatives', 'slug'} & set(update_fields):
+        return
+    search.index_instance(instance)
+    if sender is Lot and update_fields is None:
+        # The auction's entry lists its lots' categories
+        search.index_instance(instance.auction)
+
+
+@receiver(m2m_changed, sender=Lot.items.through)
+def reindex_lot_items(sender, instance, action, pk_set=None, **kwargs):
+    if action == 'pre_clear':
+        # post_clear has no pk_set; note what is being removed
+        related = instance.items if isinstance(instance, Lot) else instance.lots
+        instance._cleared_pks = set(related.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_cleared_pks', set())
+
+    # Items are only public while lotted in a public auction
+    if isinstance(instance, Lot):
+        # The lot's thumbnail comes from its first item
+        search.index_instance(instance)
+        search.set_item_visibility(pk_set)
+    else:
+        for lot in Lot.objects.filter(pk__in=pk_set):
+            search.index_instance(lot)
+        search.set_item_visibility([instance.pk])
+
+
+@receiver(pre_delete, sender=Lot)
+def hide_items_of_deleted_lot(sender, instance, **kwargs):
+    item_ids = list(instance.items.values_list('pk', flat=True))
+    transaction.on_commit(lambda: search.set_item_visibility(item_ids))
+
+
+@receiver(post_delete, sender=Auction)
+@receiver(post_delete, sender=Lot)
+@receiver(post_delete, sender=Item)
+def unindex(sender, instance, **kwargs):
+    search.remove_instance(instance)
@@ -0,0 +1,120 @@
+"""
+Cached status counters for the auction and lot listing pages.
+
+Counters come from a single ``GROUP BY status`` query and are cached for a few
+seconds. Every cache key embeds a per-model generation number, so a status
+transition invalidates all cached variants at once by bumping it.
+
+``lot_facets`` builds the filter-aware facet counts for the lot browser.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, CharField, Count, Q, Value, When
+
+
+def _timeout():
+    return getattr(settings, "STATS_CACHE_TIMEOUT", 10)
+
+
+def _generation_key(model):
+    return f"stats:{model._meta.label_lower}:gen"
+
+
+def _generation(model):
+    return cache.get_or_set(_generation_key(model), 1, None)
+
+
+def invalidate_status_counts(model):
+    """Drop every cached counter for ``model``"""
+    key = _generation_key(model)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def grouped_status_counts(queryset):
+    """Count rows per status with one GROUP BY; every status choice gets a key"""
+    counts = {key: 0 for key, _ in queryset.model.STATUS_CHOICES}
+    rows = queryset.order_by().values("status").annotate(total=Count("pk"))
+    for row in rows:
+        counts[row["status"]] = row["total"]
+    return counts
+
+
+def cached_status_counts(queryset, variant="all"):
+    """Return grouped_status_counts(queryset), cached per model and ``variant``.
+
+    ``variant`` must identify the filters applied to ``queryset`` (for example
+    the viewing user), since it is part of the cache key.
+    """
+    model = queryset.model
+    key = f"stats:{model._meta.label_lower}:{_generation(model)}:{variant}"
+    counts = cache.get(key)
+    if counts is None:
+        counts = grouped_status_counts(queryset)
+        cache.set(key, counts, _timeout())
+    return counts
+
+
+# ---------- LOT FACETS ----------
+# (key, label, lower bound, upper bound) on current_bid; upper bound exclusive
+PRICE_BUCKETS = [
+    ("0-1000", "Under ₹1,000", 0, 1000),
+    ("1000-5000", "₹1,000 – ₹5,000", 1000, 5000),
+    ("5000-25000", "₹5,000 – ₹25,000", 5000, 25000),
+    ("25000-", "₹25,000 and above", 25000, None),
+]
+
+
+def _bucket_expression():
+    whens = [
+        When(current_bid__lt=upper, then=Value(key))
+        for key, _, _, upper in PRICE_BUCKETS if upper is not None
+    ]
+    return Case(*whens, default=Value(PRICE_BUCKETS[-1][0]), output_field=CharField())
+
+
+def price_bucket_filter(key):
+    """Q selecting the lots in the price bucket ``key``, or None for an unknown key"""
+    for bucket, _, lower, upper in PRICE_BUCKETS:
+        if bucket == key:
+            return Q(current_bid__gte=lower) & (Q(current_bid__lt=upper) if upper is not None else Q())
+    return None
+
+
+def lot_facets(queryset, category=None, status=None):
+    """Per-category, per-status and per-price-bucket counts for ``queryset``.
+
+    One GROUP BY (category, status, bucket) query is folded in Python. Each
+    facet honours the other facets' selections but not its own, so every
+    option shows how many lots picking it would return. Filters already
+    applied to ``queryset`` (the price range) narrow every facet.
+    """
+    rows = (
+        queryset.order_by()
+        .values("lot_catagory_id", "status", bucket=_bucket_expression())
+        .annotate(total=Count("pk"))
+    )
+    category = str(category) if category else None
+
+    categories, statuses = {}, {key: 0 for key, _ in queryset.model.STATUS_CHOICES}
+    buckets = {key: 0 for key, _, _, _ in PRICE_BUCKETS}
+    for row in rows:
+        in_category = category is None or str(row["lot_catagory_id"]) == category
+        in_status = status is None or row["status"] == status
+        if in_status:
+            categories[row["lot_catagory_id"]] = categories.get(row["lot_catagory_id"], 0) + row["total"]
+        if in_category:
+            statuses[row["status"]] = statuses.get(row["status"], 0) + row["total"]
+        if in_category and in_status:
+            buckets[row["bucket"]] += row["total"]
+
+    return {
+        "categories": categories,
+        "statuses": statuses,
+        "buckets": [
+            {"key": key, "label": label, "min": lower, "max": upper, "count": buckets[key]}
+            for key, label, lower, upper in PRICE_BUCKETS
+        ],
+    }
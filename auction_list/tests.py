@@ -1,3 +1,740 @@
-from django.test import TestCase
+import gzip
+import importlib
+import io
+import json
+import os
+import tempfile
+import threading
+import zipfile
+from contextlib import redirect_stdout
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, OperationalError, connection
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from AuctionHouse.testing import LotFixtureMixin, MediaTestMixin, QueryBudgetMixin
+from Home.images import store_upload
+from Home.models import StoredImage
+from PIL import Image
+
+from bids.models import Bid
+
+from . import chat, closer, importer, lotting, stats
+from .models import Auction, Catagory, Invoice, Item, Lot, LotChatMessage, SearchEntry
+
+
+class AdminChangelistQueryCountTests(TestCase):
+    """Changelist pages must issue the same number of queries however many
+    rows they show, i.e. no per-row COUNT/aggregate/related lookups."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "admin@example.com", "pass12345")
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def add_rows(self, n):
+        category = Catagory.objects.create(name=f"Category {Catagory.objects.count()}")
+        auction = Auction.objects.create(title="Estate sale", description="", created_by=self.admin)
+        for i in range(n):
+            item = Item.objects.create(
+                title=f"Item {i}", owner=self.admin, item_catagory=category,
+                estimated_value=100, status="Available",
+            )
+            lot = Lot.objects.create(
+                auction=auction, lot_number=Lot.objects.filter(auction=auction).count() + 1,
+                title=f"Lot {i}", description="", lot_catagory=category, starting_bid=100,
+            )
+            lot.items.add(item)
+
+    def changelist_queries(self, model):
+        url = reverse(f"admin:auction_list_{model._meta.model_name}_changelist")
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def assertConstantQueries(self, model):
+        self.add_rows(2)
+        small = self.changelist_queries(model)
+        self.add_rows(10)
+        self.assertEqual(self.changelist_queries(model), small)
+
+    def test_catagory_changelist(self):
+        self.assertConstantQueries(Catagory)
+
+    def test_item_changelist(self):
+        self.assertConstantQueries(Item)
+
+    def test_lot_changelist(self):
+        self.assertConstantQueries(Lot)
+
+    def test_auction_changelist(self):
+        self.assertConstantQueries(Auction)
+
+    def test_annotated_totals(self):
+        self.add_rows(3)
+        response = self.client.get(reverse("admin:auction_list_auction_changelist"))
+        auction = response.context["cl"].result_list[0]
+        self.assertEqual(auction.lot_total, 3)
+        self.assertEqual(auction.lot_value, 300)
+
+        response = self.client.get(reverse("admin:auction_list_catagory_changelist"))
+        category = response.context["cl"].result_list[0]
+        self.assertEqual((category.item_total, category.available_total), (3, 3))
+
+
+class ItemStatusTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "admin@example.com", "pass12345")
+        cls.art = Catagory.objects.create(name="Art")
+        cls.vase, cls.bowl = (
+            Item.objects.create(title=title, owner=cls.admin, item_catagory=cls.art, estimated_value=10, status="Sold")
+            for title in ("Vase", "Bowl")
+        )
+
+    def run_action(self, action, *items):
+        self.client.force_login(self.admin)
+        self.client.post(reverse("admin:auction_list_item_changelist"), {
+            "action": action, "_selected_action": [item.pk for item in items],
+        })
+
+    def test_admin_actions_write_choice_values(self):
+        self.run_action("mark_as_available", self.vase)
+        self.assertEqual(Item.objects.get(pk=self.vase.pk).status, "Available")
+        self.assertEqual(self.art.available_items, 1)
+        # Marked-available items can be lotted again
+        self.assertEqual(list(lotting.lottable_items(Item.objects.all())), [self.vase])
+        self.run_action("mark_as_sold", self.vase)
+        self.assertEqual(Item.objects.get(pk=self.vase.pk).status, "Sold")
+        self.assertEqual(self.art.available_items, 0)
+
+    def test_migration_normalises_lowercase_statuses(self):
+        migration = importlib.import_module("auction_list.migrations.0022_normalise_item_status")
+        Item.objects.filter(pk=self.vase.pk).update(status="available")
+        Item.objects.filter(pk=self.bowl.pk).update(status="sold")
+        migration.normalise_item_status(apps, None)
+        self.assertEqual(dict(Item.objects.values_list("title", "status")), {"Vase": "Available", "Bowl": "Sold"})
+
+
+class LotBuilderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user("consignor", "c@example.com", "pass12345")
+        cls.art, cls.coins = Catagory.objects.create(name="Art"), Catagory.objects.create(name="Coins")
+        cls.auction = Auction.objects.create(title="Estate sale", description="", created_by=cls.owner)
+
+    def make_items(self, n):
+        for i in range(n):
+            Item.objects.create(
+                title=f"Item {i}", owner=self.owner, item_catagory=(self.art, self.coins)[i % 2],
+                estimated_value=100 * (i + 1), status="Available",
+            )
+
+    def test_build_lots_splits_by_category_and_size(self):
+        self.make_items(10)
+        lots = lotting.build_lots(self.auction, Item.objects.all(), max_items=2)
+        self.assertEqual(len(lots), 6)
+        self.assertEqual([lot.lot_number for lot in lots], list(range(1, 7)))
+        for lot in Lot.objects.prefetch_related("items"):
+            items = list(lot.items.all())
+            self.assertEqual({item.item_catagory_id for item in items}, {lot.lot_catagory_id})
+            self.assertEqual(lot.starting_bid, sum(item.estimated_value for item in items))
+        self.assertFalse(Item.objects.exclude(status="Lotted").exists())
+        # Lotted items are not picked up again
+        self.assertEqual(lotting.build_lots(self.auction, Item.objects.all()), [])
+
+    def test_build_lots_queries_do_not_grow_with_items(self):
+        self.make_items(4)
+        with CaptureQueriesContext(connection) as small:
+            lotting.build_lots(self.auction, Item.objects.all(), max_items=1)
+        self.make_items(40)
+        with CaptureQueriesContext(connection) as large:
+            lotting.build_lots(self.auction, Item.objects.filter(status="Available"), max_items=1)
+        self.assertEqual(len(large.captured_queries), len(small.captured_queries))
+
+    def test_sync_item_statuses(self):
+        self.make_items(4)
+        lot, = lotting.build_lots(self.auction, Item.objects.filter(item_catagory=self.art))
+        removed = lot.items.first()
+        lot.items.remove(removed)
+        lot.status = "sold"
+        lotting.sync_item_statuses(lot, removed_ids=[removed.pk], old_status="draft")
+        self.assertEqual(Item.objects.get(pk=removed.pk).status, "Available")
+        self.assertEqual(set(lot.items.values_list("status", flat=True)), {"Sold"})
+        self.assertEqual(lotting.recalculate_starting_bids([lot]), [lot])
+        self.assertEqual(lot.starting_bid, lot.items.get().estimated_value)
+
+
+class ItemSlugTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user("consignor", "c@example.com", "pass12345")
+        cls.category = Catagory.objects.create(name="Watches")
+
+    def item(self, title, **fields):
+        return Item.objects.create(title=title, owner=self.owner, item_catagory=self.category, estimated_value=10, **fields)
+
+    def test_suffixes_count_up_past_existing_slugs(self):
+        self.assertEqual([self.item("Watch").slug for _ in range(3)], ["watch", "watch-1", "watch-2"])
+        # Longer titles sharing the prefix are not numbered copies
+        self.assertEqual(self.item("Watch Strap").slug, "watch-strap")
+        self.item("Old watch", slug="watch-10")
+        self.item("Older watch", slug="watch-9")
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.item("Watch").slug, "watch-11")
+        self.assertNotIn("REGEXP", " ".join(q["sql"] for q in queries))
+
+    def test_allocate_slugs_avoids_collisions_within_the_batch(self):
+        self.item("Watch")
+        items = Item.allocate_slugs([
+            Item(title=title, owner=self.owner, item_catagory=self.category, estimated_value=10)
+            for title in ("Watch", "Watch 2", "Watch", "Clock")
+        ])
+        self.assertEqual([item.slug for item in items], ["watch-1", "watch-2", "watch-3", "clock"])
+
+    def test_concurrent_save_retries_with_a_fresh_slug(self):
+        self.item("Watch")
+        # Another request took "watch" between picking the slug and inserting
+        with mock.patch.object(Item, "generate_unique_slug", side_effect=["watch", "watch-1"]):
+            self.assertEqual(self.item("Watch").slug, "watch-1")
+
+
+class ImporterTests(MediaTestMixin, TestCase):
+    CSV = (
+        "title,category,estimated_value,images\n"
+        "Blue vase,Art,100,vase.png\n"
+        'Red vase,art,"1,200",vase.png;bowl.png\n'
+        "Mystery,Stamps,10,\n"
+        "Bowl,Art,-5,bowl.png\n"
+        "Lamp,Art,20,lamp.gif\n"
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user("consignor", "c@example.com", "pass12345")
+        Catagory.objects.create(name="Art")
+
+    def images_zip(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as z:
+            for name, colour in (("vase.png", "blue"), ("bowl.png", "white")):
+                image = io.BytesIO()
+                Image.new("RGB", (32, 32), colour).save(image, "PNG")
+                z.writestr(name, image.getvalue())
+        archive.seek(0)
+        return archive
+
+    def run_import(self, **kwargs):
+        return importer.import_items(io.BytesIO(self.CSV.encode()), self.owner, images_zip=self.images_zip(), **kwargs)
+
+    def test_valid_rows_are_imported_with_shared_images(self):
+        callers = set()
+
+        def store(*args):
+            callers.add(threading.current_thread())
+            return store_upload(*args)
+
+        with mock.patch("auction_list.importer.store_upload", side_effect=store):
+            report = self.run_import(batch_size=1)
+        self.assertEqual((report.rows, report.created, report.rejected), (5, 2, 3))
+        # Database work stays on the importing thread
+        self.assertEqual(callers, {threading.current_thread()})
+
+        blue, red = Item.objects.order_by("pk")
+        self.assertEqual((blue.slug, red.estimated_value), ("blue-vase", 1200))
+        self.assertEqual(blue.images[0], red.images[0])
+        refs = dict(StoredImage.objects.values_list("path", "ref_count"))
+        self.assertEqual(sorted(refs.values()), [1, 2])
+        self.assertEqual(refs[blue.images[0]], 2)
+        self.assertEqual(SearchEntry.objects.filter(kind="item").count(), 2)
+
+    def test_bad_rows_are_reported_by_line(self):
+        report = self.run_import(dry_run=True)
+        self.assertEqual((report.valid, report.created), (2, 0))
+        self.assertEqual(
+            [(error["line"], error["field"]) for error in report.errors],
+            [(4, "category"), (5, "estimated_value"), (6, "images")],
+        )
+        self.assertIn('4,category,"Unknown category ""Stamps""."', report.errors_csv())
+        self.assertFalse(Item.objects.exists())
+
+    def test_failed_batch_releases_its_images(self):
+        with mock.patch.object(Item.objects, "bulk_create", side_effect=IntegrityError("slug clash")):
+            with self.assertRaises(IntegrityError):
+                self.run_import()
+        self.assertFalse(StoredImage.objects.exists())
+        self.assertEqual(default_storage.listdir("item_images")[1], [])
+
+
+class ItemAutocompleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "admin@example.com", "pass12345")
+        cls.art, cls.coins = Catagory.objects.create(name="Art"), Catagory.objects.create(name="Coins")
+        Item.objects.bulk_create([
+            Item(title=f"Thing {i:02d}", slug=f"thing-{i}", owner=cls.admin,
+                 item_catagory=(cls.art, cls.coins)[i % 2], estimated_value=10,
+                 status="Lotted" if i == 0 else "Available")
+            for i in range(60)
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def fetch(self, **params):
+        return self.client.get(reverse("admin:auction_list_item_autocomplete"), params).json()
+
+    def test_pages_available_items_in_category(self):
+        first = self.fetch(category=self.art.pk)
+        self.assertEqual(len(first["results"]), 20)
+        self.assertTrue(first["pagination"]["more"])
+        self.assertEqual(first["results"][0]["text"], "Thing 02 - ₹10.00 (Available)")
+        last = self.fetch(category=self.art.pk, page=2)
+        self.assertEqual(len(last["results"]), 9)
+        self.assertFalse(last["pagination"]["more"])
+
+    def test_term_and_status_filters(self):
+        self.assertEqual([r["text"] for r in self.fetch(term="thing 0", status="lotted")["results"]],
+                         ["Thing 00 - ₹10.00 (Lotted)"])
+
+    def test_lot_form_renders_only_selected_items(self):
+        auction = Auction.objects.create(title="Estate sale", description="", created_by=self.admin)
+        lot = Lot.objects.create(auction=auction, lot_number=1, title="Lot", description="",
+                                 lot_catagory=self.art)
+        lot.items.add(*Item.objects.filter(item_catagory=self.art)[:2])
+        response = self.client.get(reverse("admin:auction_list_lot_change", args=[lot.pk]))
+        widget = str(response.context["adminform"].form["items"])
+        self.assertEqual(widget.count("<option"), 2)
+        self.assertContains(response, "item-autocomplete")
+
+
+class ViewQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Listing and polling views stay within budget however many rows exist"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("bidder", "b@example.com", "pass12345")
+        cls.category = Catagory.objects.create(name="Art")
+        cls.auction = Auction.objects.create(
+            title="Estate sale", description="", created_by=cls.user, status="approved"
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def add_lots(self, n):
+        start = Lot.objects.count()
+        for i in range(start, start + n):
+            lot = Lot.objects.create(
+                auction=self.auction, lot_number=i + 1, title=f"Lot {i}", description="",
+                lot_catagory=self.category, status="active",
+            )
+            lot.items.add(Item.objects.create(
+                title=f"Item {i}", owner=self.user, item_catagory=self.category, estimated_value=100,
+            ))
+            LotChatMessage.objects.create(lot=lot, user=self.user, message="hello")
+
+    def queries(self, name, *args):
+        cache.clear()
+        return self.assertWithinQueryBudget(self.client.get(reverse(name, args=args))).queries
+
+    def test_listings(self):
+        for name in ("auctions", "view_lots"):
+            with self.subTest(name):
+                self.add_lots(2)
+                small = self.queries(name)
+                self.add_lots(10)
+                Auction.objects.create(title="Another", description="", created_by=self.user, status="approved")
+                self.assertEqual(self.queries(name), small)
+
+    def test_lot_updates(self):
+        self.add_lots(1)
+        self.queries("get_lot_updates", Lot.objects.get().pk)
+
+    def test_polling_endpoints(self):
+        self.add_lots(1)
+        lot = Lot.objects.get()
+        self.queries("get_bid_updates", lot.pk)
+        self.client.logout()
+        response = self.client.get(reverse("get_auction_updates"), {"ids": str(self.auction.pk)})
+        self.assertWithinQueryBudget(response)
+
+
+class StatusCounterTests(LotFixtureMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_counts_are_cached_until_a_status_changes(self):
+        self.make_lot(2, status="sold")
+        counts = Lot.all_status_count()
+        self.assertEqual((counts["active"], counts["sold"], counts["draft"]), (1, 1, 0))
+        with self.assertNumQueries(0):
+            self.assertEqual(Lot.all_status_count(), counts)
+
+        # Saves that can't move the status keep the cached counts
+        self.lot.save(update_fields=["current_bid"])
+        with self.assertNumQueries(0):
+            Lot.all_status_count()
+
+        self.lot.status = "sold"
+        self.lot.save()
+        self.assertEqual(Lot.all_status_count()["sold"], 2)
+
+    def test_listing_counts_are_per_viewer(self):
+        other = self.make_user("other")
+        # Only its creator (and staff) can see an auction awaiting approval
+        Auction.objects.create(title="Private", description="", created_by=other, status="pending")
+        Auction.objects.filter(pk=self.auction.pk).update(status="live")
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("auctions"))
+        self.assertEqual((response.context["live_count"], response.context["pending_count"]), (1, 0))
+        self.client.force_login(other)
+        response = self.client.get(reverse("auctions"))
+        self.assertEqual((response.context["live_count"], response.context["pending_count"]), (1, 1))
+
+
+class LotBrowserTests(LotFixtureMixin, TestCase):
+    def lot_numbers(self, **params):
+        response = self.client.get(reverse("view_lots", args=[self.auction.pk]), params)
+        return sorted(lot.lot_number for lot in response.context["lots"])
+
+    def test_pages_are_sorted_server_side(self):
+        for number in range(2, 31):
+            self.make_lot(number, current_bid=number * 10)
+        self.client.force_login(self.user)
+        url = reverse("view_lots", args=[self.auction.pk])
+        first = self.client.get(url, {"sort": "price_high"}).context
+        self.assertEqual(len(first["lots"]), 24)
+        self.assertEqual(first["page_obj"].paginator.num_pages, 2)
+        self.assertEqual(first["lots"][0].lot_number, 30)
+        last = self.client.get(url, {"sort": "price_high", "page": 2}).context
+        self.assertEqual([lot.lot_number for lot in last["lots"]], [6, 5, 4, 3, 2, 1])
+
+    def test_typed_max_price_is_inclusive_but_buckets_are_not(self):
+        self.make_lot(2, current_bid=1000)
+        self.make_lot(3, current_bid=1500)
+        self.client.force_login(self.user)
+        self.assertEqual(self.lot_numbers(max_price="1000"), [1, 2])
+        self.assertEqual(self.lot_numbers(price="0-1000"), [1])
+        self.assertEqual(self.lot_numbers(price="1000-5000"), [2, 3])
+
+    def test_facets_honour_the_other_selections(self):
+        other = Catagory.objects.create(name="Books", description="")
+        self.make_lot(2, current_bid=1000)
+        self.make_lot(3, current_bid=6000, status="sold")
+        self.make_lot(4, current_bid=30000, lot_catagory=other)
+        lots = Lot.objects.all()
+
+        facets = stats.lot_facets(lots, category=self.category.pk, status="active")
+        # Each facet ignores its own selection
+        self.assertEqual(facets["categories"], {self.category.pk: 2, other.pk: 1})
+        self.assertEqual((facets["statuses"]["active"], facets["statuses"]["sold"]), (2, 1))
+        # Upper bounds are exclusive: 1000 falls in the second bucket
+        buckets = {bucket["key"]: bucket["count"] for bucket in facets["buckets"]}
+        self.assertEqual(buckets, {"0-1000": 1, "1000-5000": 1, "5000-25000": 0, "25000-": 0})
+
+        priced = stats.lot_facets(lots.filter(current_bid__lt=5000))
+        self.assertEqual(priced["categories"], {self.category.pk: 2})
+
+
+class SearchTests(LotFixtureMixin, TestCase):
+    def setUp(self):
+        self.item = Item.objects.create(
+            title="Blue vase", owner=self.user, item_catagory=self.category, estimated_value=100,
+        )
+
+    def typeahead(self, q="vase", **params):
+        response = self.client.get(reverse("search_typeahead"), {"q": q, **params})
+        return [(result["type"], result["title"]) for result in response.json()["results"]]
+
+    def items_found(self):
+        return [title for kind, title in self.typeahead() if kind == "item"]
+
+    def test_items_are_public_only_while_lotted_in_a_public_auction(self):
+        self.assertEqual(self.items_found(), [])
+        self.lot.items.add(self.item)
+        self.assertEqual(self.items_found(), [])
+
+        self.auction.status = "approved"
+        self.auction.save()
+        self.assertEqual(self.items_found(), ["Blue vase"])
+
+        self.item.lots.clear()
+        self.assertEqual(self.items_found(), [])
+        lotting.build_lots(self.auction, Item.objects.all())
+        self.assertEqual(self.items_found(), ["Blue vase"])
+
+        self.auction.status = "cancelled"
+        self.auction.save()
+        self.assertEqual(self.items_found(), [])
+
+    def test_limit_is_clamped(self):
+        Auction.objects.filter(pk=self.auction.pk).update(status="live")
+        for i in range(3):
+            Auction.objects.create(title=f"Vase sale {i}", description="", created_by=self.user, status="live")
+        self.assertEqual(len(self.typeahead()), 3)
+        self.assertEqual(len(self.typeahead(limit=2)), 2)
+        for limit in ("0", "-5"):
+            self.assertEqual(len(self.typeahead(limit=limit)), 1)
+        self.assertEqual(len(self.typeahead(limit="lots")), 3)
+
+    def test_auction_categories_fit_the_column(self):
+        for i in range(12):
+            category = Catagory.objects.create(name=f"{'Antique furniture and decorative arts ' * 2}{i}")
+            self.make_lot(i + 2, lot_catagory=category)
+        self.auction.save()
+        entry = SearchEntry.objects.get(kind="auction", object_id=self.auction.pk)
+        self.assertLessEqual(len(entry.category), 255)
+        self.assertTrue(entry.category.startswith("Antique"))
+
+
+class PollingTransitionTests(LotFixtureMixin, TestCase):
+    """Polling views report due transitions and leave the work to others"""
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def last_bid(self, seconds_ago):
+        lot = Lot.objects.get(pk=self.lot.pk)
+        lot.arm_idle_timer(timezone.now() - timedelta(seconds=seconds_ago))
+        lot.save(update_fields=Lot.IDLE_FIELDS)
+
+    def test_idle_lot_is_reported_not_closed(self):
+        self.last_bid(60)
+        data = self.client.get(reverse("get_lot_updates", args=[self.lot.pk])).json()
+        self.assertTrue(data["closing"])
+        self.assertEqual(data["status"], "active")
+        self.assertEqual(Lot.objects.get().status, "active")
+
+    def test_idle_countdown(self):
+        self.last_bid(18)
+        data = self.client.get(reverse("get_lot_updates", args=[self.lot.pk])).json()
+        self.assertFalse(data["closing"])
+        self.assertAlmostEqual(data["countdown"], 2, delta=0.5)
+        self.assertEqual(data["idle_countdown"]["phase"], "going_twice")
+        self.assertEqual(data["idle_countdown"]["duration"], 5)
+
+    def test_ended_lot_is_not_closed_by_poll(self):
+        Lot.objects.filter(pk=self.lot.pk).update(is_timed=True, end_time=timezone.now() - timedelta(seconds=1))
+        data = self.client.get(reverse("get_bid_updates", args=[self.lot.pk])).json()
+        self.assertEqual(data["status"], "active")
+        self.assertEqual(Lot.objects.get().status, "active")
+
+    @mock.patch("auction_list.views.enqueue_auction_status_refresh")
+    def test_auction_reports_scheduled_status(self, enqueue):
+        now = timezone.now()
+        Auction.objects.filter(pk=self.auction.pk).update(
+            status="scheduled", auction_type="scheduled",
+            start_date=now - timedelta(hours=1), end_date=now + timedelta(hours=1),
+        )
+        data = self.client.get(reverse("get_auction_updates"), {"ids": str(self.auction.pk)}).json()
+        self.assertEqual(data[str(self.auction.pk)]["status"], "live")
+        self.assertEqual(Auction.objects.get().status, "scheduled")
+        enqueue.assert_called_once_with(self.auction.pk)
+
+    @mock.patch("auction_list.views.enqueue_auction_status_refresh")
+    def test_auction_list_leaves_status_changes_to_the_background(self, enqueue):
+        now = timezone.now()
+        Auction.objects.filter(pk=self.auction.pk).update(
+            status="scheduled", auction_type="scheduled",
+            start_date=now - timedelta(hours=1), end_date=now + timedelta(hours=1),
+        )
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(reverse("auctions")).status_code, 200)
+        self.assertFalse([q for q in queries if not q["sql"].lstrip().upper().startswith("SELECT")])
+        self.assertEqual(Auction.objects.get().status, "scheduled")
+        enqueue.assert_called_once_with(self.auction.pk)
+
+
+@mock.patch("auction_list.signals.enqueue_auction_started_emails")
+class AuctionStartedEmailTests(LotFixtureMixin, TestCase):
+    def go_live(self, auction):
+        auction.status = "live"
+        with self.captureOnCommitCallbacks(execute=True):
+            auction.save()
+
+    def test_concurrent_saves_email_once(self, enqueue):
+        # Two requests loaded the auction before either made it live
+        first, second = Auction.objects.get(), Auction.objects.get()
+        self.go_live(first)
+        self.go_live(second)
+        enqueue.assert_called_once_with(self.auction.pk)
+        self.assertTrue(Auction.objects.get().email_sent)
+
+    def test_stale_save_does_not_reset_the_claim(self, enqueue):
+        stale = Auction.objects.get()
+        self.go_live(Auction.objects.get())
+        stale.title = "Renamed"
+        stale.save()
+        self.assertEqual(Auction.objects.filter(email_sent=True, title="Renamed").count(), 1)
+        self.go_live(Auction.objects.get())
+        enqueue.assert_called_once_with(self.auction.pk)
+
+    def test_backfill_marks_started_auctions_emailed(self, enqueue):
+        migration = importlib.import_module("auction_list.migrations.0020_backfill_auction_email_sent")
+        for status in ("pending", "scheduled", "live", "completed"):
+            Auction.objects.create(title=status, description="", created_by=self.user, status=status)
+        # As the rows stood right after email_sent was added
+        Auction.objects.update(email_sent=False)
+        migration.mark_started_auctions_emailed(apps, None)
+        emailed = Auction.objects.filter(email_sent=True).values_list("title", flat=True)
+        self.assertCountEqual(emailed, ["live", "completed"])
+        enqueue.assert_not_called()
+
+
+@mock.patch("auction_list.closer.notify_winner")
+class LotCloserTests(LotFixtureMixin, TestCase):
+    username = "seller"
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.seller = cls.user
+        cls.bidder = cls.make_user("bidder", balance=10000)
+        cls.lot.items.add(Item.objects.create(
+            title="Vase", owner=cls.seller, item_catagory=cls.category, estimated_value=100,
+        ))
+
+    def bid(self, amount, seconds_ago=0):
+        Bid.objects.create(lot=Lot.objects.get(pk=self.lot.pk), user=User.objects.get(pk=self.bidder.pk), amount=amount)
+        self.rearm(timezone.now() - timedelta(seconds=seconds_ago))
+
+    def rearm(self, when):
+        lot = Lot.objects.get(pk=self.lot.pk)
+        lot.arm_idle_timer(when)
+        lot.save(update_fields=Lot.IDLE_FIELDS)
+
+    def test_closes_idle_lot_once(self, notify):
+        self.bid(500, seconds_ago=60)
+        with self.captureOnCommitCallbacks():
+            self.assertEqual([lot.pk for lot in closer.close_due_lots()], [self.lot.pk])
+            self.assertEqual(closer.close_due_lots(), [])
+        lot = Lot.objects.get()
+        self.assertEqual((lot.status, lot.winning_bidder, lot.current_bid), ("sold", self.bidder, 500))
+        self.assertEqual(Invoice.objects.count(), 1)
+        notify.assert_called_once()
+
+    def test_stale_instance_cannot_close_twice(self, notify):
+        first, second = Lot.objects.get(), Lot.objects.get()
+        self.assertTrue(first.close_lot())
+        self.assertFalse(second.close_lot())
+        self.assertEqual(Lot.objects.get().status, "unsold")
+
+    def test_lot_with_recent_bid_stays_open(self, notify):
+        self.bid(500, seconds_ago=5)
+        self.assertEqual(closer.close_due_lots(), [])
+        # A bid between the sweep's query and its claim keeps the lot open
+        condition = closer.due_condition(timezone.now() + timedelta(minutes=1))
+        self.rearm(timezone.now() + timedelta(minutes=1))
+        self.assertFalse(Lot.objects.get().close_lot(condition=condition))
+        self.assertEqual(Lot.objects.get().status, "active")
+
+    def test_auction_end_date(self, notify):
+        Auction.objects.filter(pk=self.auction.pk).update(end_date=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(len(closer.close_due_lots()), 1)
+        self.assertEqual(Lot.objects.get().status, "unsold")
+
+    def test_bid_arms_timer_from_auction_settings(self, notify):
+        Auction.objects.filter(pk=self.auction.pk).update(idle_timeout=30, idle_countdown=10)
+        self.bid(500)
+        lot = Lot.objects.get()
+        self.assertFalse(lot.idle_timer_started)
+        self.assertEqual((lot.idle_timer_start_time - lot.last_bid_time).total_seconds(), 30)
+        self.assertEqual((lot.idle_close_at - lot.idle_timer_start_time).total_seconds(), 10)
+        self.assertEqual(closer.next_deadline(), lot.idle_timer_start_time)
+
+        Auction.objects.filter(pk=self.auction.pk).update(idle_timeout=0)
+        self.bid(600)
+        self.assertIsNone(Lot.objects.get().idle_close_at)
+
+    def test_countdown_is_announced_once(self, notify):
+        self.bid(500, seconds_ago=16)
+        events, deadline = closer.sweep()
+        self.assertEqual([event["type"] for _, event in events], ["idle_countdown"])
+        self.assertEqual(events[0][1]["data"]["phase"], "going_once")
+        lot = Lot.objects.get()
+        self.assertTrue(lot.idle_timer_started)
+        self.assertEqual(deadline, lot.idle_close_at)
+        self.assertEqual(closer.sweep()[0], [])
+
+
+class ChatPipelineTests(LotFixtureMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        chat.history.forget(self.lot.pk)
+
+    def test_messages_are_written_in_batches(self):
+        writer = chat.ChatWriter(interval=60)
+        with mock.patch.object(chat, "writer", writer):
+            for i in range(3):
+                chat.post(self.lot.pk, self.user, f"hello {i}")
+            self.assertEqual(LotChatMessage.objects.count(), 0)
+            self.assertEqual([m["message"] for m in chat.recent(self.lot.pk)], ["hello 2", "hello 1", "hello 0"])
+            self.assertEqual(writer.flush(), 3)
+        self.assertEqual(list(LotChatMessage.objects.values_list("message", flat=True)), ["hello 0", "hello 1", "hello 2"])
+
+    def test_busy_database_requeues_the_batch(self):
+        writer = chat.ChatWriter(interval=60)
+        locked = OperationalError("database is locked")
+        bulk_create = LotChatMessage.objects.bulk_create
+        with mock.patch.object(chat, "writer", writer), redirect_stdout(io.StringIO()), \
+                mock.patch.object(LotChatMessage.objects, "bulk_create", side_effect=[locked, mock.DEFAULT], wraps=bulk_create):
+            for i in range(2):
+                chat.post(self.lot.pk, self.user, f"hello {i}")
+            self.assertEqual(writer.flush(), 0)
+            self.assertEqual(len(writer.pending(self.lot.pk)), 2)
+            self.assertGreater(writer._delay, 0)
+            chat.post(self.lot.pk, self.user, "hello 2")
+            self.assertEqual(writer.flush(), 3)
+        self.assertEqual(writer._delay, 0)
+        self.assertEqual(list(LotChatMessage.objects.values_list("message", flat=True)), ["hello 0", "hello 1", "hello 2"])
+
+    def test_history_keeps_recently_used_lots_only(self):
+        history = chat.ChatHistory(max_lots=2)
+        lots = [self.lot, self.make_lot(2), self.make_lot(3)]
+        history.recent(lots[0].pk)
+        history.recent(lots[1].pk)
+        history.recent(lots[0].pk)
+        history.recent(lots[2].pk)
+        self.assertEqual(list(history._lots), [lots[0].pk, lots[2].pk])
+
+    def test_history_is_served_from_memory(self):
+        LotChatMessage.objects.create(lot=self.lot, user=self.user, message="first")
+        chat.recent(self.lot.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(chat.recent(self.lot.pk)[0]["message"], "first")
+
+    @override_settings(CHAT_RATE_LIMIT=(2, 60), CHAT_FLUSH_INTERVAL=0)
+    def test_rate_limit(self):
+        self.client.force_login(self.user)
+        url = reverse("send_chat_message", args=[self.lot.pk])
+        for _ in range(2):
+            response = self.client.post(url, json.dumps({"message": "hi"}), content_type="application/json")
+            self.assertTrue(response.json()["success"])
+        response = self.client.post(url, json.dumps({"message": "hi"}), content_type="application/json")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(LotChatMessage.objects.count(), 2)
+
+    def test_prune_archives_chat_of_closed_lots(self):
+        closed = self.make_lot(2, title="Closed", status="sold")
+        Lot.objects.filter(pk=closed.pk).update(updated_at=timezone.now() - timedelta(days=40))
+        for lot in (self.lot, closed):
+            LotChatMessage.objects.create(lot=lot, user=self.user, message=f"on {lot.title}")
+
+        with tempfile.TemporaryDirectory() as archive_dir:
+            call_command("prune_lot_chat", archive_dir=archive_dir, stdout=io.StringIO())
+            with gzip.open(os.path.join(archive_dir, f"lot_{closed.pk}.jsonl.gz"), "rt") as archive:
+                self.assertEqual([json.loads(line)["message"] for line in archive], ["on Closed"])
+        self.assertEqual(list(LotChatMessage.objects.values_list("lot_id", flat=True)), [self.lot.pk])
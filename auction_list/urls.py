@@ -7,7 +7,6 @@ urlpatterns = [
     path("auctions/", views.auctions_list, name="auctions"),
     path("auction/<int:auction_id>/", views.auction_detail, name="auction_detail"),
     path("all_auction/", views.auctions_list, name="all_auction"),
-    path("admin/get-items-by-category/", views.get_items_by_category),
     path("lots/", views.view_lots, name="view_lots"),
     path("lots/auction/<int:auction_id>/", views.view_lots, name="view_lots"),
     path("lot-detail/<int:lot_id>/", views.lot_detail, name="lot_detail"),
@@ -25,4 +24,5 @@ urlpatterns = [
     path("lot/<int:lot_id>/chat/", views.send_chat_message, name="send_chat_message"),
     path("lot/<int:lot_id>/updates/", views.get_lot_updates, name="get_lot_updates"),
     path("updates/", views.get_auction_updates, name="get_auction_updates"),
+    path("search/", views.search_typeahead, name="search_typeahead"),
 ]
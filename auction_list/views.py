@@ -1,20 +1,28 @@
 
-from decimal import Decimal
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
 from django.shortcuts import render, redirect
-from django.http import JsonResponse, HttpResponse
-from django.db.models import Q
+from django.http import HttpResponse
+from AuctionHouse.metrics import JsonResponse
+from django.db.models import Q, Case, When, IntegerField, Count
+from django.core.paginator import Paginator
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
-from django.contrib.admin.views.decorators import staff_member_required
-from .models import Auction, Item, Lot, AuctionRegister, LotRegister, Catagory, LotChatMessage
+from .models import Auction, Lot, AuctionRegister, LotRegister, Catagory
+from .models import enqueue_auction_status_refresh
+from .stats import cached_status_counts, lot_facets, price_bucket_filter
+from . import chat, search
+from bids import history as bid_history
 from bids.models import Bid, Wallet
-from django.core.mail import send_mail
 from django.core.exceptions import ValidationError
 from django.db import transaction
 import json
 from django.views.decorators.http import require_POST, require_GET
+from AuctionHouse.db import read_only
+from asgiref.sync import sync_to_async
 
 
 
@@ -56,6 +64,7 @@ def format_inr(amount):
 
 
 @login_required
+@read_only
 def auctions_list(request):
     """List all auctions with filtering"""
     auctions = Auction.objects.all().select_related("created_by", "approved_by")
@@ -73,19 +82,23 @@ def auctions_list(request):
     category_filter = request.GET.get("category")
     
     # If NO filters are applied, hide completed auctions by default
-    if not any([status_filter, type_filter, search_query, category_filter]):
+    hide_completed = not any([status_filter, type_filter, search_query, category_filter])
+    if hide_completed:
          auctions = auctions.exclude(status="completed")
 
-    for auction in auctions:
-        if auction.status in ["approved", "scheduled", "live"]:
-            auction.update_auction_status()
-            auction.save()
+    # This view reads from the replica, so due status changes (and the lot
+    # and item updates that go with them) are applied in the background
+    now = timezone.now()
+    for auction in auctions.filter(status__in=["approved", "scheduled", "live"], auction_type="scheduled"):
+        if auction.scheduled_status(now) != auction.status:
+            enqueue_auction_status_refresh(auction.pk)
+
+    # One cached GROUP BY instead of a COUNT per status
+    viewer = "staff" if request.user.is_staff else f"user{request.user.pk}"
+    counts = cached_status_counts(auctions, variant=f"{viewer}:{int(hide_completed)}")
 
-    live_count = auctions.filter(status="live").count()
-    scheduled_count = auctions.filter(status="scheduled").count()
-    approved_count = auctions.filter(status="approved").count()
-    pending_count = auctions.filter(status="pending").count()
-    completed_count = auctions.filter(status="completed").count()
+    # Lot totals for the cards; distinct so the category filter's join can't inflate them
+    auctions = auctions.annotate(lot_total=Count("lots", distinct=True))
 
     # Filtering
     status_filter = request.GET.get("status")
@@ -104,29 +117,44 @@ def auctions_list(request):
         auctions = auctions.filter(lots__lot_catagory__id=category_filter).distinct()
 
     if search_query:
-        auctions = auctions.filter(
-            Q(title__icontains=search_query) | 
-            Q(description__icontains=search_query)
-        )
+        # Ranked full-text match over auctions and their lots
+        ranked_ids = search.matching_auction_ids(search_query)
+        auctions = auctions.filter(id__in=ranked_ids).order_by(
+            Case(*[When(id=pk, then=pos) for pos, pk in enumerate(ranked_ids)], output_field=IntegerField())
+        ) if ranked_ids else auctions.none()
 
     context = {
         "auctions": auctions,
-        "live_count": live_count,
-        "scheduled_count": scheduled_count,
-        "approved_count": approved_count,
-        "pending_count": pending_count,
-        "completed_count": completed_count,
+        "live_count": counts["live"],
+        "scheduled_count": counts["scheduled"],
+        "approved_count": counts["approved"],
+        "pending_count": counts["pending"],
+        "completed_count": counts["completed"],
     }
     return render(request, "auctions/auction_list.html", context)
 
 
-@staff_member_required
-def get_items_by_category(request):
-    category_id = request.GET.get("category_id")
-    items = Item.objects.filter(category_id=category_id)
+@require_GET
+@read_only
+def search_typeahead(request):
+    """JSON typeahead for the navbar search box"""
+    query = request.GET.get("q", "")
+    try:
+        limit = max(1, min(int(request.GET.get("limit", 8)), 20))
+    except ValueError:
+        limit = 8
 
-    data = [{"id": i.id, "text": f"{i.title} - ₹{i.price} ({i.status})"} for i in items]
-    return JsonResponse(data, safe=False)
+    labels = {"auction": "View Auction", "lot": "View Lot", "item": "View Item"}
+    results = [{
+        "type": entry.kind,
+        "id": entry.object_id,
+        "title": entry.title,
+        "label": labels[entry.kind],
+        "url": entry.url,
+        "image": f"{settings.MEDIA_URL}{entry.image}" if entry.image else None,
+    } for entry in search.search(query, limit=limit) if entry.url]
+
+    return JsonResponse({"query": query, "results": results})
 
 
 @login_required
@@ -150,34 +178,14 @@ def auction_detail(request, auction_id):
 
 
     if auction.status in ["approved", "scheduled", "live"]:
+        old_status = auction.status
         auction.update_auction_status()
-        auction.save()
-
-    if (
-        auction.status == "live"
-        and auction.start_date
-        and timezone.now() >= auction.start_date
-        and not getattr(auction, "email_sent", False)
-    ):
-        # Notify ALL registered users of this auction
-        registrations = AuctionRegister.objects.filter(auction=auction,user=request.user)
-        recipient_list = [reg.user.email for reg in registrations if reg.user.email]
-
-        if recipient_list:
-            send_mail(
-                subject=f"Auction Started: {auction.title}",
-                message=(
-                    f"The auction '{auction.title}' has started!\n\n"
-                    "Login now and start bidding on the lots."
-                ),
-                from_email='meetvaghasiya166@gmail.com',
-                recipient_list=recipient_list,
-                fail_silently=False,
-            )
-
-            auction.email_sent = True
+        if auction.status != old_status:
             auction.save()
 
+    # "Auction Started" emails are queued by the go-live transition
+    # (see auction_list.signals), never sent while rendering this page.
+
     context = {
         "auction": auction,
         "lots": lots,
@@ -205,48 +213,73 @@ def auction_unregister(request, auction_id):
     return redirect("auction_detail", auction_id)
 
 
+LOTS_PER_PAGE = 24
+LOT_SORTS = {
+    'newest': ('-created_at', '-id'),
+    'price_low': ('current_bid', 'lot_number'),
+    'price_high': ('-current_bid', 'lot_number'),
+    'bids': ('-bid_count', 'lot_number'),
+}
+
+
 @login_required
+@read_only
 def view_lots(request, auction_id=None):
-
-    
+    """Paginated, faceted lot browser for one auction or across all auctions"""
     if auction_id:
         auction = Auction.objects.get(id=auction_id)
         lots = auction.lots.all().select_related("lot_catagory")
     else:
         auction = None
         lots = Lot.objects.all().select_related("lot_catagory", "auction")
-    
+
     # Get all categories for the filter dropdown
     categories = Catagory.objects.all().order_by('name')
-    
+
     # Apply filters
     category_filter = request.GET.get('category')
     min_price = request.GET.get('min_price')
     max_price = request.GET.get('max_price')
     status_filter = request.GET.get('status')
-    
+    price_bucket = price_bucket_filter(request.GET.get('price'))
+    sort = request.GET.get('sort', 'newest')
+
+    try:
+        if min_price:
+            lots = lots.filter(current_bid__gte=Decimal(min_price))
+        if max_price:
+            lots = lots.filter(current_bid__lte=Decimal(max_price))
+    except InvalidOperation:
+        messages.error(request, "Invalid price range.")
+    # Facet links pick a bucket by key; bucket upper bounds are exclusive
+    if price_bucket is not None:
+        lots = lots.filter(price_bucket)
+
+    # Facet counts for the current filter, from one grouped query
+    facets = lot_facets(lots, category=category_filter, status=status_filter)
+    for category in categories:
+        category.lot_total = facets["categories"].get(category.id, 0)
+
     if category_filter:
         lots = lots.filter(lot_catagory_id=category_filter)
-    
-    if min_price:
-        lots = lots.filter(current_bid__gte=Decimal(min_price))
-    
-    if max_price:
-        lots = lots.filter(current_bid__lte=Decimal(max_price))
-    
+
     if status_filter:
         lots = lots.filter(status=status_filter)
 
+    lots = lots.annotate(item_total=Count('items')).order_by(*LOT_SORTS.get(sort, LOT_SORTS['newest']))
+    page_obj = Paginator(lots, LOTS_PER_PAGE).get_page(request.GET.get('page'))
+
     return render(
         request,
         "lots/view_lot.html",
         {
-            "lots": lots,
+            "lots": page_obj.object_list,
+            "page_obj": page_obj,
             "auction": auction,
             "categories": categories,
-            "counts": (
-                Lot.all_status_count() if hasattr(Lot, "all_status_count") else {}
-            ),
+            "facets": facets,
+            "counts": facets["statuses"],
+            "sort": sort,
         },
     )
 
@@ -326,111 +359,94 @@ def send_chat_message(request, lot_id):
         if not message:
             return JsonResponse({'success': False, 'message': 'Message cannot be empty'})
             
-        lot = Lot.objects.get(id=lot_id)
-        
-        chat = LotChatMessage.objects.create(
-            lot=lot,
-            user=request.user,
-            message=message
-        )
+        chat.post(lot_id, request.user, message)
         
         return JsonResponse({'success': True})
         
+    except chat.ChatRateLimited as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=429)
     except Exception as e:
         return JsonResponse({'success': False, 'message': str(e)})
 
 
 @login_required
-def get_lot_updates(request, lot_id):
-    lot = Lot.objects.get(id=lot_id)
+async def get_lot_updates(request, lot_id):
+    """Polling endpoint for the lot page (reports state only)"""
+    lot = await Lot.objects.select_related('auction', 'winning_bidder').aget(id=lot_id)
     
-    # Get latest bids (last 10)
-    latest_bids = Bid.objects.filter(lot=lot).select_related('user').order_by('-timestamp')[:10]
+    # Get latest bids (last 10), from the lot's recent-bids buffer
+    latest_bids = await sync_to_async(bid_history.recent)(lot.id, 10)
     bids_data = [{
-        'user': bid.user.username,
-        'amount': float(bid.amount),
-        'timestamp': bid.timestamp.strftime('%H:%M:%S'),
-        'is_winning': bid.is_winning
+        'user': bid['user'],
+        'amount': bid['amount'],
+        'timestamp': datetime.fromisoformat(bid['timestamp']).strftime('%H:%M:%S'),
+        'is_winning': bid['is_winning']
     } for bid in latest_bids]
     
-    # Get latest chat (last 20)
-    latest_chat = LotChatMessage.objects.filter(lot=lot).select_related('user').order_by('-timestamp')[:20]
+    # Get latest chat (last 20), from the lot's chat history buffer
+    latest_chat = await sync_to_async(chat.recent)(lot.id, 20)
     chat_data = [{
-        'user': msg.user.username,
-        'message': msg.message,
-        'timestamp': msg.timestamp.strftime('%H:%M:%S')
+        'user': msg['user'],
+        'message': msg['message'],
+        'timestamp': msg['timestamp'].strftime('%H:%M:%S')
     } for msg in latest_chat] # These are newest first
-    # Idle Timer Logic
-    idle_timeout = 15 # seconds before countdown starts
-    countdown_duration = 5 # seconds of countdown
     
-    countdown_val = None
-    winner = None
+    # End time / idle timer. The lot closer settles the lot; a later poll
+    # sees the result
+    closing, countdown_val = lot.closing_state()
     
-    if lot.status == 'active':
-        # 1. Check for Forced End Time (Timed Auction)
-        if lot.is_timed and lot.end_time and timezone.now() >= lot.end_time:
-             lot.close_lot()
-             lot.refresh_from_db()
-             winner = lot.winning_bidder.username if lot.winning_bidder else None
-
-        # 2. Check for Idle Timeout (if applicable)
-        elif lot.last_bid_time:
-            time_since_bid = (timezone.now() - lot.last_bid_time).total_seconds()
-            
-            # Check if we are in countdown phase
-            if time_since_bid > idle_timeout:
-                 remaining_countdown = (idle_timeout + countdown_duration) - time_since_bid
-                 
-                 if remaining_countdown <= 0:
-                     # Close the lot!
-                     lot.close_lot()
-                     lot.refresh_from_db()
-                     winner = lot.winning_bidder.username if lot.winning_bidder else None
-                 else:
-                     countdown_val = remaining_countdown
+    user = await request.auser()
+    balance = await Wallet.objects.filter(user_id=user.pk).values_list('balance', flat=True).afirst()
+    time_remaining = lot.get_time_remaining()
 
     return JsonResponse({
         'current_bid': float(lot.current_bid),
         'min_next_bid': float(lot.get_minimum_bid()),
-        'bid_count': lot.bids.count(),
+        'bid_count': lot.bid_count,
         'status': lot.status,
+        'closing': closing,
         'bids': bids_data,
         'chat': chat_data,
-        'time_remaining': lot.get_time_remaining().total_seconds() if lot.get_time_remaining() else None,
+        'time_remaining': time_remaining.total_seconds() if time_remaining else None,
         'countdown': countdown_val,
-        'winner': winner or (lot.winning_bidder.username if lot.winning_bidder else None),
-        'user_balance': float(request.user.wallet.balance) if hasattr(request.user, 'wallet') else 0.00
+        'idle_countdown': lot.idle_countdown_data(),
+        'winner': lot.winning_bidder.username if lot.winning_bidder else None,
+        'user_balance': float(balance) if balance is not None else 0.00
     })
 
 
 @require_GET
-def get_auction_updates(request):
+async def get_auction_updates(request):
     """API to get real-time updates for auctions"""
     auction_ids = request.GET.get('ids', '').split(',')
     auction_ids = [int(id) for id in auction_ids if id.isdigit()]
     
     data = {}
+    now = timezone.now()
+    status_labels = dict(Auction.STATUS_CHOICES)
     
     # 1. Individual Auction Statuses
     if auction_ids:
-        auctions = Auction.objects.filter(id__in=auction_ids)
-        for auction in auctions:
-            # Trigger status update based on time
-            if auction.status in ['scheduled', 'live', 'approved']:
-                 auction.update_auction_status()
-                 auction.save()
+        async for auction in Auction.objects.filter(id__in=auction_ids):
+            # Report the status the dates call for; saving it (and the lot
+            # and item updates that go with it) happens in the background
+            status = auction.status
+            if status in ['scheduled', 'live', 'approved']:
+                status = auction.scheduled_status(now)
+                if status != auction.status:
+                    enqueue_auction_status_refresh(auction.id)
 
             data[auction.id] = {
-                'status': auction.status,
-                'status_display': auction.get_status_display(),
-                'server_time': timezone.now().isoformat()
+                'status': status,
+                'status_display': status_labels.get(status, status),
+                'server_time': now.isoformat()
             }
             
     # 2. Global Counters (for Hero Section)
+    counts = await sync_to_async(cached_status_counts)(Auction.objects.all())
     data['global'] = {
-        'live_count': Auction.objects.filter(status='live').count(),
-        'total_count': Auction.objects.count()
+        'live_count': counts['live'],
+        'total_count': sum(counts.values())
     }
     
     return JsonResponse(data)
@@ -0,0 +1,118 @@
+"""
+Sequenced lot broadcasts with replay.
+
+Every event sent to a lot's group goes through ``publish``, which numbers it
+with the lot's next sequence number (a counter in the shared cache) and keeps
+a copy for ``LOT_REPLAY_TTL`` seconds. Each frame a client receives carries
+its ``seq``, and the ``lot_status`` snapshot carries the sequence number it
+is current as of.
+
+A client that lost its socket reconnects to ``ws/lot/<id>/?last_seq=N``. It
+gets the events after N replayed in order instead of a fresh snapshot, as
+long as there are at most ``LOT_REPLAY_SIZE`` of them and all are still
+kept. Otherwise it gets a ``lot_status`` snapshot as before.
+
+``timer_update`` is not numbered: the next one supersedes it and a snapshot
+already has the time remaining.
+
+Auction pages listen on ``ws/auction/<id>/`` instead. Once a bid or a close
+commits, ``lot_changed`` sends the lot's compact ``Lot.summary`` to the
+auction's group, and each connection forwards the lots its page has on
+screen.
+"""
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+
+from auction_list.models import Lot
+
+UNSEQUENCED = {"timer_update"}
+
+
+def _size():
+    return getattr(settings, "LOT_REPLAY_SIZE", 200)
+
+
+def _ttl():
+    return getattr(settings, "LOT_REPLAY_TTL", 300)
+
+
+def group(lot_id):
+    return f"lot_{lot_id}"
+
+
+def auction_group(auction_id):
+    return f"auction_{auction_id}"
+
+
+def _seq_key(lot_id):
+    return f"lot:seq:{lot_id}"
+
+
+def _event_key(lot_id, seq):
+    return f"lot:event:{lot_id}:{seq}"
+
+
+async def next_seq(lot_id):
+    key = _seq_key(lot_id)
+    await cache.aadd(key, 0, None)
+    try:
+        return await cache.aincr(key)
+    except ValueError:
+        # Evicted between add and incr. Clients ahead of the restarted
+        # counter are sent a snapshot (see ``missed``)
+        await cache.aset(key, 1, None)
+        return 1
+
+
+async def current_seq(lot_id):
+    return await cache.aget(_seq_key(lot_id), 0)
+
+
+async def publish(lot_id, event, channel_layer=None):
+    """Send ``event`` to the lot's group, numbered and kept for replay"""
+    if event["type"] not in UNSEQUENCED:
+        event = {**event, "seq": await next_seq(lot_id)}
+        await cache.aset(_event_key(lot_id, event["seq"]), event, _ttl())
+    channel_layer = channel_layer or get_channel_layer()
+    await channel_layer.group_send(group(lot_id), event)
+    return event
+
+
+async def missed(lot_id, last_seq):
+    """The lot's events after ``last_seq`` in order, or None if a snapshot is needed"""
+    current = await current_seq(lot_id)
+    if last_seq > current or current - last_seq > _size():
+        return None
+    keys = [_event_key(lot_id, seq) for seq in range(last_seq + 1, current + 1)]
+    if not keys:
+        return []
+    found = await cache.aget_many(keys)
+    # Expired, evicted, or numbered but not stored yet
+    if len(found) != len(keys):
+        return None
+    return [found[key] for key in keys]
+
+
+# ---------- AUCTION PAGES ----------
+def summaries(auction_id, lot_ids=None):
+    """Summaries of the auction's lots (or of ``lot_ids`` among them), in one query"""
+    lots = Lot.objects.filter(auction_id=auction_id).select_related("auction", "winning_bidder")
+    if lot_ids is not None:
+        lots = lots.filter(pk__in=lot_ids)
+    return [lot.summary() for lot in lots.order_by("lot_number")]
+
+
+def lot_changed(lot_id):
+    """Send the lot's summary to its auction's viewers (run after commit)"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        lot = Lot.objects.select_related("auction", "winning_bidder").get(pk=lot_id)
+        async_to_sync(channel_layer.group_send)(
+            auction_group(lot.auction_id), {"type": "lot_summary", "lot": lot.summary()}
+        )
+    except Exception as e:
+        print(f"[Broadcast] Summary of Lot #{lot_id} not sent: {e}")
@@ -1,20 +1,38 @@
 import json
 import asyncio
 import logging
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from django.utils import timezone
 from decimal import Decimal
+from AuctionHouse.metrics import InstrumentedConsumerMixin, counters
+from . import broadcast, history
+from .outbound import CLOSE_TOO_SLOW, OutboundQueue
 from .models import Bid, Wallet
 from auction_list.models import Lot
+from auction_list import chat
 
 logger = logging.getLogger(__name__)
 
 # Global tracker for active lot loops
 active_lot_loops = {}
 
-class BiddingConsumer(AsyncWebsocketConsumer):
+
+async def drain_lot_loops(timeout=10):
+    """Stop every lot tick loop in this process (worker shutdown)"""
+    tasks = list(active_lot_loops.values())
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.wait(tasks, timeout=timeout)
+    print(f"[Loop] Drained {len(tasks)} lot loop(s)")
+
+class BiddingConsumer(InstrumentedConsumerMixin, AsyncWebsocketConsumer):
     """WebSocket consumer for real-time bidding & chat"""
+
+    # Frames go through a bounded queue and a writer task (bids/outbound.py)
+    outbound = None
+    writer = None
     
     async def connect(self):
         """Handle WebSocket connection"""
@@ -24,7 +42,7 @@ class BiddingConsumer(AsyncWebsocketConsumer):
         if self.lot_id:
             self.room_group_name = f'lot_{self.lot_id}'
         elif self.auction_id:
-            self.room_group_name = f'auction_{self.auction_id}'
+            self.room_group_name = broadcast.auction_group(self.auction_id)
         else:
             await self.close()
             return
@@ -43,26 +61,69 @@ class BiddingConsumer(AsyncWebsocketConsumer):
             )
         
         await self.accept()
+        self.outbound = OutboundQueue()
+        self.writer = asyncio.create_task(self.write_outbound())
         
         # Only start loops and send initial data if it's a LOT connection
         if self.lot_id:
-            lot_data = await self.get_lot_data()
-            await self.send(text_data=json.dumps({
-                'type': 'lot_status',
-                'data': lot_data
-            }))
+            # A reconnecting client gets just the events it missed when it can
+            last_seq = self.resume_from()
+            events = await broadcast.missed(self.lot_id, last_seq) if last_seq is not None else None
+            if events is None:
+                await self.send_lot_status()
+            else:
+                for event in events:
+                    await getattr(self, event['type'])(event)
 
             if self.lot_id not in active_lot_loops:
                 active_lot_loops[self.lot_id] = asyncio.create_task(self.lot_tick_loop())
         elif self.auction_id:
-            # For auction-level connections, maybe send current auction status
-            await self.send(text_data=json.dumps({
-                'type': 'info',
-                'message': f'Connected to Auction #{self.auction_id}'
-            }))
+            # Auction pages get every lot's summary now, then updates for
+            # the lots they subscribe to (those on screen)
+            self.subscribed = set()
+            summaries = await database_sync_to_async(broadcast.summaries)(self.auction_id)
+            self.auction_lots = {summary['id'] for summary in summaries}
+            await self.send_payload({'type': 'lot_summaries', 'lots': summaries})
     
+    def resume_from(self):
+        """``last_seq`` from the connection's query string, if any"""
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        try:
+            return max(int(query['last_seq'][0]), 0)
+        except (KeyError, ValueError):
+            return None
+
+    async def send_lot_status(self):
+        # Read the sequence number first: events after it may already be
+        # reflected in the snapshot, never the other way round
+        seq = await broadcast.current_seq(self.lot_id)
+        lot_data = await self.get_lot_data()
+        await self.send_payload({'type': 'lot_status', 'data': lot_data, 'seq': seq})
+
+    async def send_payload(self, payload, key=None):
+        """Queue a frame for the writer; close the connection if it is too far behind"""
+        if self.outbound is None:
+            if self.writer is None:  # Not accepted yet
+                await super().send_payload(payload)
+            return
+        if not self.outbound.put(payload['type'], self.encode_payload(payload), key):
+            counters.inc('websocket_slow_disconnects_total', consumer=type(self).__name__)
+            print(f"[WS] Closing {self.room_group_name} connection: {len(self.outbound)} frames behind")
+            await self.stop_writer()
+            await self.close(code=CLOSE_TOO_SLOW)
+
+    async def write_outbound(self):
+        while True:
+            await self.send(text_data=await self.outbound.get())
+
+    async def stop_writer(self):
+        self.outbound = None
+        if self.writer is not None and self.writer is not asyncio.current_task():
+            self.writer.cancel()
+
     async def disconnect(self, close_code):
         """Handle WebSocket disconnection"""
+        await self.stop_writer()
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
@@ -84,10 +145,11 @@ class BiddingConsumer(AsyncWebsocketConsumer):
             elif message_type == 'send_chat':
                 await self.handle_send_chat(data)
             elif message_type == 'request_status' and self.lot_id:
-                lot_data = await self.get_lot_data()
-                await self.send(text_data=json.dumps({'type': 'lot_status', 'data': lot_data}))
+                await self.send_lot_status()
+            elif message_type in ('subscribe', 'unsubscribe') and self.auction_id:
+                await self.handle_subscription(message_type, data.get('lots') or [])
         except Exception as e:
-            await self.send(text_data=json.dumps({'type': 'error', 'message': str(e)}))
+            await self.send_payload({'type': 'error', 'message': str(e)})
     
     async def handle_place_bid(self, data):
         """Handle bid placement"""
@@ -111,12 +173,26 @@ class BiddingConsumer(AsyncWebsocketConsumer):
                     {'type': 'wallet_update', 'balance': result['prev_winner_balance']}
                 )
             # 3. Broadcast bid
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {'type': 'bid_update', 'bid': result['bid_data']}
+            await broadcast.publish(
+                self.lot_id,
+                {'type': 'bid_update', 'bid': result['bid_data']},
+                self.channel_layer
             )
         else:
-            await self.send(text_data=json.dumps({'type': 'error', 'message': result['error']}))
+            await self.send_payload({'type': 'error', 'message': result['error']})
+
+    async def handle_subscription(self, message_type, lot_ids):
+        """Follow (or stop following) lots of this auction"""
+        lot_ids = {int(lot_id) for lot_id in lot_ids} & self.auction_lots
+        if message_type == 'unsubscribe':
+            self.subscribed -= lot_ids
+            return
+        new = lot_ids - self.subscribed
+        self.subscribed |= new
+        if new:
+            # They may have changed while off screen
+            summaries = await database_sync_to_async(broadcast.summaries)(self.auction_id, new)
+            await self.send_payload({'type': 'lot_summaries', 'lots': summaries})
 
     async def handle_send_chat(self, data):
         """Handle chat message"""
@@ -127,44 +203,50 @@ class BiddingConsumer(AsyncWebsocketConsumer):
         message_text = data.get('message', '').strip()
         if not message_text: return
             
-        await self.save_chat_message(user, message_text)
+        try:
+            entry = await database_sync_to_async(chat.post)(self.lot_id, user, message_text)
+        except chat.ChatRateLimited as e:
+            await self.send_payload({'type': 'error', 'message': str(e)})
+            return
         
-        await self.channel_layer.group_send(
-            self.room_group_name,
+        await broadcast.publish(
+            self.lot_id,
             {
                 'type': 'chat_message',
                 'message': {
-                    'user': user.username,
-                    'message': message_text,
-                    'timestamp': timezone.now().isoformat()
+                    'user': entry['user'],
+                    'message': entry['message'],
+                    'timestamp': entry['timestamp'].isoformat()
                 }
-            }
+            },
+            self.channel_layer
         )
 
-    @database_sync_to_async
-    def save_chat_message(self, user, message_text):
-        from auction_list.models import LotChatMessage
-        lot = Lot.objects.get(id=self.lot_id)
-        return LotChatMessage.objects.create(lot=lot, user=user, message=message_text)
-
-    # Broadcast handlers
+    # Broadcast handlers (lot events carry their sequence number, see bids/broadcast.py)
     async def chat_message(self, event):
-        await self.send(text_data=json.dumps({'type': 'chat_message', 'message': event['message']}))
+        await self.send_payload({'type': 'chat_message', 'message': event['message'], 'seq': event.get('seq')})
     
     async def bid_update(self, event):
-        await self.send(text_data=json.dumps({'type': 'bid_update', 'bid': event['bid']}))
+        await self.send_payload({'type': 'bid_update', 'bid': event['bid'], 'seq': event.get('seq')})
 
     async def wallet_update(self, event):
-        await self.send(text_data=json.dumps({'type': 'wallet_update', 'balance': event['balance']}))
+        await self.send_payload({'type': 'wallet_update', 'balance': event['balance']})
     
     async def timer_update(self, event):
-        await self.send(text_data=json.dumps({'type': 'timer_update', 'data': event['data']}))
+        await self.send_payload({'type': 'timer_update', 'data': event['data']})
     
+    async def idle_countdown(self, event):
+        await self.send_payload({'type': 'idle_countdown', 'data': event['data'], 'seq': event.get('seq')})
+
+    async def lot_summary(self, event):
+        if event['lot']['id'] in getattr(self, 'subscribed', ()):
+            await self.send_payload({'type': 'lot_summary', 'lot': event['lot']}, key=event['lot']['id'])
+
     async def auction_ended(self, event):
-        await self.send(text_data=json.dumps({'type': 'auction_ended', 'data': event['data']}))
+        await self.send_payload({'type': 'auction_ended', 'data': event['data'], 'seq': event.get('seq')})
 
     async def lot_tick_loop(self):
-        """Infinite background loop for lot lifecycle management"""
+        """Timer broadcasts for an active lot"""
         print(f"[Loop] Starting tick loop for Lot {self.lot_id}")
         try:
             while True:
@@ -177,11 +259,8 @@ class BiddingConsumer(AsyncWebsocketConsumer):
                     print(f"[Loop] Lot {self.lot_id} is no longer active ({lot.status}). Stopping.")
                     break
                 
-                # Timed Auction End Check
-                if lot.is_timed and lot.is_auction_ended():
-                    print(f"[Loop] Lot {self.lot_id} timed auction ended.")
-                    await self.close_and_broadcast(lot)
-                    break
+                # Closing (and the auction_ended broadcast) is the lot
+                # closer's job; this loop stops once it has happened
 
                 # Time Remaining Broadcast for timed auctions
                 if lot.is_timed:
@@ -190,25 +269,27 @@ class BiddingConsumer(AsyncWebsocketConsumer):
                         time_remaining_seconds = rem.total_seconds()
                         
                         # Broadcast regular timer update
-                        await self.channel_layer.group_send(
-                            self.room_group_name, 
+                        await broadcast.publish(
+                            self.lot_id,
                             {
                                 'type': 'timer_update', 
                                 'data': {'time_remaining': time_remaining_seconds}
-                            }
+                            },
+                            self.channel_layer
                         )
                         
                         # Broadcast countdown when within 10 seconds
                         if time_remaining_seconds <= 10 and time_remaining_seconds > 0:
-                            await self.channel_layer.group_send(
-                                self.room_group_name,
+                            await broadcast.publish(
+                                self.lot_id,
                                 {
                                     'type': 'timer_update',
                                     'data': {
                                         'time_remaining': time_remaining_seconds,
                                         'countdown': time_remaining_seconds
                                     }
-                                }
+                                },
+                                self.channel_layer
                             )
 
         except Exception as e:
@@ -217,58 +298,6 @@ class BiddingConsumer(AsyncWebsocketConsumer):
             if self.lot_id in active_lot_loops:
                 del active_lot_loops[self.lot_id]
 
-    async def close_and_broadcast(self, lot):
-        """Safely close lot and notify users"""
-        try:
-            success = await database_sync_to_async(lot.close_lot)()
-            if success:
-                # Refresh to get winner details
-                lot = await database_sync_to_async(Lot.objects.select_related('winning_bidder').get)(id=self.lot_id)
-                print(f"[Loop] Lot {self.lot_id} closed. Status: {lot.status}, Winner: {lot.winning_bidder}")
-                
-                # Generate invoice and send email if there's a winner
-                if lot.winning_bidder:
-                    await self.send_winner_notification(lot)
-                    print(f"[Loop] Lot SOLD to {lot.winning_bidder.username} for ₹{lot.current_bid}")
-                else:
-                    print(f"[Loop] Lot closed with NO bids - marked as {lot.status}")
-                
-                # ALWAYS broadcast auction_ended (whether winner exists or not)
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        'type': 'auction_ended',
-                        'data': {
-                            'winner': lot.winning_bidder.username if lot.winning_bidder else 'No Winner',
-                            'winning_bid': float(lot.current_bid),
-                            'status': lot.status  # Include status for debugging
-                        }
-                    }
-                )
-                print(f"[Loop] Broadcasted auction_ended message to all clients")
-        except Exception as e:
-            print(f"[Loop] Error closing lot {self.lot_id}: {e}")
-            import traceback
-            traceback.print_exc()
-    
-    async def send_winner_notification(self, lot):
-        """Generate invoice and send winner email"""
-        try:
-            from .invoice_generator import generate_invoice
-            from .email_utils import send_winner_email
-            
-            # Generate invoice
-            invoice_path = await database_sync_to_async(generate_invoice)(lot, lot.winning_bidder)
-            
-            # Send email with invoice
-            if invoice_path:
-                await database_sync_to_async(send_winner_email)(lot, lot.winning_bidder, invoice_path)
-                print(f"[Email] Winner notification sent to {lot.winning_bidder.email}")
-            else:
-                print(f"[Email] Failed to generate invoice for lot {self.lot_id}")
-        except Exception as e:
-            print(f"[Email] Error sending winner notification: {e}")
-
     @database_sync_to_async
     def place_bid(self, user_id, bid_amount):
         from django.contrib.auth.models import User
@@ -311,14 +340,12 @@ class BiddingConsumer(AsyncWebsocketConsumer):
 
     @database_sync_to_async
     def get_lot_data(self):
-        from auction_list.models import LotChatMessage
         try:
             lot = Lot.objects.select_related('winning_bidder').get(id=self.lot_id)
-            recent_bids = Bid.objects.filter(lot=lot).select_related('user').order_by('-timestamp')[:15]
-            recent_chats = LotChatMessage.objects.filter(lot=lot).select_related('user').order_by('-timestamp')[:15]
+            bids_list = history.recent(lot.id, 15)
+            recent_chats = chat.recent(lot.id, 15)
             
-            bids_list = [{'user': b.user.username, 'amount': float(b.amount), 'timestamp': b.timestamp.isoformat(), 'is_winning': b.is_winning} for b in recent_bids]
-            chats_list = [{'user': c.user.username, 'message': c.message, 'timestamp': c.timestamp.isoformat()} for c in recent_chats]
+            chats_list = [{'user': c['user'], 'message': c['message'], 'timestamp': c['timestamp'].isoformat()} for c in recent_chats]
             
             time_rem = lot.get_time_remaining().total_seconds() if lot.get_time_remaining() else None
             
@@ -4,6 +4,7 @@ Email utility for sending winner notifications with invoices
 from django.core.mail import EmailMessage
 from django.conf import settings
 from django.template.loader import render_to_string
+from AuctionHouse.mail import send_messages
 import os
 
 
@@ -61,8 +62,8 @@ Auction House Team
         if invoice_path and os.path.exists(invoice_path):
             email.attach_file(invoice_path)
         
-        # Send email
-        email.send(fail_silently=False)
+        # Send email over the pooled SMTP connection
+        send_messages([email])
         return True
         
     except Exception as e:
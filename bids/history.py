@@ -0,0 +1,78 @@
+"""
+Recent bids per lot.
+
+The websocket connect snapshot, both polling endpoints and the lot page
+each read a lot's latest bids. Each read used to be an ORDER BY timestamp
+query joined to User, so a reconnect storm after a deploy ran the same
+query once per client. They now read a ring buffer of the lot's last
+``BID_HISTORY_SIZE`` bids, kept in the shared cache as ready-to-send frames
+(newest first):
+
+    {"id": 12, "user": "alice", "amount": 1500.0,
+     "timestamp": "2026-01-02T10:00:00+00:00", "is_winning": True}
+
+``Bid.save`` rebuilds the buffer once the accepting transaction commits
+(one indexed query per bid), so readers only touch the database on a cold
+cache. Deleting a bid drops the buffer.
+"""
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Bid
+
+
+def _size():
+    return getattr(settings, "BID_HISTORY_SIZE", 20)
+
+
+def _timeout():
+    return getattr(settings, "BID_HISTORY_TIMEOUT", 3600)
+
+
+def _key(lot_id):
+    return f"bids:recent:{lot_id}"
+
+
+def _load(lot_id):
+    rows = (
+        Bid.objects.filter(lot_id=lot_id)
+        .order_by("-timestamp", "-pk")
+        .values_list("pk", "user__username", "amount", "timestamp", "is_winning")[: _size()]
+    )
+    return [
+        {"id": pk, "user": username, "amount": float(amount), "timestamp": timestamp.isoformat(), "is_winning": winning}
+        for pk, username, amount, timestamp, winning in rows
+    ]
+
+
+def refresh(lot_id):
+    """Re-read the lot's buffer from the database (after a bid is accepted)"""
+    frames = _load(lot_id)
+    cached = cache.get(_key(lot_id))
+    # Another worker may have stored a newer snapshot in the meantime
+    if cached and frames and cached[0]["id"] > frames[0]["id"]:
+        return cached
+    cache.set(_key(lot_id), frames, _timeout())
+    return frames
+
+
+def forget(lot_id):
+    cache.delete(_key(lot_id))
+
+
+def recent(lot_id, limit=None):
+    """The lot's last ``limit`` bid frames, newest first"""
+    frames = cache.get(_key(lot_id))
+    if frames is None:
+        frames = refresh(lot_id)
+    return frames[:limit] if limit else list(frames)
+
+
+def for_display(lot_id, limit=None):
+    """Frames with ``timestamp`` as a datetime, for templates"""
+    return [
+        {**entry, "timestamp": datetime.fromisoformat(entry["timestamp"])}
+        for entry in recent(lot_id, limit)
+    ]
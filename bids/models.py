@@ -1,9 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
-from django.utils import timezone
 from decimal import Decimal
 from django.db import transaction
+from django.db.models import F
 
 
 class Wallet(models.Model):
@@ -186,9 +186,9 @@ class Bid(models.Model):
                 # 4. Update lot current bid and stats
                 self.lot.current_bid = self.amount
                 self.lot.winning_bidder = self.user
-                self.lot.last_bid_time = timezone.now()
-                self.lot.idle_timer_started = False  # Reset idle timer
-                self.lot.save(update_fields=['current_bid', 'last_bid_time', 'idle_timer_started', 'winning_bidder'])
+                self.lot.arm_idle_timer()  # Reset idle timer
+                self.lot.save(update_fields=['current_bid', 'winning_bidder', *self.lot.IDLE_FIELDS])
+                type(self.lot).objects.filter(pk=self.lot.pk).update(bid_count=F('bid_count') + 1)
             
                 # 5. Deduct funds from wallet
                 # We do this AFTER invalidating previous bid to ensure 'Top-Up' logic uses correct state
@@ -200,6 +200,16 @@ class Bid(models.Model):
 
         super().save(*args, **kwargs)
         
+        # Keep the lot's recent-bids buffer in step (bids/history.py) and
+        # tell auction page viewers (bids/broadcast.py)
+        from . import broadcast, history
+        if is_new:
+            lot_id = self.lot_id
+            transaction.on_commit(lambda: history.refresh(lot_id))
+            transaction.on_commit(lambda: broadcast.lot_changed(lot_id))
+        else:
+            history.forget(self.lot_id)
+        
         if is_new and deduction_amount > 0:
             # Link transaction (Best effort lookup)
             latest_txn = Transaction.objects.filter(wallet=self.user.wallet).order_by('-timestamp').first()
@@ -0,0 +1,80 @@
+"""
+Per-connection outbound queues for the bidding websocket.
+
+A consumer used to write each frame to its socket from the handler that
+produced it. One slow client therefore stalled its own handlers, its
+channel-layer inbox filled up, and the layer dropped whatever came next
+without a trace. Now handlers only put encoded frames on the connection's
+``OutboundQueue``, and a writer task per connection sends them:
+
+* ``timer_update`` and ``lot_status`` are coalesced: a newer one replaces
+  the one still waiting, in place (``lot_summary`` likewise, per lot);
+* when the queue holds ``WEBSOCKET_QUEUE_SIZE`` frames, the oldest frame
+  that may be dropped makes room;
+* ``bid_update`` and ``auction_ended`` are never dropped. A connection
+  whose queue is full of them is too far behind and is closed. The client
+  reconnects and resumes from its last sequence number (bids/broadcast.py).
+
+Coalesced and dropped frames and slow-consumer disconnects are counted in
+``AuctionHouse.metrics.counters``.
+"""
+import asyncio
+from collections import deque
+
+from django.conf import settings
+
+from AuctionHouse.metrics import counters
+
+COALESCED = {"timer_update", "lot_status", "lot_summary"}
+ALWAYS_DELIVER = {"bid_update", "auction_ended"}
+
+# Close code for connections closed for falling behind
+CLOSE_TOO_SLOW = 4008
+
+
+class OutboundQueue:
+    """Bounded queue of (frame type, coalescing key, encoded frame) waiting for one socket"""
+
+    def __init__(self, maxsize=None):
+        self.maxsize = maxsize or getattr(settings, "WEBSOCKET_QUEUE_SIZE", 256)
+        self._frames = deque()
+        self._ready = asyncio.Event()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def _drop(self, kind, reason):
+        counters.inc("websocket_frames_dropped_total", type=kind, reason=reason)
+
+    def put(self, kind, text, key=None):
+        """Queue a frame; False when the connection is too far behind to keep.
+
+        Coalesced frames only replace a waiting one with the same ``key``.
+        """
+        if kind in COALESCED:
+            for i, (pending, pending_key, _) in enumerate(self._frames):
+                if (pending, pending_key) == (kind, key):
+                    self._frames[i] = (kind, key, text)
+                    self._drop(kind, "coalesced")
+                    return True
+
+        if len(self._frames) >= self.maxsize:
+            victim = next((i for i, (pending, _, _) in enumerate(self._frames) if pending not in ALWAYS_DELIVER), None)
+            if victim is not None:
+                self._drop(self._frames[victim][0], "full")
+                del self._frames[victim]
+            elif kind in ALWAYS_DELIVER:
+                return False
+            else:
+                self._drop(kind, "full")
+                return True
+
+        self._frames.append((kind, key, text))
+        self._ready.set()
+        return True
+
+    async def get(self):
+        while not self._frames:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._frames.popleft()[2]
@@ -1,7 +1,9 @@
-from django.db.models.signals import post_save
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
 from django.contrib.auth.models import User
 from django.dispatch import receiver
-from .models import Wallet
+from . import history
+from .models import Wallet, Bid
 
 
 @receiver(post_save, sender=User)
@@ -16,3 +18,16 @@ def save_user_wallet(sender, instance, **kwargs):
     """Save wallet when user is saved"""
     if hasattr(instance, 'wallet'):
         instance.wallet.save()
+
+
+@receiver(post_delete, sender=Bid)
+def decrement_lot_bid_count(sender, instance, **kwargs):
+    """Keep Lot.bid_count in step when a bid is removed"""
+    from auction_list.models import Lot
+    Lot.objects.filter(pk=instance.lot_id, bid_count__gt=0).update(bid_count=F('bid_count') - 1)
+
+
+@receiver(post_delete, sender=Bid)
+def forget_recent_bids(sender, instance, **kwargs):
+    """Drop the lot's recent-bids buffer; the next reader rebuilds it"""
+    history.forget(instance.lot_id)
@@ -1,3 +1,208 @@
-from django.test import TestCase
+import asyncio
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from AuctionHouse.metrics import counters
+from AuctionHouse.testing import LotFixtureMixin
+from auction_list.models import Lot
+
+from . import broadcast, history
+from .consumers import BiddingConsumer, drain_lot_loops
+from .models import Bid, Wallet
+from .outbound import CLOSE_TOO_SLOW, OutboundQueue
+from .routing import websocket_urlpatterns
+
+
+class RecentBidsTests(LotFixtureMixin, TestCase):
+    username = "alice"
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Wallet.objects.update(balance=10000)
+        cls.users = [User.objects.get(pk=cls.user.pk), cls.make_user("bob", balance=10000)]
+
+    def setUp(self):
+        cache.clear()
+
+    def bid(self, user, amount):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Bid.objects.create(lot=Lot.objects.get(pk=self.lot.pk), user=User.objects.get(pk=user.pk), amount=amount)
+
+    def test_buffer_follows_accepted_bids(self):
+        self.bid(self.users[0], 100)
+        second = self.bid(self.users[1], 200)
+        with self.assertNumQueries(0):
+            frames = history.recent(self.lot.pk)
+        self.assertEqual([(f["user"], f["amount"], f["is_winning"]) for f in frames], [("bob", 200.0, True), ("alice", 100.0, False)])
+        self.assertEqual(frames[0]["id"], second.pk)
+        self.assertEqual(frames[0]["timestamp"], second.timestamp.isoformat())
+
+    def test_polling_and_page_share_the_buffer(self):
+        self.bid(self.users[0], 100)
+        data = self.client.get(reverse("get_bid_updates", args=[self.lot.pk])).json()
+        self.assertEqual(data["bids"], history.recent(self.lot.pk))
+        self.assertEqual([bid["user"] for bid in Lot.objects.get(pk=self.lot.pk).recent_bids], ["alice"])
+
+    def test_deleting_a_bid_drops_the_buffer(self):
+        bid = self.bid(self.users[0], 100)
+        bid.delete()
+        self.assertEqual(history.recent(self.lot.pk), [])
+
+
+class LotSocketTests(LotFixtureMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def publish(self, *events):
+        for event in events:
+            async_to_sync(broadcast.publish)(self.lot.pk, event)
+
+    def chat(self, n):
+        return {"type": "chat_message", "message": {"user": "alice", "message": f"hi {n}", "timestamp": ""}}
+
+    async def connect(self, query=""):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f"/ws/lot/{self.lot.pk}/{query}")
+        communicator.scope["user"] = AnonymousUser()
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    def test_events_are_numbered_and_replayed(self):
+        self.publish(self.chat(1), {"type": "timer_update", "data": {}}, self.chat(2), self.chat(3))
+        missed = async_to_sync(broadcast.missed)(self.lot.pk, 1)
+        self.assertEqual([(e["seq"], e["message"]["message"]) for e in missed], [(2, "hi 2"), (3, "hi 3")])
+        self.assertEqual(async_to_sync(broadcast.missed)(self.lot.pk, 3), [])
+
+    @override_settings(LOT_REPLAY_SIZE=2)
+    def test_large_or_impossible_gaps_need_a_snapshot(self):
+        self.publish(self.chat(1), self.chat(2), self.chat(3))
+        self.assertIsNone(async_to_sync(broadcast.missed)(self.lot.pk, 0))
+        self.assertIsNone(async_to_sync(broadcast.missed)(self.lot.pk, 7))
+        cache.delete(broadcast._event_key(self.lot.pk, 3))
+        self.assertIsNone(async_to_sync(broadcast.missed)(self.lot.pk, 2))
+
+    def test_reconnect_resumes_from_last_seq(self):
+        self.publish(self.chat(1), self.chat(2))
+
+        async def scenario():
+            fresh = await self.connect()
+            status = await fresh.receive_json_from()
+            await fresh.disconnect()
+
+            resumed = await self.connect("?last_seq=1")
+            replayed = await resumed.receive_json_from()
+            nothing_else = await resumed.receive_nothing()
+            await resumed.disconnect()
+            await drain_lot_loops()
+            return status, replayed, nothing_else
+
+        status, replayed, nothing_else = async_to_sync(scenario)()
+        self.assertEqual((status["type"], status["seq"]), ("lot_status", 2))
+        self.assertEqual((replayed["type"], replayed["seq"], replayed["message"]["message"]), ("chat_message", 2, "hi 2"))
+        self.assertTrue(nothing_else)
+
+    @override_settings(WEBSOCKET_QUEUE_SIZE=3)
+    @mock.patch.object(BiddingConsumer, "write_outbound", lambda self: asyncio.Event().wait())
+    def test_slow_client_is_disconnected(self):
+        counters.reset()
+        bid = {"type": "bid_update", "bid": {"user": "alice", "amount": 100.0}}
+
+        async def scenario():
+            communicator = await self.connect()
+            for _ in range(4):
+                await broadcast.publish(self.lot.pk, bid)
+            closed = await communicator.receive_output()
+            await communicator.wait()
+            await drain_lot_loops()
+            return closed
+
+        self.assertEqual(async_to_sync(scenario)(), {"type": "websocket.close", "code": CLOSE_TOO_SLOW})
+        self.assertEqual(counters.get("websocket_slow_disconnects_total", consumer="BiddingConsumer"), 1)
+
+
+class AuctionSocketTests(LotFixtureMixin, TestCase):
+    username = "alice"
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Wallet.objects.update(balance=10000)
+        cls.lots = [cls.lot, cls.make_lot(2)]
+
+    def test_streams_summaries_of_subscribed_lots(self):
+        first, second = (lot.pk for lot in self.lots)
+
+        async def scenario():
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f"/ws/auction/{self.auction.pk}/")
+            communicator.scope["user"] = AnonymousUser()
+            await communicator.connect()
+            initial = await communicator.receive_json_from()
+            await communicator.send_json_to({"type": "subscribe", "lots": [first, 999]})
+            subscribed = await communicator.receive_json_from()
+
+            for lot_id in (second, first):
+                await database_sync_to_async(broadcast.lot_changed)(lot_id)
+            update = await communicator.receive_json_from()
+            nothing_else = await communicator.receive_nothing()
+            await communicator.disconnect()
+            return initial, subscribed, update, nothing_else
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Bid.objects.create(lot=self.lots[0], user=User.objects.get(pk=self.user.pk), amount=250)
+        initial, subscribed, update, nothing_else = async_to_sync(scenario)()
+
+        self.assertEqual(initial["type"], "lot_summaries")
+        self.assertEqual([lot["id"] for lot in initial["lots"]], [first, second])
+        self.assertEqual([lot["id"] for lot in subscribed["lots"]], [first])
+        self.assertEqual(update["type"], "lot_summary")
+        self.assertEqual(
+            {k: update["lot"][k] for k in ("id", "status", "current_bid", "leader", "bid_count")},
+            {"id": first, "status": "active", "current_bid": 250.0, "leader": "alice", "bid_count": 1},
+        )
+        self.assertTrue(nothing_else)
+
+
+class OutboundQueueTests(SimpleTestCase):
+    def setUp(self):
+        counters.reset()
+
+    def drain(self, queue):
+        return [async_to_sync(queue.get)() for _ in range(len(queue))]
+
+    def test_latest_timer_replaces_the_waiting_one(self):
+        queue = OutboundQueue(maxsize=10)
+        for frame in (("timer_update", "t1"), ("bid_update", "b1"), ("timer_update", "t2")):
+            self.assertTrue(queue.put(*frame))
+        self.assertEqual(self.drain(queue), ["t2", "b1"])
+        self.assertEqual(counters.get("websocket_frames_dropped_total", type="timer_update", reason="coalesced"), 1)
+
+    def test_lot_summaries_coalesce_per_lot(self):
+        queue = OutboundQueue(maxsize=10)
+        for key, text in ((1, "a1"), (2, "b1"), (1, "a2")):
+            queue.put("lot_summary", text, key)
+        self.assertEqual(self.drain(queue), ["a2", "b1"])
+
+    def test_full_queue_drops_the_oldest_droppable_frame(self):
+        queue = OutboundQueue(maxsize=2)
+        queue.put("chat_message", "c1")
+        queue.put("bid_update", "b1")
+        self.assertTrue(queue.put("bid_update", "b2"))
+        self.assertEqual(self.drain(queue), ["b1", "b2"])
+        self.assertEqual(counters.get("websocket_frames_dropped_total", type="chat_message", reason="full"), 1)
+
+    def test_queue_full_of_bids_is_too_far_behind(self):
+        queue = OutboundQueue(maxsize=2)
+        queue.put("bid_update", "b1")
+        queue.put("bid_update", "b2")
+        self.assertTrue(queue.put("chat_message", "c1"))
+        self.assertFalse(queue.put("auction_ended", "e1"))
+        self.assertEqual(self.drain(queue), ["b1", "b2"])
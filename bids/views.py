@@ -1,11 +1,14 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from AuctionHouse.metrics import JsonResponse
 from django.db.models import Q
 from decimal import Decimal
+from asgiref.sync import sync_to_async
+from . import history
 from .models import Wallet, Bid, Transaction
 from auction_list.models import Lot, Invoice
+from AuctionHouse.db import read_only
 
 
 @login_required
@@ -47,6 +50,7 @@ def add_funds(request):
 
 
 @login_required
+@read_only
 def my_bids(request):
     """Display user's bid history"""
     bids = Bid.objects.filter(user=request.user).select_related('lot', 'lot__auction').order_by('-timestamp')
@@ -63,6 +67,7 @@ def my_bids(request):
 
 
 @login_required
+@read_only
 def won_lots(request):
     """Display lots won by user"""
     won_lots = Lot.objects.filter(winning_bidder=request.user).select_related('auction').order_by('-updated_at')
@@ -128,33 +133,18 @@ def place_bid_api(request, lot_id):
         return JsonResponse({'success': False, 'error': str(e)})
 
 
-def get_bid_updates(request, lot_id):
+async def get_bid_updates(request, lot_id):
     """API endpoint for polling bid updates"""
     try:
-        lot = Lot.objects.get(id=lot_id)
+        lot = await Lot.objects.select_related('auction', 'winning_bidder').aget(id=lot_id)
         
-        # Auto-close logic
         time_remaining = lot.get_time_remaining()
         remaining_seconds = time_remaining.total_seconds() if time_remaining else 0
         
-        # If time is up and lot is still active, close it
-        if lot.status == 'active' and (lot.is_auction_ended() or (time_remaining is not None and remaining_seconds <= 0)):
-            lot.close_lot()
-            lot.refresh_from_db()
-            
-        # Serialize recent bids
-        recent_bids = lot.recent_bids
-        bids_data = []
-        for bid in recent_bids:
-            bids_data.append({
-                'user': bid.user.username,
-                'amount': float(bid.amount),
-                'timestamp': bid.timestamp.isoformat(),
-                'is_winning': bid.is_winning
-            })
-            
-        # Serialize chats (optional, if we want to include chat in polling)
-        # chats_data = ... 
+        # Closing is left to the lot closer; a later poll picks up the result
+        
+        # Recent bids come pre-serialized from the lot's buffer
+        bids_data = await sync_to_async(history.recent)(lot.id)
         
         response_data = {
             'current_bid': float(lot.current_bid),
@@ -162,7 +152,8 @@ def get_bid_updates(request, lot_id):
             'time_remaining': remaining_seconds,
             'status': lot.status,
             'bids': bids_data,
-            'bid_count': lot.bids.count(),
+            'bid_count': lot.bid_count,
+            'idle_countdown': lot.idle_countdown_data(),
         }
         
         if lot.status == 'sold' and lot.winning_bidder:
@@ -179,6 +170,7 @@ def get_bid_updates(request, lot_id):
 
 
 @login_required
+@read_only
 def my_invoices(request):
     """List all invoices for the current user"""
     invoices = Invoice.objects.filter(user=request.user).select_related('lot', 'lot__auction').order_by('-issued_at')
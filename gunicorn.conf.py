@@ -0,0 +1,32 @@
+"""
+Gunicorn settings for serving AuctionHouse.asgi (HTTP and websockets) with
+Uvicorn workers. Used by the Procfile:
+
+    gunicorn AuctionHouse.asgi:application -c gunicorn.conf.py
+
+Every worker runs its own lot timers, so with more than one worker the
+channel layer must be shared (set REDIS_URL).
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Async workers each hold many sockets; one per core is enough
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+
+# Websockets are long-lived, so no request timeout for idle ones and no
+# max_requests recycling (it would drop every connected bidder)
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+keepalive = 5
+# Time a worker gets on SIGTERM to run the ASGI lifespan shutdown, which
+# stops the lot timers, before it is killed
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+
+accesslog = "-"
+errorlog = "-"
+# X-Forwarded-For is trusted only from these addresses; it becomes
+# REMOTE_ADDR, which METRICS_ALLOWED_IPS checks. Set FORWARDED_ALLOW_IPS to
+# the reverse proxy's address (never "*" on a directly reachable port)
+forwarded_allow_ips = os.environ.get("FORWARDED_ALLOW_IPS", "127.0.0.1")
@@ -1,24 +1,34 @@
-document.addEventListener("DOMContentLoaded", function () {
-    const categorySelect = document.getElementById("id_category");
+'use strict';
+{
+    // Item picker for the lot form: select2 pages items in from the admin
+    // item autocomplete endpoint, limited to the lot's category.
+    const $ = django.jQuery;
 
-    if (!categorySelect) return;
+    function initItemPicker(element) {
+        const categorySelect = document.getElementById(element.dataset.categoryField);
 
-    categorySelect.addEventListener("change", function () {
-        const categoryId = this.value;
-        if (!categoryId) return;
+        $(element).select2({
+            ajax: {
+                data: (params) => ({
+                    term: params.term,
+                    page: params.page,
+                    status: element.dataset.status,
+                    category: categorySelect ? categorySelect.value : ""
+                })
+            }
+        });
 
-        fetch(`/admin/get-items-by-category/?category_id=${categoryId}`)
-            .then(res => res.json())
-            .then(data => {
-                const selectBox = document.getElementById("id_items_from");
-                selectBox.innerHTML = "";
-
-                data.forEach(item => {
-                    const opt = document.createElement("option");
-                    opt.value = item.id;
-                    opt.textContent = item.text;
-                    selectBox.appendChild(opt);
-                });
+        if (categorySelect) {
+            // Selected items from another category would fail validation
+            categorySelect.addEventListener("change", () => {
+                $(element).val(null).trigger("change");
             });
+        }
+    }
+
+    $(function () {
+        $(".item-autocomplete").not("[name*=__prefix__]").each(function () {
+            initItemPicker(this);
+        });
     });
-});
+}